@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prompt-aware asyncio engine for test_pinyin
+Waits for each choose: prompt before sending the next selection and checks
+every generated_sentence: line as soon as it arrives, so a desynchronized
+case fails immediately instead of burning the whole timeout. Many sessions
+are driven concurrently from one event loop.
+"""
+
+import asyncio
+import os
+import shutil
+import time
+from datetime import datetime
+
+from parallel_runner import prepare_worker_dir
+from pinyin_session import PREFIX_PROMPT, PINYIN_PROMPT, CHOOSE_PROMPT, SENTENCE_MARKER
+from run_multi_selection_tests import MultiSelectionTestRunner
+
+
+class SessionDesync(Exception):
+    """test_pinyin stopped where the test case did not expect it to"""
+
+
+class AsyncPinyinSession:
+    """One long-lived test_pinyin process driven with asyncio"""
+
+    def __init__(self, program_path="./test_pinyin", timeout=20, cwd=None, args=()):
+        self.program_path = program_path
+        self.args = list(args)
+        self.timeout = timeout
+        self.cwd = cwd
+        self.process = None
+        self.restarts = 0
+        self._stdout = b""
+        self._stderr = b""
+        self._mark = 0
+        self._stderr_task = None
+
+    async def start(self):
+        """Start test_pinyin and wait for its first prefix prompt"""
+        self.process = await asyncio.create_subprocess_exec(
+            self.program_path,
+            *self.args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.cwd
+        )
+        self._stdout = b""
+        self._stderr = b""
+        self._mark = 0
+        self._stderr_task = asyncio.ensure_future(self._drain_stderr())
+        await self.expect([PREFIX_PROMPT], time.monotonic() + self.timeout)
+        self.take_output()
+
+    async def _drain_stderr(self):
+        while True:
+            chunk = await self.process.stderr.read(65536)
+            if not chunk:
+                return
+            self._stderr += chunk
+
+    async def kill(self):
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            self.process.kill()
+        await self.process.wait()
+        self._stderr_task.cancel()
+        self.process = None
+
+    async def restart(self):
+        await self.kill()
+        self.restarts += 1
+        await self.start()
+
+    async def close(self):
+        """Ask the process to quit, killing it if it does not exit"""
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(b"quit\n")
+            await self.process.stdin.drain()
+            await asyncio.wait_for(self.process.wait(), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            pass
+        await self.kill()
+
+    async def send(self, line):
+        self._mark = len(self._stdout)
+        self.process.stdin.write(line.encode('utf-8') + b"\n")
+        await self.process.stdin.drain()
+
+    async def expect(self, prompts, deadline, sentence=False):
+        """
+        Read until one of the prompts is printed, or, with sentence=True,
+        until a complete sentence: line arrives after the last send.
+        Returns the prompt, ("sentence", text), or None on process exit.
+        Raises asyncio.TimeoutError when the deadline passes.
+        """
+        encoded = [(prompt, prompt.encode('utf-8')) for prompt in prompts]
+        while True:
+            fresh = self._stdout[self._mark:]
+            if sentence:
+                marker = fresh.find(SENTENCE_MARKER)
+                end = fresh.find(b"\n", marker)
+                if marker != -1 and end != -1:
+                    text = fresh[marker + len(SENTENCE_MARKER):end]
+                    # Later lookups start after the sentence line
+                    self._mark += end + 1
+                    return ("sentence", text.decode('utf-8', errors='replace').strip())
+            if fresh:
+                for prompt, raw in encoded:
+                    if self._stdout.endswith(raw):
+                        return prompt
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            chunk = await asyncio.wait_for(self.process.stdout.read(65536), remaining)
+            if not chunk:
+                return None
+            self._stdout += chunk
+
+    def take_output(self):
+        stdout = self._stdout.decode('utf-8', errors='replace')
+        stderr = self._stderr.decode('utf-8', errors='replace')
+        self._stdout = b""
+        self._stderr = b""
+        self._mark = 0
+        return stdout, stderr
+
+    async def run_selections(self, prefix, pinyin, selections):
+        """
+        Run one multi-selection case step by step
+        Returns (selection_results, finished, stdout, stderr, timings). Stops
+        at the first step whose sentence misses its expected_contains;
+        finished tells whether test_pinyin went back to the prefix prompt
+        afterwards. Raises SessionDesync when the process leaves the choose:
+        loop too early. timings has the same keys as PinyinSession.run_case.
+        """
+        if self.process is None or self.process.returncode is not None:
+            await self.restart()
+
+        deadline = time.monotonic() + self.timeout
+        selection_results = []
+        timings = {"choose": []}
+
+        await self.send(prefix)
+        if await self.expect([PINYIN_PROMPT], deadline) is None:
+            raise SessionDesync("test_pinyin exited before the pinyin prompt")
+        await self.send(pinyin)
+        sent = time.monotonic()
+
+        finished = False
+        for step, selection in enumerate(selections, 1):
+            prompt = await self.expect([CHOOSE_PROMPT, PREFIX_PROMPT], deadline)
+            if step == 1:
+                timings["first_candidates"] = round(time.monotonic() - sent, 4)
+            if prompt != CHOOSE_PROMPT:
+                raise SessionDesync(f"No choose: prompt for step {step}")
+
+            await self.send(str(selection['index']))
+            sent = time.monotonic()
+            got = await self.expect([CHOOSE_PROMPT, PREFIX_PROMPT], deadline, sentence=True)
+            if not isinstance(got, tuple):
+                raise SessionDesync(f"No sentence after step {step}")
+            timings["choose"].append(round(time.monotonic() - sent, 4))
+
+            actual = got[1]
+            found = selection['expected_contains'] in actual
+            selection_results.append({
+                "step": step,
+                "expected": selection['expected_contains'],
+                "found": found,
+                "actual": actual
+            })
+            if not found:
+                # Remaining steps would only act on the wrong sentence
+                break
+        else:
+            # Every step matched, wait for training and saving to finish
+            sent = time.monotonic()
+            prompt = await self.expect([CHOOSE_PROMPT, PREFIX_PROMPT], deadline)
+            finished = prompt == PREFIX_PROMPT
+            if finished:
+                timings["save"] = round(time.monotonic() - sent, 4)
+
+        stdout, stderr = self.take_output()
+        if stdout.endswith(PREFIX_PROMPT):
+            stdout = stdout[:-len(PREFIX_PROMPT)]
+        return selection_results, finished, PREFIX_PROMPT + stdout, stderr, timings
+
+
+class AsyncMultiSelectionTestRunner(MultiSelectionTestRunner):
+    """MultiSelectionTestRunner that drives concurrent asyncio sessions"""
+
+    def __init__(self, program_path="./test_pinyin", test_file="multi_selection_tests.json", concurrency=4):
+        super().__init__(program_path, test_file)
+        self.concurrency = concurrency
+
+    async def _run_case(self, session, test_case):
+        started = time.monotonic()
+        selections = test_case['selections']
+        result = {
+            "id": test_case['id'],
+            "description": test_case['description'],
+            "prefix": test_case['prefix'],
+            "pinyin": test_case['pinyin'],
+            "selections": selections,
+            "final_sentence": test_case['final_sentence'],
+            "status": "unknown"
+        }
+        try:
+            selection_results, finished, stdout, stderr, timings = await session.run_selections(
+                test_case['prefix'], test_case['pinyin'], selections)
+            result["timings"] = timings
+            result["output"] = stdout
+            result["error"] = stderr
+            result["selection_results"] = selection_results
+
+            failed_steps = [r["step"] for r in selection_results if not r["found"]]
+            if failed_steps:
+                result["status"] = "failed"
+                result["reason"] = f"Selection step(s) {failed_steps} failed"
+            else:
+                result["status"] = "passed"
+                if "too long" in stdout:
+                    result["note"] = f"Final sentence too long ({len(test_case['final_sentence'])} chars)"
+            if not finished:
+                # Still inside the choose: loop, like the one-shot runner's trailing quit
+                await session.restart()
+        except SessionDesync as e:
+            stdout, stderr = session.take_output()
+            result["status"] = "failed"
+            result["reason"] = str(e)
+            result["output"] = PREFIX_PROMPT + stdout
+            result["error"] = stderr
+            await session.restart()
+        except asyncio.TimeoutError:
+            result["status"] = "error"
+            result["reason"] = f"Timeout (>{session.timeout}s)"
+            await session.restart()
+        except Exception as e:
+            result["status"] = "error"
+            result["reason"] = str(e)
+            await session.restart()
+        result["duration"] = round(time.monotonic() - started, 4)
+        return result
+
+    async def _worker(self, session, test_cases, report):
+        # test_cases is shared: each session takes the next case as soon as it is free
+        for test_case in test_cases:
+            report(await self._run_case(session, test_case))
+
+    async def _run_all(self, test_cases, report):
+        """Run test_cases over the sessions, handing each result to report() as it finishes"""
+        # Read-only sessions never write data/, so they can all share it
+        if self.read_only:
+            workdirs = []
+            cwds = [self.cwd] * self.concurrency
+        else:
+            workdirs = [prepare_worker_dir() for _ in range(self.concurrency)]
+            cwds = workdirs
+        program_path = os.path.abspath(self.program_path)
+        sessions = []
+        try:
+            for cwd in cwds:
+                session = AsyncPinyinSession(program_path, timeout=20, cwd=cwd, args=self.test_pinyin_args())
+                sessions.append(session)
+                await session.start()
+
+            # One worker per session; nothing is kept once report() has it
+            cases = iter(test_cases)
+            await asyncio.gather(*(self._worker(session, cases, report) for session in sessions))
+        finally:
+            for session in sessions:
+                await session.close()
+            for workdir in workdirs:
+                shutil.rmtree(workdir, True)
+
+    def run_all_tests(self, jobs=1, resume=False):
+        """Run all test cases over concurrent sessions in one event loop"""
+        # Cases finish out of order in per-session copies of data/, so there is nothing to checkpoint
+        if resume:
+            raise ValueError("resuming is not supported by the async runner")
+        test_cases = self.load_test_cases()
+        if self.shard is not None:
+            test_cases = self.shard.select(test_cases)
+            self.results["shard"] = str(self.shard)
+            print(f"Shard {self.shard}: {len(test_cases)} case(s)")
+        self.results["total"] = len(test_cases)
+        self.results["start_time"] = datetime.now().isoformat()
+        if self.stream is not None:
+            self.stream.write_start(self.results["start_time"], self.results["total"])
+
+        print(f"Running {len(test_cases)} multi-selection test cases on {self.concurrency} async sessions...")
+        print("=" * 80)
+
+        finished = 0
+
+        def report(result):
+            # Results arrive in completion order, not suite order
+            nonlocal finished
+            finished += 1
+            self._record_result(result)
+            status_symbol = {
+                "passed": "✓",
+                "failed": "✗",
+                "error": "E"
+            }.get(result["status"], "?")
+            steps = len(result.get('selections', []))
+            print(f"[{finished:2d}/{len(test_cases)}] {status_symbol} Test #{result['id']}: {result['description'][:55]} ({steps} steps)")
+            if result["status"] != "passed":
+                print(f"        Reason: {result.get('reason', 'Unknown')}")
+
+        asyncio.run(self._run_all(test_cases, report))
+
+        self.results["end_time"] = datetime.now().isoformat()
+        if self.stream is not None:
+            self.stream.write_summary(self.results)
+
+        start = datetime.fromisoformat(self.results["start_time"])
+        end = datetime.fromisoformat(self.results["end_time"])
+        print("=" * 80)
+        print("\nMulti-Selection Test Summary:")
+        print(f"  Total:   {self.results['total']}")
+        print(f"  Passed:  {self.results['passed']}")
+        print(f"  Failed:  {self.results['failed']}")
+        print(f"  Errors:  {self.results['errors']}")
+        print(f"  Duration: {(end - start).total_seconds():.2f} seconds")
+
+        return self.results
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run a whole suite through one test_pinyin --batch process
+test_pinyin loads the cases itself, runs them back to back against one
+pinyin context and prints one JSON line per case with that case's
+--protocol=jsonl events. Nothing goes through the prompt loop, so there is
+no process start-up or stdin/stdout round trip per case.
+
+Each line is handed to the runner's evaluate() as if it were the output of
+a normal jsonl run, so pass/fail logic is shared with the other modes.
+"""
+
+import json
+import os
+import subprocess
+import tempfile
+
+
+def _error_stdout(message):
+    return json.dumps({"event": "error", "message": message}, ensure_ascii=False)
+
+
+def run_batch(runner, test_cases):
+    """Yield runner.evaluate() results for test_cases, in order, as test_pinyin finishes them"""
+    fd, batch_path = tempfile.mkstemp(prefix="batch_", suffix=".jsonl")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for test_case in test_cases:
+            f.write(json.dumps(test_case, ensure_ascii=False) + "\n")
+
+    stderr_file = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+    process = subprocess.Popen(
+        runner.command() + ["--batch", batch_path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=stderr_file,
+        text=True,
+        encoding='utf-8',
+        cwd=runner.cwd
+    )
+    done = 0
+    try:
+        for line in process.stdout:
+            if not line.startswith("{"):
+                continue
+            record = json.loads(line)
+            if "index" not in record:
+                # Not a case line, e.g. the error for an unreadable batch file
+                continue
+            stdout = "\n".join(json.dumps(event, ensure_ascii=False) for event in record["events"])
+            # An incomplete case is one an interactive run would have aborted on
+            result = runner.evaluate(test_cases[record["index"]], stdout, "",
+                                     0 if record["complete"] else 1)
+            result["duration"] = record["duration"]
+            done = record["index"] + 1
+            yield result
+        returncode = process.wait()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        os.unlink(batch_path)
+
+    # test_pinyin died part way: the remaining cases never ran
+    stderr_file.seek(0)
+    stderr = stderr_file.read()
+    stderr_file.close()
+    for test_case in test_cases[done:]:
+        message = f"test_pinyin --batch exited with {returncode} before this case"
+        yield runner.evaluate(test_case, _error_stdout(message), stderr, returncode or 1)
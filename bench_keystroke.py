@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-keystroke latency benchmark
+Replays the pinyin of a suite (test_cases.json by default) letter by letter
+through one read-only test_pinyin --batch --keystroke process. After every
+key test_pinyin parses the input so far, guesses the sentence and the
+candidates at offset 0, and reports how long that took; this is the delay
+a user sees between pressing a key and the candidate list updating, minus
+drawing it.
+
+--typos RATE mistypes a letter that often (a wrong letter, then <BS>), so
+backspaces are measured too. Reports p50/p90/p99/max over all keys, per
+input length and for backspaces, and the slowest keys.
+
+Usage: python3 bench_keystroke.py [--tests test_cases.json] [--typos 0.05] [--seed 1] [--json keystroke.json]
+"""
+
+import json
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+
+from latency import summarize
+from native_engine import case_rounds
+from suite_file import load_test_cases
+
+BACKSPACE = "<BS>"
+# Input length buckets, in letters typed so far
+LENGTH_BUCKETS = ((1, 5), (6, 10), (11, 20), (21, 40), (41, None))
+SLOWEST = 10
+
+
+def keystrokes(pinyin, typo_rate, rng):
+    """pinyin as a --keystroke line, with a wrong letter and <BS> before a letter typo_rate of the time"""
+    keys = []
+    for letter in pinyin:
+        if typo_rate and rng.random() < typo_rate:
+            keys.append(rng.choice(string.ascii_lowercase) + BACKSPACE)
+        keys.append(letter)
+    return "".join(keys)
+
+
+def batch_cases(test_cases, typo_rate, seed):
+    """Single-round cases typing every round's pinyin, each taking the first candidate"""
+    rng = random.Random(seed)
+    for test_case in test_cases:
+        for prefix, pinyin, _ in case_rounds(test_case):
+            if pinyin:
+                yield {"prefix": prefix, "pinyin": keystrokes(pinyin, typo_rate, rng), "selections": [0]}
+
+
+def run_bench(program, cases, cwd=None):
+    """Yield every key event test_pinyin reports"""
+    fd, batch_path = tempfile.mkstemp(prefix="keystroke_", suffix=".jsonl")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for test_case in cases:
+            f.write(json.dumps(test_case, ensure_ascii=False) + "\n")
+    try:
+        process = subprocess.Popen([program, "--batch", batch_path, "--keystroke", "--read-only"],
+                                   stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   text=True, encoding='utf-8', cwd=cwd)
+        for line in process.stdout:
+            if not line.startswith("{"):
+                continue
+            record = json.loads(line)
+            for event in record.get("events", ()):
+                if event.get("event") == "key":
+                    yield event
+        if process.wait() != 0:
+            raise RuntimeError(f"{program} exited with {process.returncode}")
+    finally:
+        os.unlink(batch_path)
+
+
+def bucket_label(length):
+    for low, high in LENGTH_BUCKETS:
+        if length >= low and (high is None or length <= high):
+            return f"{low}-{high}" if high else f"{low}+"
+    return "empty"
+
+
+def summarize_keys(events):
+    """Latency summaries (ms) overall, per input length and for backspaces, and the slowest keys"""
+    samples = {"all": [], "backspace": []}
+    by_length = {}
+    for event in events:
+        latency = event["elapsed_us"] / 1000
+        samples["all"].append(latency)
+        if event["key"] == BACKSPACE:
+            samples["backspace"].append(latency)
+        else:
+            by_length.setdefault(bucket_label(len(event["input"])), []).append(latency)
+    order = [bucket_label(low) for low, _ in LENGTH_BUCKETS]
+    return {
+        "keys": len(events),
+        "reused": sum(1 for event in events if event["reused"]),
+        "all": summarize(samples["all"]) if samples["all"] else None,
+        "backspace": summarize(samples["backspace"]) if samples["backspace"] else None,
+        "by_length": {label: summarize(by_length[label]) for label in order if label in by_length},
+        "slowest": sorted(events, key=lambda event: event["elapsed_us"], reverse=True)[:SLOWEST]
+    }
+
+
+def print_report(report):
+    print(f"\nKeys: {report['keys']} ({report['reused']} reused the previous guesses)")
+    print(f"\n{'keys (ms)':<14}{'count':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    rows = [("all", report["all"])]
+    rows += [(f"length {label}", summary) for label, summary in report["by_length"].items()]
+    rows.append(("backspace", report["backspace"]))
+    for label, summary in rows:
+        if summary:
+            print(f"{label:<14}{summary['count']:>8}{summary['p50']:>9.3f}{summary['p90']:>9.3f}"
+                  f"{summary['p99']:>9.3f}{summary['max']:>9.3f}")
+    print("\nSlowest keys:")
+    for event in report["slowest"]:
+        print(f"  {event['elapsed_us'] / 1000:>8.3f} ms  {event['key']:<5} -> {event['input']}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark per-keystroke latency of test_pinyin")
+    parser.add_argument("--program", default="./test_pinyin")
+    parser.add_argument("--tests", default="test_cases.json", help="suite whose pinyin is typed (.json or .jsonl)")
+    parser.add_argument("--typos", type=float, default=0.0, metavar="RATE",
+                        help="fraction of letters mistyped and deleted with <BS> (default: 0)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for --typos (default: 1)")
+    parser.add_argument("--json", metavar="FILE", help="also write the summaries as JSON")
+    args = parser.parse_args()
+    if not 0 <= args.typos <= 1:
+        parser.error("--typos must be between 0 and 1")
+    if not os.path.exists(args.program):
+        print(f"Error: {args.program} not found!")
+        print("Please run 'make' first to build the program.")
+        sys.exit(1)
+
+    cases = list(batch_cases(load_test_cases(args.tests), args.typos, args.seed))
+    print(f"Typing {len(cases)} inputs key by key...")
+    report = summarize_keys(list(run_bench(os.path.abspath(args.program), cases)))
+    if not report["keys"]:
+        print("No keys were typed")
+        sys.exit(1)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nReport saved to {args.json}")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-step latency of multi-selection cases, with and without --lazy-sentence
+Two read-only test_pinyin sessions, one started with --lazy-sentence, take
+turns running every case of multi_selection_tests.json. For each step the
+time from sending the input to the next prompt is recorded:
+
+  step 0     pinyin sent -> first choose: prompt
+  step N     selection N sent -> next choose: prompt (candidates shown)
+  finish     last selection sent -> prefix prompt (no training: both
+             sessions are --read-only)
+
+and reported as p50/p90/p99 per step for both sessions. Cases whose final
+sentence differs between the two are counted, since the deferred guess
+changes the previous-token context candidates at later offsets are ranked
+with.
+
+Usage: python3 bench_lazy_sentence.py [--tests multi_selection_tests.json] [--repeat 3] [--json lazy_sentence.json]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from latency import summarize
+from native_engine import selection_indexes
+from pinyin_session import CHOOSE_PROMPT, PINYIN_PROMPT, PREFIX_PROMPT, PinyinSession
+from protocol import parse_output
+from suite_file import load_test_cases
+
+MODES = ("eager", "lazy")
+
+
+def time_case(session, test_case):
+    """(step latencies in ms, final sentence) of one case; the last latency is the finish step"""
+    deadline = time.monotonic() + session.timeout
+    pending = [str(index) for index in selection_indexes(test_case.get("selections"))]
+    steps = []
+
+    session.send(test_case.get("prefix", ""))
+    prompt = session.expect([PINYIN_PROMPT], deadline)
+    lines = [test_case["pinyin"]] + pending
+    while prompt is not None and prompt != PREFIX_PROMPT and lines:
+        sent = time.monotonic()
+        session.send(lines.pop(0))
+        prompt = session.expect([CHOOSE_PROMPT, PREFIX_PROMPT], deadline)
+        steps.append((time.monotonic() - sent) * 1000)
+
+    stdout, _ = session.take_output()
+    if prompt == CHOOSE_PROMPT:
+        # Out of selections mid-sentence; the session cannot continue
+        session.restart()
+        return None, None
+    return steps, parse_output(stdout, session.protocol).final_sentence
+
+
+def run_bench(program, test_cases, repeat):
+    """Per mode: step label -> latencies, and how many cases ended differently"""
+    samples = {mode: {} for mode in MODES}
+    differing = 0
+    sessions = {
+        "eager": PinyinSession(program, args=["--read-only"], protocol="jsonl"),
+        "lazy": PinyinSession(program, args=["--read-only", "--lazy-sentence"], protocol="jsonl")
+    }
+    for session in sessions.values():
+        session.start()
+    try:
+        for round_number in range(repeat):
+            for test_case in test_cases:
+                sentences = {}
+                # Alternate which mode goes first, so neither always runs on a warmer cache
+                order = MODES if round_number % 2 == 0 else MODES[::-1]
+                for mode in order:
+                    steps, sentences[mode] = time_case(sessions[mode], test_case)
+                    if steps is None:
+                        continue
+                    for i, latency in enumerate(steps):
+                        label = "finish" if i == len(steps) - 1 else f"step {i}"
+                        samples[mode].setdefault(label, []).append(latency)
+                if round_number == 0 and sentences["eager"] != sentences["lazy"]:
+                    differing += 1
+    finally:
+        for session in sessions.values():
+            session.close()
+    return samples, differing
+
+
+def step_order(label):
+    return (1, 0) if label == "finish" else (0, int(label.split()[1]))
+
+
+def print_report(samples, differing, cases):
+    labels = sorted(set(samples["eager"]) | set(samples["lazy"]), key=step_order)
+    print(f"\n{'step (ms)':<10}{'count':>7}{'eager p50':>11}{'lazy p50':>10}{'eager p90':>11}{'lazy p90':>10}"
+          f"{'eager p99':>11}{'lazy p99':>10}")
+    for label in labels:
+        eager = summarize(samples["eager"][label]) if label in samples["eager"] else None
+        lazy = summarize(samples["lazy"][label]) if label in samples["lazy"] else None
+        row = f"{label:<10}{(eager or lazy)['count']:>7}"
+        for p in ("p50", "p90", "p99"):
+            row += f"{eager[p] if eager else float('nan'):>11.3f}{lazy[p] if lazy else float('nan'):>10.3f}"
+        print(row)
+
+    totals = {mode: sum(sum(values) for values in samples[mode].values()) for mode in MODES}
+    if totals["eager"]:
+        print(f"\nTotal: eager {totals['eager']:.1f} ms, lazy {totals['lazy']:.1f} ms "
+              f"(x{totals['lazy'] / totals['eager']:.2f})")
+    print(f"Cases with a different final sentence: {differing}/{cases}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare per-step latency with and without --lazy-sentence")
+    parser.add_argument("--program", default="./test_pinyin")
+    parser.add_argument("--tests", default="multi_selection_tests.json", help="suite to replay (.json or .jsonl)")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the suite (default: 3)")
+    parser.add_argument("--json", metavar="FILE", help="also write the per-step summaries as JSON")
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if not os.path.exists(args.program):
+        print(f"Error: {args.program} not found!")
+        print("Please run 'make' first to build the program.")
+        sys.exit(1)
+
+    test_cases = [test_case for test_case in load_test_cases(args.tests) if test_case.get("pinyin")]
+    print(f"Replaying {len(test_cases)} cases x {args.repeat}, eager and lazy...")
+    try:
+        samples, differing = run_bench(os.path.abspath(args.program), test_cases, args.repeat)
+    except subprocess.TimeoutExpired as e:
+        print(f"Error: test_pinyin stopped answering ({e})")
+        sys.exit(1)
+    print_report(samples, differing, len(test_cases))
+
+    if args.json:
+        report = {mode: {label: summarize(values) for label, values in samples[mode].items()} for mode in MODES}
+        report["differing_cases"] = differing
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nReport saved to {args.json}")
@@ -0,0 +1,201 @@
+/*
+ *  Input-length scaling benchmark for sentence decoding
+ *
+ *  Builds inputs of 1 to --max syllables from a natural sentence (cycled
+ *  for long inputs), typed without separators like the test suites, and
+ *  for each length times pinyin_parse_more_full_pinyins,
+ *  pinyin_guess_candidates and pinyin_guess_sentence with main.cpp's
+ *  options. Each length is repeated --repeat times; the median and minimum
+ *  of every stage are printed as one JSON line, with the peak RSS (VmHWM)
+ *  reached while decoding that length. The peak is reset before each length
+ *  through /proc/self/clear_refs where the kernel allows it.
+ *  bench_length.py tabulates the curve and flags super-linear regions.
+ *
+ *  Compile: g++ -O2 bench_length.cpp `pkg-config libpinyin --libs --cflags` -o bench_length
+ */
+
+#include "pinyin.h"
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <algorithm>
+#include <chrono>
+#include <sstream>
+#include <string>
+#include <vector>
+
+// 今天天气非常好我们一起去公园玩吧 他昨天买了很多好吃的东西给大家 ...
+const char* DEFAULT_SYLLABLES =
+    "jin tian tian qi fei chang hao wo men yi qi qu gong yuan wan ba "
+    "ta zuo tian mai le hen duo hao chi de dong xi gei da jia "
+    "zhe shi yi ge fei chang zhong yao de li shi shi ke "
+    "wo men ying gai ren zhen xue xi ke xue ji shu zhi shi "
+    "xue sheng men dou zai jiao shi li ren zhen ting lao shi jiang ke";
+
+const int STAGE_COUNT = 3;
+const char* const STAGE_NAMES[STAGE_COUNT] = {"parse", "guess_candidates", "guess_sentence"};
+
+long long elapsed_us(std::chrono::steady_clock::time_point since)
+{
+    return std::chrono::duration_cast<std::chrono::microseconds>(std::chrono::steady_clock::now() - since).count();
+}
+
+// A /proc/self/status field in kB, or -1
+long status_kb(const char* field)
+{
+    FILE* status = fopen("/proc/self/status", "r");
+    if(!status){
+        return -1;
+    }
+    char line[256];
+    long value = -1;
+    const size_t length = strlen(field);
+    while(fgets(line, sizeof(line), status)){
+        if(strncmp(line, field, length) == 0 && line[length] == ':'){
+            value = strtol(line + length + 1, nullptr, 10);
+            break;
+        }
+    }
+    fclose(status);
+    return value;
+}
+
+// Reset VmHWM to the current RSS (Linux 4.0+); false if not permitted
+bool reset_peak_rss()
+{
+    FILE* clear_refs = fopen("/proc/self/clear_refs", "w");
+    if(!clear_refs){
+        return false;
+    }
+    const bool ok = fputs("5", clear_refs) >= 0;
+    return fclose(clear_refs) == 0 && ok;
+}
+
+long long median(std::vector<long long> values)
+{
+    std::sort(values.begin(), values.end());
+    return values[values.size() / 2];
+}
+
+void print_usage(const char* program)
+{
+    fprintf(stderr, "Usage: %s [--data=DIR] [--min=N] [--max=N] [--step=N] [--repeat=N] [--syllables=\"ni hao ...\"]\n",
+            program);
+}
+
+int main(int argc, char* argv[])
+{
+    std::string dir = "data";
+    std::string syllable_text = DEFAULT_SYLLABLES;
+    unsigned min_length = 1;
+    unsigned max_length = 120;
+    unsigned step = 1;
+    unsigned repeat = 5;
+    for(int i = 1; i < argc; ++i){
+        const std::string arg = argv[i];
+        if(arg.rfind("--data=", 0) == 0){
+            dir = arg.substr(strlen("--data="));
+        }
+        else if(arg.rfind("--min=", 0) == 0){
+            min_length = strtoul(arg.c_str() + strlen("--min="), nullptr, 10);
+        }
+        else if(arg.rfind("--max=", 0) == 0){
+            max_length = strtoul(arg.c_str() + strlen("--max="), nullptr, 10);
+        }
+        else if(arg.rfind("--step=", 0) == 0){
+            step = strtoul(arg.c_str() + strlen("--step="), nullptr, 10);
+        }
+        else if(arg.rfind("--repeat=", 0) == 0){
+            repeat = strtoul(arg.c_str() + strlen("--repeat="), nullptr, 10);
+        }
+        else if(arg.rfind("--syllables=", 0) == 0){
+            syllable_text = arg.substr(strlen("--syllables="));
+        }
+        else {
+            print_usage(argv[0]);
+            return 2;
+        }
+    }
+
+    std::vector<std::string> syllables;
+    std::istringstream words(syllable_text);
+    for(std::string word; words >> word;){
+        syllables.push_back(word);
+    }
+    if(syllables.empty() || min_length < 1 || step < 1 || repeat < 1 || max_length < min_length){
+        print_usage(argv[0]);
+        return 2;
+    }
+
+    pinyin_context_t* context = pinyin_init(dir.c_str(), dir.c_str());
+    if(!context){
+        fprintf(stderr, "Failed to initialize pinyin context\n");
+        return 1;
+    }
+    pinyin_option_t options = PINYIN_INCOMPLETE | PINYIN_CORRECT_ALL | USE_DIVIDED_TABLE | USE_RESPLIT_TABLE | DYNAMIC_ADJUST;
+    pinyin_set_options(context, options);
+    pinyin_instance_t* instance = pinyin_alloc_instance(context);
+    if(!instance){
+        fprintf(stderr, "Failed to allocate pinyin instance\n");
+        pinyin_fini(context);
+        return 1;
+    }
+
+    for(unsigned length = min_length; length <= max_length; length += step){
+        std::string input;
+        for(unsigned i = 0; i < length; ++i){
+            input += syllables[i % syllables.size()];
+        }
+
+        const bool peak_reset = reset_peak_rss();
+        std::vector<long long> samples[STAGE_COUNT];
+        std::vector<long long> totals;
+        size_t consumed = 0;
+        size_t parsed_keys = 0;
+        guint candidates = 0;
+        for(unsigned r = 0; r < repeat; ++r){
+            pinyin_reset(instance);
+            long long stage_us[STAGE_COUNT];
+
+            auto started = std::chrono::steady_clock::now();
+            consumed = pinyin_parse_more_full_pinyins(instance, input.c_str());
+            stage_us[0] = elapsed_us(started);
+
+            started = std::chrono::steady_clock::now();
+            pinyin_guess_candidates(instance, 0, SORT_BY_PHRASE_LENGTH_AND_PINYIN_LENGTH_AND_FREQUENCY);
+            stage_us[1] = elapsed_us(started);
+
+            started = std::chrono::steady_clock::now();
+            pinyin_guess_sentence(instance);
+            stage_us[2] = elapsed_us(started);
+
+            long long total = 0;
+            for(int s = 0; s < STAGE_COUNT; ++s){
+                samples[s].push_back(stage_us[s]);
+                total += stage_us[s];
+            }
+            totals.push_back(total);
+            parsed_keys = pinyin_get_parsed_input_length(instance);
+            pinyin_get_n_candidate(instance, &candidates);
+        }
+
+        std::string medians;
+        std::string minimums;
+        for(int s = 0; s < STAGE_COUNT; ++s){
+            medians += std::string("\"") + STAGE_NAMES[s] + "\":" + std::to_string(median(samples[s])) + ",";
+            minimums += std::string("\"") + STAGE_NAMES[s] + "\":" +
+                std::to_string(*std::min_element(samples[s].begin(), samples[s].end())) + ",";
+        }
+        printf("{\"syllables\":%u,\"letters\":%zu,\"consumed\":%zu,\"parsed_keys\":%zu,\"candidates\":%u,"
+               "\"repeat\":%u,\"stages\":{%s\"total\":%lld},\"min\":{%s\"total\":%lld},"
+               "\"hwm_kb\":%ld,\"rss_kb\":%ld,\"peak_reset\":%s}\n",
+               length, input.size(), consumed, parsed_keys, candidates, repeat,
+               medians.c_str(), median(totals), minimums.c_str(), *std::min_element(totals.begin(), totals.end()),
+               status_kb("VmHWM"), status_kb("VmRSS"), peak_reset ? "true" : "false");
+        fflush(stdout);
+    }
+
+    pinyin_free_instance(instance);
+    pinyin_fini(context);
+    return 0;
+}
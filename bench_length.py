@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Input-length scaling benchmark
+Runs bench_length, which times pinyin_parse_more_full_pinyins,
+pinyin_guess_candidates and pinyin_guess_sentence on inputs of 1 to --max
+syllables with the runners' options, and tabulates how each stage grows
+with the syllable count, with the peak memory of each length.
+
+Growth is judged by the local exponent k of time ~ n^k, measured between
+each length n and the nearest length at or below n / 1.5 (so a single
+noisy step does not count). Lengths whose exponent exceeds --threshold
+(default 1.2) are flagged and grouped into super-linear regions. The first
+length whose total exceeds --budget-ms is reported as where typing stops
+feeling instant.
+
+Usage: python3 bench_length.py [--max 120] [--repeat 5] [--budget-ms 100] [--plot length.png] [--json length.json]
+"""
+
+import json
+import math
+import os
+import subprocess
+import sys
+
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+STAGES = ("parse", "guess_candidates", "guess_sentence", "total")
+SPAN = 1.5
+# Below this, timer resolution and noise dominate the exponent
+MIN_SAMPLE_US = 50
+BAR_WIDTH = 40
+
+
+def run_bench(program, data_dir, max_length, step, repeat, syllables=None):
+    """Yield bench_length's record for each length as it is measured"""
+    command = [program, f"--data={data_dir}", f"--max={max_length}", f"--step={step}", f"--repeat={repeat}"]
+    if syllables:
+        command.append(f"--syllables={syllables}")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, encoding='utf-8')
+    for line in process.stdout:
+        if line.strip():
+            yield json.loads(line)
+    if process.wait() != 0:
+        raise RuntimeError(f"{program} exited with {process.returncode}")
+
+
+def growth_exponents(records, stage):
+    """Per record, the local exponent k of stage time ~ syllables^k, or None"""
+    exponents = []
+    for i, record in enumerate(records):
+        exponent = None
+        n = record["syllables"]
+        t = record["stages"][stage]
+        for earlier in reversed(records[:i]):
+            if earlier["syllables"] <= n / SPAN:
+                t0 = earlier["stages"][stage]
+                if t0 >= MIN_SAMPLE_US and t >= MIN_SAMPLE_US:
+                    exponent = math.log(t / t0) / math.log(n / earlier["syllables"])
+                break
+        exponents.append(exponent)
+    return exponents
+
+
+def super_linear_regions(records, exponents, threshold):
+    """[(first syllables, last syllables, max exponent)] of consecutive lengths above threshold"""
+    regions = []
+    current = None
+    for record, exponent in zip(records, exponents):
+        if exponent is not None and exponent > threshold:
+            if current is None:
+                current = [record["syllables"], record["syllables"], exponent]
+            else:
+                current[1] = record["syllables"]
+                current[2] = max(current[2], exponent)
+        elif current is not None:
+            regions.append(tuple(current))
+            current = None
+    if current is not None:
+        regions.append(tuple(current))
+    return regions
+
+
+def analyze(records, threshold, budget_ms):
+    """Exponents and super-linear regions per stage, and the first length over budget"""
+    report = {"threshold": threshold, "budget_ms": budget_ms, "stages": {}, "over_budget": None}
+    for stage in STAGES:
+        exponents = growth_exponents(records, stage)
+        report["stages"][stage] = {
+            "exponents": exponents,
+            "regions": super_linear_regions(records, exponents, threshold)
+        }
+    for record in records:
+        if record["stages"]["total"] / 1000 > budget_ms:
+            report["over_budget"] = record["syllables"]
+            break
+    return report
+
+
+def print_report(records, report):
+    longest = max(record["stages"]["total"] for record in records) or 1
+    exponents = report["stages"]["total"]["exponents"]
+    print(f"\n{'syl':>4}{'keys':>6}{'parse':>10}{'cands':>10}{'sentence':>10}{'total':>10}"
+          f"{'k':>6}{'HWM MiB':>9}  total (ms, median)")
+    for record, exponent in zip(records, exponents):
+        stages = record["stages"]
+        flag = "*" if exponent is not None and exponent > report["threshold"] else " "
+        bar = "#" * max(1, round(stages["total"] / longest * BAR_WIDTH))
+        k = f"{exponent:.2f}" if exponent is not None else "-"
+        print(f"{record['syllables']:>4}{record['parsed_keys']:>6}"
+              f"{stages['parse'] / 1000:>10.3f}{stages['guess_candidates'] / 1000:>10.3f}"
+              f"{stages['guess_sentence'] / 1000:>10.3f}{stages['total'] / 1000:>10.3f}"
+              f"{k:>6}{record['hwm_kb'] / 1024:>9.1f} {flag}{bar}")
+
+    truncated = [record["syllables"] for record in records if record["consumed"] < record["letters"]]
+    if truncated:
+        print(f"\nInput only partly parsed from {truncated[0]} syllables on")
+
+    print(f"\nSuper-linear regions (local exponent > {report['threshold']}):")
+    found = False
+    for stage in STAGES:
+        for first, last, exponent in report["stages"][stage]["regions"]:
+            found = True
+            print(f"  {stage:<18} {first:>4}-{last:<4} syllables, up to n^{exponent:.2f}")
+    if not found:
+        print("  none")
+
+    if report["over_budget"] is None:
+        print(f"\nEvery length stays within {report['budget_ms']} ms")
+    else:
+        print(f"\nTotal exceeds {report['budget_ms']} ms from {report['over_budget']} syllables")
+
+
+def plot(records, report, path):
+    if plt is None:
+        raise RuntimeError("--plot needs the 'matplotlib' package (pip install matplotlib)")
+    lengths = [record["syllables"] for record in records]
+    figure, (times, memory) = plt.subplots(2, 1, sharex=True, figsize=(9, 7))
+    for stage in STAGES:
+        times.plot(lengths, [record["stages"][stage] / 1000 for record in records], label=stage)
+        for first, last, _ in report["stages"][stage]["regions"]:
+            times.axvspan(first, last, color="red", alpha=0.1)
+    times.axhline(report["budget_ms"], color="grey", linestyle="--", label=f"{report['budget_ms']} ms budget")
+    times.set_ylabel("median latency (ms)")
+    times.legend()
+    memory.plot(lengths, [record["hwm_kb"] / 1024 for record in records])
+    memory.set_ylabel("peak RSS (MiB)")
+    memory.set_xlabel("syllables")
+    figure.tight_layout()
+    figure.savefig(path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark decoding latency against input length")
+    parser.add_argument("--program", default="./bench_length")
+    parser.add_argument("--data", default="data", help="libpinyin data directory (default: data)")
+    parser.add_argument("--max", type=int, default=120, help="longest input in syllables (default: 120)")
+    parser.add_argument("--step", type=int, default=1, help="syllables between measured lengths")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per length; the median is reported")
+    parser.add_argument("--syllables", help="space separated syllables to build inputs from (cycled)")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="local growth exponent above which a region is flagged (default: 1.2)")
+    parser.add_argument("--budget-ms", type=float, default=100,
+                        help="total latency considered unusable (default: 100)")
+    parser.add_argument("--plot", metavar="FILE", help="also plot the curves to this image (needs matplotlib)")
+    parser.add_argument("--json", metavar="FILE", help="also write the records and analysis as JSON")
+    args = parser.parse_args()
+    if args.max < 1 or args.step < 1 or args.repeat < 1:
+        parser.error("--max, --step and --repeat must be at least 1")
+    if args.plot and plt is None:
+        parser.error("--plot needs the 'matplotlib' package (pip install matplotlib)")
+
+    if not os.path.exists(args.program):
+        print(f"Error: {args.program} not found!")
+        print("Please run 'make bench' first to build it.")
+        sys.exit(1)
+
+    print(f"Measuring 1-{args.max} syllables, {args.repeat} runs each...")
+    records = list(run_bench(os.path.abspath(args.program), args.data, args.max, args.step, args.repeat,
+                             args.syllables))
+    report = analyze(records, args.threshold, args.budget_ms)
+    print_report(records, report)
+
+    if args.plot:
+        plot(records, report, args.plot)
+        print(f"\nPlot saved to {args.plot}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"records": records, "analysis": report}, f, ensure_ascii=False, indent=2)
+        print(f"Report saved to {args.json}")
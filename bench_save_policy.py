@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare test_pinyin --save-policy settings
+Runs the same suite through test_pinyin --batch once per policy, each time
+on a fresh copy of data/, and reports sentences per second and how many
+times the user tables were written. Batch mode never waits for input, so
+idle:T only saves at shutdown there; interval:T is checked per sentence.
+
+Usage: python3 bench_save_policy.py [suite.json] [--policy every:1 --policy shutdown ...]
+"""
+
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from parallel_runner import prepare_worker_dir
+from suite_file import load_test_cases
+
+DEFAULT_POLICIES = ["every:1", "every:10", "every:50", "interval:1", "shutdown"]
+
+
+def load_cases(path, limit=None):
+    """Suite cases, each with enough selections to finish its sentence"""
+    cases = [case for case in load_test_cases(path) if case.get('pinyin') or case.get('rounds')]
+    for case in cases:
+        # No explicit choices: keep taking the first candidate
+        if 'selections' not in case and 'rounds' not in case:
+            case['selections'] = [0] * len(case['pinyin'])
+    return cases[:limit] if limit else cases
+
+
+def run_policy(program, cases_path, policy, data_dir="data"):
+    """One batch run on a fresh copy of data_dir: (seconds, sentences, saves)"""
+    workdir = prepare_worker_dir(data_dir)
+    try:
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [os.path.abspath(program), "--batch", cases_path, f"--save-policy={policy}"],
+            capture_output=True,
+            text=True,
+            cwd=workdir
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"test_pinyin failed with {policy}: {completed.stderr.strip()}")
+
+    sentences = saves = 0
+    for line in completed.stdout.splitlines():
+        record = json.loads(line)
+        for event in record.get("events", [record]):
+            if event.get("event") == "trained":
+                sentences += 1
+            elif event.get("event") == "saved":
+                saves += 1
+    return elapsed, sentences, saves
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Throughput of test_pinyin save policies")
+    parser.add_argument("suite", nargs="?", default="test_cases.json")
+    parser.add_argument("--policy", action="append", dest="policies",
+                        help=f"policy to measure, may repeat (default: {' '.join(DEFAULT_POLICIES)})")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per policy; the median is reported")
+    parser.add_argument("--limit", type=int, help="only use the first N cases")
+    parser.add_argument("--program", default="./test_pinyin")
+    args = parser.parse_args()
+    policies = args.policies or DEFAULT_POLICIES
+
+    if not os.path.exists(args.program):
+        print(f"Error: {args.program} not found! Run 'make' first.")
+        sys.exit(1)
+
+    fd, cases_path = tempfile.mkstemp(prefix="bench_save_", suffix=".jsonl")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for case in load_cases(args.suite, args.limit):
+            f.write(json.dumps(case, ensure_ascii=False) + "\n")
+
+    print(f"{'policy':16s}{'sentences':>10s}{'saves':>8s}{'seconds':>10s}{'sent/s':>10s}{'speedup':>9s}")
+    baseline = None
+    try:
+        for policy in policies:
+            runs = [run_policy(args.program, cases_path, policy) for _ in range(args.repeat)]
+            elapsed = statistics.median(run[0] for run in runs)
+            _, sentences, saves = runs[0]
+            rate = sentences / elapsed if elapsed else 0
+            if baseline is None:
+                baseline = rate
+            speedup = rate / baseline if baseline else 0
+            print(f"{policy:16s}{sentences:10d}{saves:8d}{elapsed:10.3f}{rate:10.1f}{speedup:8.2f}x")
+    finally:
+        os.unlink(cases_path)
+
@@ -0,0 +1,250 @@
+/*
+ *  Startup benchmark for test_pinyin
+ *
+ *  Times what every short-lived test_pinyin, test_prefix and test_extract
+ *  process pays before it can answer: the data/user.conf probe,
+ *  pinyin_init, pinyin_set_options, pinyin_alloc_instance and the first
+ *  pinyin_parse_more_full_pinyins + pinyin_guess_candidates. Prints one
+ *  JSON line per iteration with each stage in microseconds.
+ *
+ *  --cold drops the data files from the page cache first (fdatasync, then
+ *  posix_fadvise(POSIX_FADV_DONTNEED)), so the dictionaries are read from
+ *  disk. --populate=N instead grows the user dictionary by N synthetic
+ *  phrases, trains bigrams between them and saves, to measure how startup
+ *  scales with the user tables. bench_startup.py drives both.
+ *
+ *  Compile: g++ -O2 bench_startup.cpp `pkg-config libpinyin --libs --cflags` -o bench_startup
+ */
+
+#include "pinyin.h"
+#include <dirent.h>
+#include <fcntl.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/resource.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include <chrono>
+#include <random>
+#include <string>
+#include <vector>
+
+const int USER_DICTIONARY_INDEX = 7;
+const int USER_PHRASE_FREQUENCY = 100;
+
+// Characters and their syllables for --populate phrases
+const char* const POPULATE_CHARS[][2] = {
+    {"你", "ni"}, {"好", "hao"}, {"我", "wo"}, {"们", "men"}, {"中", "zhong"}, {"国", "guo"},
+    {"人", "ren"}, {"民", "min"}, {"今", "jin"}, {"天", "tian"}, {"明", "ming"}, {"学", "xue"},
+    {"生", "sheng"}, {"老", "lao"}, {"师", "shi"}, {"朋", "peng"}, {"友", "you"}, {"时", "shi"},
+    {"间", "jian"}, {"工", "gong"}, {"作", "zuo"}, {"电", "dian"}, {"脑", "nao"}, {"手", "shou"},
+};
+const size_t POPULATE_CHAR_COUNT = sizeof(POPULATE_CHARS) / sizeof(POPULATE_CHARS[0]);
+
+struct Timer {
+    std::chrono::steady_clock::time_point start = std::chrono::steady_clock::now();
+
+    // Microseconds since construction or the previous lap
+    long long lap()
+    {
+        const auto now = std::chrono::steady_clock::now();
+        const long long elapsed = std::chrono::duration_cast<std::chrono::microseconds>(now - start).count();
+        start = now;
+        return elapsed;
+    }
+};
+
+// Drop every file under dir from the page cache; returns the bytes dropped
+long long drop_page_cache(const std::string& dir)
+{
+    long long dropped = 0;
+    DIR* directory = opendir(dir.c_str());
+    if(!directory){
+        return 0;
+    }
+    while(struct dirent* entry = readdir(directory)){
+        const std::string path = dir + "/" + entry->d_name;
+        struct stat st;
+        if(stat(path.c_str(), &st) != 0 || !S_ISREG(st.st_mode)){
+            continue;
+        }
+        const int fd = open(path.c_str(), O_RDONLY);
+        if(fd < 0){
+            continue;
+        }
+        // Dirty pages cannot be dropped, so write them back first
+        fdatasync(fd);
+        if(posix_fadvise(fd, 0, 0, POSIX_FADV_DONTNEED) == 0){
+            dropped += st.st_size;
+        }
+        close(fd);
+    }
+    closedir(directory);
+    return dropped;
+}
+
+// The data/user.conf probe main.cpp, prefix.cpp and extract.cpp start with
+void probe_user_conf(const std::string& dir)
+{
+    const std::string path = dir + "/user.conf";
+    if(FILE* check_file = fopen(path.c_str(), "r")){
+        fclose(check_file);
+    }
+    else if(FILE* create_file = fopen(path.c_str(), "w")){
+        fclose(create_file);
+    }
+}
+
+long max_rss_kb()
+{
+    struct rusage usage;
+    getrusage(RUSAGE_SELF, &usage);
+    return usage.ru_maxrss;
+}
+
+int run_startup(const std::string& dir, const std::string& pinyin, bool cold)
+{
+    const long long dropped = cold ? drop_page_cache(dir) : 0;
+
+    Timer timer;
+    probe_user_conf(dir);
+    const long long probe_us = timer.lap();
+
+    pinyin_context_t* context = pinyin_init(dir.c_str(), dir.c_str());
+    const long long init_us = timer.lap();
+    if(!context){
+        fprintf(stderr, "Failed to initialize pinyin context\n");
+        return 1;
+    }
+
+    pinyin_option_t options = PINYIN_INCOMPLETE | PINYIN_CORRECT_ALL | USE_DIVIDED_TABLE | USE_RESPLIT_TABLE | DYNAMIC_ADJUST;
+    pinyin_set_options(context, options);
+    const long long options_us = timer.lap();
+
+    pinyin_instance_t* instance = pinyin_alloc_instance(context);
+    const long long alloc_us = timer.lap();
+    if(!instance){
+        fprintf(stderr, "Failed to allocate pinyin instance\n");
+        pinyin_fini(context);
+        return 1;
+    }
+
+    pinyin_parse_more_full_pinyins(instance, pinyin.c_str());
+    const long long parse_us = timer.lap();
+    pinyin_guess_candidates(instance, 0, SORT_BY_PHRASE_LENGTH_AND_PINYIN_LENGTH_AND_FREQUENCY);
+    const long long guess_us = timer.lap();
+    const long long total_us = probe_us + init_us + options_us + alloc_us + parse_us + guess_us;
+
+    guint candidates = 0;
+    pinyin_get_n_candidate(instance, &candidates);
+
+    printf("{\"cold\":%s,\"dropped_bytes\":%lld,\"candidates\":%u,\"max_rss_kb\":%ld,"
+           "\"stages\":{\"probe\":%lld,\"init\":%lld,\"set_options\":%lld,\"alloc_instance\":%lld,"
+           "\"parse\":%lld,\"first_guess\":%lld,\"total\":%lld}}\n",
+           cold ? "true" : "false", dropped, candidates, max_rss_kb(),
+           probe_us, init_us, options_us, alloc_us, parse_us, guess_us, total_us);
+    fflush(stdout);
+
+    pinyin_free_instance(instance);
+    pinyin_fini(context);
+    return 0;
+}
+
+// Add count synthetic phrases to the user dictionary, remember consecutive
+// pairs as sentences so user_bigram.db grows too, and save
+int populate(const std::string& dir, unsigned count)
+{
+    probe_user_conf(dir);
+    pinyin_context_t* context = pinyin_init(dir.c_str(), dir.c_str());
+    if(!context){
+        fprintf(stderr, "Failed to initialize pinyin context\n");
+        return 1;
+    }
+    pinyin_instance_t* instance = pinyin_alloc_instance(context);
+
+    std::mt19937 random(count);
+    std::uniform_int_distribution<size_t> pick_char(0, POPULATE_CHAR_COUNT - 1);
+    std::uniform_int_distribution<int> pick_length(2, 4);
+
+    std::vector<std::string> phrases;
+    unsigned added = 0;
+    import_iterator_t* iterator = pinyin_begin_add_phrases(context, USER_DICTIONARY_INDEX);
+    for(unsigned i = 0; i < count; ++i){
+        std::string phrase;
+        std::string pinyin;
+        const int length = pick_length(random);
+        for(int j = 0; j < length; ++j){
+            const size_t c = pick_char(random);
+            phrase += POPULATE_CHARS[c][0];
+            if(j > 0){
+                pinyin += '\'';
+            }
+            pinyin += POPULATE_CHARS[c][1];
+        }
+        if(pinyin_iterator_add_phrase(iterator, phrase.c_str(), pinyin.c_str(), USER_PHRASE_FREQUENCY)){
+            ++added;
+        }
+        phrases.push_back(phrase);
+    }
+    pinyin_end_add_phrases(iterator);
+
+    // Once the phrases are in the dictionary, pairs of them segment into bigrams
+    for(size_t i = 1; i < phrases.size(); ++i){
+        pinyin_remember_user_input(instance, (phrases[i - 1] + phrases[i]).c_str(), -1);
+    }
+
+    const bool saved = pinyin_save(context);
+    printf("{\"populated\":%u,\"added\":%u,\"saved\":%s}\n", count, added, saved ? "true" : "false");
+
+    pinyin_free_instance(instance);
+    pinyin_fini(context);
+    return saved ? 0 : 1;
+}
+
+void print_usage(const char* program)
+{
+    fprintf(stderr, "Usage: %s [--data=DIR] [--pinyin=PINYIN] [--cold] [--iterations=N]\n"
+                    "       %s [--data=DIR] --populate=N\n", program, program);
+}
+
+int main(int argc, char* argv[])
+{
+    std::string dir = "data";
+    std::string pinyin = "nihao";
+    bool cold = false;
+    unsigned iterations = 1;
+    long populate_count = -1;
+    for(int i = 1; i < argc; ++i){
+        const std::string arg = argv[i];
+        if(arg.rfind("--data=", 0) == 0){
+            dir = arg.substr(strlen("--data="));
+        }
+        else if(arg.rfind("--pinyin=", 0) == 0){
+            pinyin = arg.substr(strlen("--pinyin="));
+        }
+        else if(arg == "--cold"){
+            cold = true;
+        }
+        else if(arg.rfind("--iterations=", 0) == 0){
+            iterations = strtoul(arg.c_str() + strlen("--iterations="), nullptr, 10);
+        }
+        else if(arg.rfind("--populate=", 0) == 0){
+            populate_count = strtol(arg.c_str() + strlen("--populate="), nullptr, 10);
+        }
+        else {
+            print_usage(argv[0]);
+            return 2;
+        }
+    }
+
+    if(populate_count >= 0){
+        return populate(dir, populate_count);
+    }
+    for(unsigned i = 0; i < iterations; ++i){
+        if(int status = run_startup(dir, pinyin, cold)){
+            return status;
+        }
+    }
+    return 0;
+}
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup benchmark: cold vs warm page cache, and user table size
+For each user-dictionary size, a fresh copy of data/ is grown with
+bench_startup --populate=N and bench_startup is started --runs times cold
+(data files dropped from the page cache first) and --runs times warm (after
+one untimed run). Every run is a new process, like the test runners'
+short-lived test_pinyin invocations. Reports the median and p90 of each
+startup stage in milliseconds and the size of the user files.
+
+Usage: python3 bench_startup.py [--runs 10] [--sizes 0,1000,10000] [--json startup.json]
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import data_files
+from latency import summarize
+from parallel_runner import prepare_worker_dir
+
+STAGES = ("probe", "init", "set_options", "alloc_instance", "parse", "first_guess", "total")
+
+
+def run_bench(program, workdir, *args):
+    """One bench_startup process in workdir; returns its last JSON line"""
+    completed = subprocess.run([program, "--data=data"] + list(args), cwd=workdir,
+                               capture_output=True, text=True, encoding='utf-8')
+    if completed.returncode != 0:
+        raise RuntimeError(f"{program} {' '.join(args)} exited with {completed.returncode}: "
+                           f"{completed.stderr.strip()}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def user_file_bytes(data_dir):
+    """name -> size of the user files in data_dir"""
+    return {name: os.path.getsize(os.path.join(data_dir, name)) for name in data_files.list_files(data_dir)}
+
+
+def measure(program, workdir, runs, pinyin, cold):
+    """Stage -> summary (milliseconds) over runs fresh processes"""
+    args = [f"--pinyin={pinyin}"] + (["--cold"] if cold else [])
+    if not cold:
+        run_bench(program, workdir, *args)  # Fill the page cache
+    samples = [run_bench(program, workdir, *args) for _ in range(runs)]
+    summary = {stage: summarize([sample["stages"][stage] / 1000 for sample in samples]) for stage in STAGES}
+    summary["max_rss_kb"] = max(sample["max_rss_kb"] for sample in samples)
+    return summary
+
+
+def bench_size(program, data_dir, size, runs, pinyin):
+    workdir = prepare_worker_dir(data_dir)
+    try:
+        if size:
+            run_bench(program, workdir, f"--populate={size}")
+        return {
+            "user_phrases": size,
+            "user_files": user_file_bytes(os.path.join(workdir, "data")),
+            "cold": measure(program, workdir, runs, pinyin, cold=True),
+            "warm": measure(program, workdir, runs, pinyin, cold=False)
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(reports):
+    for report in reports:
+        user_bytes = sum(report["user_files"].values())
+        print(f"\nUser phrases: {report['user_phrases']}  (user files: {user_bytes / 1024:.1f} KiB, "
+              f"peak RSS cold/warm: {report['cold']['max_rss_kb']}/{report['warm']['max_rss_kb']} KiB)")
+        print(f"  {'stage (ms)':<16}{'cold p50':>10}{'cold p90':>10}{'warm p50':>10}{'warm p90':>10}")
+        for stage in STAGES:
+            cold = report["cold"][stage]
+            warm = report["warm"][stage]
+            print(f"  {stage:<16}{cold['p50']:>10.2f}{cold['p90']:>10.2f}{warm['p50']:>10.2f}{warm['p90']:>10.2f}")
+
+    if len(reports) > 1:
+        base = reports[0]
+        print("\nWarm startup vs user phrases (total p50):")
+        for report in reports:
+            ratio = report["warm"]["total"]["p50"] / base["warm"]["total"]["p50"] if base["warm"]["total"]["p50"] else 0
+            print(f"  {report['user_phrases']:>8}  {report['warm']['total']['p50']:>8.2f} ms  x{ratio:.2f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark libpinyin startup, cold and warm")
+    parser.add_argument("--program", default="./bench_startup")
+    parser.add_argument("--data", default="data", help="data directory to copy for each size")
+    parser.add_argument("--runs", type=int, default=10, help="processes per size and cache state")
+    parser.add_argument("--sizes", default="0,1000,10000",
+                        help="comma separated user-dictionary sizes (synthetic phrases) to compare")
+    parser.add_argument("--pinyin", default="nihao", help="input for the first pinyin_guess_candidates")
+    parser.add_argument("--json", metavar="FILE", help="also write the full report as JSON")
+    args = parser.parse_args()
+    try:
+        sizes = [int(size) for size in args.sizes.split(",")]
+    except ValueError:
+        parser.error("--sizes takes comma separated integers")
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+
+    if not os.path.exists(args.program):
+        print(f"Error: {args.program} not found!")
+        print("Please run 'make bench' first to build it.")
+        sys.exit(1)
+    program = os.path.abspath(args.program)
+
+    reports = []
+    for size in sizes:
+        print(f"Measuring {size} user phrases ({args.runs} cold + {args.runs} warm runs)...")
+        reports.append(bench_size(program, args.data, size, args.runs, args.pinyin))
+    print_report(reports)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"\nReport saved to {args.json}")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checkpoints for resumable test runs
+Every few cases the runner's counters, the ids of the finished cases and a
+snapshot of the data directory's user files are written to disk. Details
+kept in memory are appended to a JSON-lines file next to the checkpoint,
+only the ones finished since the last save, so a run writes each detail
+once. Cases train and save, so resuming has to put data/ back into the
+state the last finished case left it in before running the rest.
+
+A checkpoint is only taken between cases. After a crash or Ctrl-C the run
+resumes from the last checkpoint, and any case finished after it runs again.
+"""
+
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import data_files
+
+
+def checkpoint_path(name, shard=None):
+    """Checkpoint file for a run writing name.json; every shard gets its own"""
+    if shard is not None:
+        name += f".shard-{shard.index}of{shard.count}"
+    return f"{name}.checkpoint.json"
+
+
+class Checkpoint:
+    def __init__(self, path, every=10, interval=60.0):
+        self.path = path
+        # Save after this many finished cases or this many seconds, whichever comes first
+        self.every = every
+        self.interval = interval
+        self._pending = 0
+        self._last_save = time.monotonic()
+        self._generation = 0
+        # Details already in the details file; None until this run first saves or loads
+        self._details_written = None
+        self.details_path = f"{path}.details.jsonl"
+
+    def _snapshot_dir(self, generation):
+        return f"{self.path}.data.{generation}"
+
+    def load(self, test_file):
+        """Return the saved state, or None if there is no usable checkpoint"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if state.get("test_file") != test_file:
+            print(f"Ignoring checkpoint {self.path}: it was taken for {state.get('test_file')}")
+            return None
+        self._generation = state["generation"]
+        return state
+
+    def load_details(self, state):
+        """The in-memory details the checkpoint covers, dropping any written after it"""
+        if "details_count" not in state:
+            return state["results"].get("details", [])
+        details = []
+        if state["details_count"]:
+            with open(self.details_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    details.append(json.loads(line))
+                    if len(details) == state["details_count"]:
+                        break
+        with open(self.details_path, 'w', encoding='utf-8') as f:
+            for detail in details:
+                f.write(json.dumps(detail, ensure_ascii=False) + "\n")
+        self._details_written = len(details)
+        return details
+
+    def restore_data(self, state, data_dir):
+        """Put data_dir's user files back into their checkpointed state"""
+        data_files.copy_user_files(self._snapshot_dir(state["generation"]), data_dir)
+
+    def save(self, test_file, results, done_ids, data_dir):
+        """Snapshot data_dir, then atomically point the checkpoint at it"""
+        generation = self._generation + 1
+        data_files.copy_user_files(data_dir, self._snapshot_dir(generation))
+
+        # New details first: lines past details_count are dropped on load
+        details = results.get("details", [])
+        mode = 'w' if self._details_written is None else 'a'
+        with open(self.details_path, mode, encoding='utf-8') as f:
+            for detail in details[self._details_written or 0:]:
+                f.write(json.dumps(detail, ensure_ascii=False) + "\n")
+        self._details_written = len(details)
+
+        state = {
+            "test_file": test_file,
+            "generation": generation,
+            "saved_at": time.time(),
+            "done_ids": sorted(done_ids),
+            "results": {key: value for key, value in results.items() if key != "details"},
+            "details_count": len(details)
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+        # Only drop old snapshots (including any left by an earlier run)
+        # once nothing points at them any more
+        self._generation = generation
+        self._remove_snapshots(keep=self._snapshot_dir(generation))
+        self._pending = 0
+        self._last_save = time.monotonic()
+
+    def update(self, test_file, results, done_ids, data_dir):
+        """Count one finished case and save if a checkpoint is due"""
+        self._pending += 1
+        if self._pending >= self.every or time.monotonic() - self._last_save >= self.interval:
+            self.save(test_file, results, done_ids, data_dir)
+
+    def _remove_snapshots(self, keep=None):
+        for directory in glob.glob(glob.escape(self.path) + ".data.*"):
+            if directory != keep:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def remove(self):
+        """Delete the checkpoint once the run has completed"""
+        self._remove_snapshots()
+        for path in (self.path, self.details_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def resume_run(runner):
+    """
+    Load runner.checkpoint back into runner
+    Restores the counters (and in-memory details), the data directory and,
+    when streaming, drops stream records of cases the checkpoint does not
+    cover. Returns the set of finished case ids.
+    """
+    checkpoint = runner.checkpoint
+    state = checkpoint.load(runner.test_file)
+    if state is None:
+        print(f"No checkpoint at {checkpoint.path}; starting from the beginning")
+        if runner.stream is not None:
+            runner.stream.truncate_to(())
+        return set()
+
+    done = set(state["done_ids"])
+    runner.results.update(state["results"])
+    runner.results["details"] = checkpoint.load_details(state)
+    checkpoint.restore_data(state, os.path.join(runner.cwd or ".", "data"))
+    if runner.stream is not None:
+        runner.stream.truncate_to(done)
+    print(f"Resuming from {checkpoint.path}: {len(done)} case(s) already finished")
+    return done
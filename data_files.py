@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Helpers for the libpinyin data directory
+test_pinyin uses data/ as both system and user directory. The system
+dictionaries never change at run time; the user files (user.conf,
+user_bigram.db, user phrase tables and the *.dbin deltas written by
+pinyin_save) change after every trained sentence.
+"""
+
+import fcntl
+import fnmatch
+import hashlib
+import os
+import shutil
+
+USER_FILE_PATTERNS = ("user*", "*.dbin")
+
+# ioctl to share a file's extents (btrfs, XFS, ...), _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+
+def is_user_file(name):
+    """True for files that pinyin_save rewrites"""
+    return any(fnmatch.fnmatch(name, pattern) for pattern in USER_FILE_PATTERNS)
+
+
+def list_files(data_dir, user=True):
+    """Sorted names of the user (or, with user=False, system) files in data_dir"""
+    names = []
+    for name in os.listdir(data_dir):
+        if os.path.isfile(os.path.join(data_dir, name)) and is_user_file(name) == user:
+            names.append(name)
+    return sorted(names)
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_files(data_dir, names):
+    """Map each file name to the sha256 of its contents"""
+    return {name: hash_file(os.path.join(data_dir, name)) for name in names}
+
+
+def fingerprint(hashes):
+    """Combine a name -> sha256 mapping into one digest"""
+    digest = hashlib.sha256()
+    for name in sorted(hashes):
+        digest.update(f"{name}\0{hashes[name]}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def clone_file(src, dst):
+    """Copy src over dst, as a copy-on-write reflink where the filesystem allows"""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return
+        except OSError:
+            pass
+        shutil.copyfileobj(fsrc, fdst, 1 << 20)
+
+
+def copy_user_files(src_dir, dst_dir):
+    """Make dst_dir's user files an exact copy of src_dir's"""
+    os.makedirs(dst_dir, exist_ok=True)
+    wanted = list_files(src_dir)
+    for name in list_files(dst_dir):
+        if name not in wanted:
+            os.remove(os.path.join(dst_dir, name))
+    for name in wanted:
+        clone_file(os.path.join(src_dir, name), os.path.join(dst_dir, name))
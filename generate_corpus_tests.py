@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generate test cases from a Chinese text corpus
+The corpus is read line by line and split into sentences at anything that
+is not a Chinese character. Each sentence is segmented with
+pinyin_phrase_segment (as extract.cpp does) and every phrase's pinyin is
+taken from libpinyin's own phrase tables, so no hand-written phrase/pinyin
+pairs are needed.
+
+Chunks of lines are segmented by a pool of worker processes, each with its
+own pinyin context, and cases are written in corpus order as the chunks
+come back. Workers never train or save, but like extract.cpp they create
+an empty data/user.conf if there is none. Only a few chunks are in flight
+at a time, so memory does not grow with the corpus, except with --unique,
+which remembers every (prefix, pinyin) it has written.
+
+Output uses the existing schemas: "phrase" cases look like test_cases.json
+(each phrase, with the phrase before it as prefix), "long" cases look like
+long_sentence_tests.json (whole sentences). Write .jsonl for large suites.
+
+Usage: python3 generate_corpus_tests.py corpus.txt [-o corpus_tests.jsonl] [--schema phrase|long]
+"""
+
+import collections
+import json
+import multiprocessing
+import os
+import re
+import sys
+from multiprocessing import util
+
+import pinyin_binding as pb
+from suite_file import write_jsonl
+
+SCHEMAS = ("phrase", "long")
+
+# Runs of CJK Unified Ideographs (and Ext. A); punctuation, latin and digits end a sentence
+SENTENCE_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+")
+TONE_RE = re.compile(r"[0-9]")
+
+_context = None
+_instance = None
+
+
+def iter_chunks(path, chunk_lines):
+    """Yield lists of up to chunk_lines corpus lines"""
+    chunk = []
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            chunk.append(line)
+            if len(chunk) == chunk_lines:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def typed_syllable(text):
+    """A table syllable as typed: no tone digit, ü as v"""
+    return TONE_RE.sub("", text).replace("ü", "v").lower()
+
+
+def _init_worker(data_dir):
+    global _context, _instance
+    # Like extract.cpp: an empty user.conf keeps libpinyin from warning
+    user_conf = os.path.join(data_dir, "user.conf")
+    if not os.path.exists(user_conf):
+        open(user_conf, 'w').close()
+    _context = pb.pinyin_init(data_dir, data_dir)
+    if not _context:
+        raise RuntimeError(f"Failed to initialize pinyin context from {data_dir}")
+    _instance = pb.pinyin_alloc_instance(_context)
+    # Pool workers leave via os._exit(), so atexit would not fire
+    util.Finalize(None, _free_worker, exitpriority=10)
+
+
+def _free_worker():
+    global _context, _instance
+    if _instance:
+        pb.pinyin_free_instance(_instance)
+    pb.pinyin_fini(_context)
+    _context = _instance = None
+
+
+def segment_sentence(sentence):
+    """[(phrase, pinyin)] for sentence; pinyin is None where the tables have no pronunciation"""
+    if not pb.pinyin_phrase_segment(_instance, sentence):
+        return []
+    phrases = []
+    for i in range(pb.pinyin_get_n_phrase(_instance)):
+        token = pb.pinyin_get_phrase_token(_instance, i)
+        if token is None:
+            continue
+        phrase = pb.pinyin_token_get_phrase(_instance, token)
+        if not phrase:
+            continue
+        # The first pronunciation; polyphonic phrases keep their others out of the suite
+        syllables = pb.shim_token_get_pinyin(_instance, token, 0)
+        pinyin = "".join(typed_syllable(s) for s in syllables) if syllables else None
+        phrases.append((phrase, pinyin))
+    return phrases
+
+
+def segment_chunk(lines):
+    """Segmented sentences of a chunk of corpus lines"""
+    sentences = []
+    for line in lines:
+        for sentence in SENTENCE_RE.findall(line):
+            phrases = segment_sentence(sentence)
+            if phrases:
+                sentences.append(phrases)
+    pb.pinyin_reset(_instance)
+    return sentences
+
+
+def iter_segmented(path, data_dir="data", jobs=None, chunk_lines=1000):
+    """Yield segmented sentences of the corpus in order, chunks segmented in parallel"""
+    jobs = jobs or os.cpu_count() or 1
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(data_dir,)) as pool:
+        # Pool.imap would read the whole corpus ahead; keep a bounded window instead
+        pending = collections.deque()
+        for chunk in iter_chunks(path, chunk_lines):
+            pending.append(pool.apply_async(segment_chunk, (chunk,)))
+            if len(pending) >= jobs * 2:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+        # Let the workers exit on their own so they free their contexts;
+        # leaving the with block terminates them instead
+        pool.close()
+        pool.join()
+
+
+def phrase_cases(sentences, min_length=2):
+    """test_cases.json-style cases: each phrase, prefixed by the phrase before it"""
+    for phrases in sentences:
+        prefix = ""
+        for phrase, pinyin in phrases:
+            if pinyin and len(phrase) >= min_length:
+                if prefix:
+                    description = f"With prefix '{prefix}': {phrase}"
+                else:
+                    description = f"Corpus: {phrase}"
+                yield {
+                    "prefix": prefix,
+                    "pinyin": pinyin,
+                    "expected_contains": phrase,
+                    "description": description
+                }
+            # Context only carries over phrases the engine could have produced
+            prefix = phrase if pinyin else ""
+
+
+def long_cases(sentences, min_length=6):
+    """long_sentence_tests.json-style cases: whole sentences of min_length characters or more"""
+    for phrases in sentences:
+        if any(pinyin is None for _, pinyin in phrases):
+            continue
+        sentence = "".join(phrase for phrase, _ in phrases)
+        if len(sentence) < min_length:
+            continue
+        yield {
+            "prefix": "",
+            "pinyin": "".join(pinyin for _, pinyin in phrases),
+            "expected_contains": sentence[:10],  # Check first 10 chars
+            "full_sentence": sentence,
+            "description": f"Long: corpus ({len(sentence)} chars)"
+        }
+
+
+def iter_corpus_cases(path, schema="phrase", data_dir="data", jobs=None, chunk_lines=1000,
+                      min_length=None, unique=False, limit=None):
+    """Yield numbered test cases generated from the corpus at path"""
+    sentences = iter_segmented(path, data_dir, jobs, chunk_lines)
+    if schema == "long":
+        cases = long_cases(sentences, min_length or 6)
+    else:
+        cases = phrase_cases(sentences, min_length or 2)
+
+    # Grows with the number of distinct cases written
+    seen = set()
+    case_id = 0
+    for test_case in cases:
+        if unique:
+            key = (test_case["prefix"], test_case["pinyin"])
+            if key in seen:
+                continue
+            seen.add(key)
+        case_id += 1
+        yield {"id": case_id, **test_case}
+        if limit and case_id >= limit:
+            break
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate test cases from a Chinese text corpus")
+    parser.add_argument("corpus", help="UTF-8 text file")
+    parser.add_argument("-o", "--output", default="corpus_tests.jsonl",
+                        help="output suite, .jsonl (streamed) or .json (default: corpus_tests.jsonl)")
+    parser.add_argument("--schema", choices=SCHEMAS, default="phrase",
+                        help="phrase: test_cases.json cases; long: long_sentence_tests.json cases")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="worker processes segmenting the corpus (default: CPU count)")
+    parser.add_argument("--chunk-lines", type=int, default=1000,
+                        help="corpus lines per work unit (default: 1000)")
+    parser.add_argument("--min-length", type=int,
+                        help="shortest phrase/sentence in characters (default: 2 for phrase, 6 for long)")
+    parser.add_argument("--unique", action="store_true",
+                        help="skip cases whose prefix and pinyin already appeared (keeps every one in memory)")
+    parser.add_argument("--limit", type=int, help="stop after this many cases")
+    parser.add_argument("--data", default="data", help="libpinyin data directory (default: data)")
+    args = parser.parse_args()
+    if args.jobs < 1 or args.chunk_lines < 1:
+        parser.error("--jobs and --chunk-lines must be at least 1")
+    if not os.path.exists(args.corpus):
+        print(f"Error: {args.corpus} not found")
+        sys.exit(1)
+
+    cases = iter_corpus_cases(args.corpus, args.schema, args.data, args.jobs, args.chunk_lines,
+                              args.min_length, args.unique, args.limit)
+    if args.output.endswith(".jsonl"):
+        written = write_jsonl(cases, args.output)
+    else:
+        cases = list(cases)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(cases, f, ensure_ascii=False, indent=2)
+        written = len(cases)
+    print(f"Generated {written} {args.schema} test cases from {args.corpus}")
+    print(f"Saved to {args.output}")
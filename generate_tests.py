@@ -4,9 +4,12 @@
 Generate test cases for libpinyin test_pinyin program
 """
 
+import math
 import random
 import json
 
+from suite_file import write_jsonl
+
 # Common Chinese phrases with their pinyin
 test_data = [
     # Basic greetings
@@ -175,96 +178,121 @@ long_phrases = [
     ("我们明天见面吧", "womenmingtianjianmianba"),
 ]
 
-def generate_test_cases(num_tests=200):
-    """Generate test cases for libpinyin"""
-    test_cases = []
-    
-    # Test 1-50: Basic phrases without prefix
-    for i in range(50):
-        phrase, pinyin = random.choice(test_data)
-        test_cases.append({
-            "id": i + 1,
-            "prefix": "",
-            "pinyin": pinyin,
-            "expected_contains": phrase,
-            "description": f"Basic: {phrase}"
-        })
-    
-    # Test 51-100: Phrases with prefix context
-    for i in range(50):
-        prefix = random.choice(prefixes)
-        phrase, pinyin = random.choice(test_data)
-        test_cases.append({
-            "id": i + 51,
-            "prefix": prefix,
-            "pinyin": pinyin,
-            "expected_contains": phrase,
-            "description": f"With prefix '{prefix}': {phrase}"
-        })
-    
-    # Test 101-120: Long phrases
-    for i in range(20):
-        prefix = random.choice(["", "我觉得", "我认为", "我看到"])
-        phrase, pinyin = random.choice(test_data)
-        # Create longer sentences
-        phrase2, pinyin2 = random.choice(test_data)
-        combined = phrase + phrase2
-        combined_pinyin = pinyin + pinyin2
-        if len(combined) <= 15:  # Respect MAX_PHRASE_LENGTH
-            test_cases.append({
-                "id": i + 101,
-                "prefix": prefix,
-                "pinyin": combined_pinyin,
+# Case categories in id order, with their share of the default 200-case suite
+CATEGORIES = [
+    ("basic", 50),   # Basic phrases without prefix
+    ("prefix", 50),  # Phrases with prefix context
+    ("long", 20),    # Long combined phrases
+    ("repeat", 30),  # Repeated inputs (memory test)
+    ("edge", 20),    # Edge cases with potential typos
+    ("mixed", 30),   # Mixed complexity
+]
+
+repeated_phrases = [
+    ("你好", "nihao"),
+    ("谢谢", "xiexie"),
+    ("我爱你", "woaini"),
+    ("吃饭", "chifan"),
+    ("再见", "zaijian"),
+]
+
+long_prefixes = ["", "我觉得", "我认为", "我看到"]
+repeat_prefixes = ["", "我想说", "你知道"]
+mixed_prefixes = prefixes + ["今天我", "我们的", "这个是", "那个是"]
+
+
+def parse_mix(text):
+    """Parse 'basic=50,prefix=50,...' into a CATEGORIES-style list; missing categories get 0"""
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in dict(CATEGORIES):
+            raise ValueError(f"unknown category '{name}' (choose from {', '.join(n for n, _ in CATEGORIES)})")
+        weights[name] = float(weight)
+        if not math.isfinite(weights[name]):
+            raise ValueError(f"weight for '{name}' must be a finite number")
+        if weights[name] < 0:
+            raise ValueError(f"negative weight for '{name}'")
+    if not any(weights.values()):
+        raise ValueError("mix has no positive weight")
+    return [(name, weights.get(name, 0)) for name, _ in CATEGORIES]
+
+
+def category_sizes(count, mix=CATEGORIES):
+    """Split count cases across the categories in proportion to their weights"""
+    total = sum(weight for _, weight in mix)
+    exact = [count * weight / total for _, weight in mix]
+    sizes = [int(share) for share in exact]
+    # Hand the rounding remainder to the largest fractions
+    by_fraction = sorted(range(len(mix)), key=lambda i: exact[i] - sizes[i], reverse=True)
+    for i in by_fraction[:count - sum(sizes)]:
+        sizes[i] += 1
+    return [(name, size) for (name, _), size in zip(mix, sizes)]
+
+
+def _make_case(rng, category, i):
+    """Case i (0-based) of a category block"""
+    if category == "basic":
+        phrase, pinyin = rng.choice(test_data)
+        return {"prefix": "", "pinyin": pinyin, "expected_contains": phrase,
+                "description": f"Basic: {phrase}"}
+    if category == "prefix":
+        prefix = rng.choice(prefixes)
+        phrase, pinyin = rng.choice(test_data)
+        return {"prefix": prefix, "pinyin": pinyin, "expected_contains": phrase,
+                "description": f"With prefix '{prefix}': {phrase}"}
+    if category == "long":
+        prefix = rng.choice(long_prefixes)
+        # Draw again until the combination respects MAX_PHRASE_LENGTH
+        while True:
+            phrase, pinyin = rng.choice(test_data)
+            phrase2, pinyin2 = rng.choice(test_data)
+            combined = phrase + phrase2
+            if len(combined) <= 15:
+                break
+        return {"prefix": prefix, "pinyin": pinyin + pinyin2,
                 "expected_contains": combined[:len(phrase)],  # Just check first part
-                "description": f"Long: {combined}"
-            })
-    
-    # Test 121-150: Repeated inputs (test memory)
-    repeated_phrases = [
-        ("你好", "nihao"),
-        ("谢谢", "xiexie"),
-        ("我爱你", "woaini"),
-        ("吃饭", "chifan"),
-        ("再见", "zaijian"),
-    ]
-    for i in range(30):
+                "description": f"Long: {combined}"}
+    if category == "repeat":
         phrase, pinyin = repeated_phrases[i % len(repeated_phrases)]
-        prefix = random.choice(["", "我想说", "你知道"])
-        test_cases.append({
-            "id": i + 121,
-            "prefix": prefix,
-            "pinyin": pinyin,
-            "expected_contains": phrase,
-            "description": f"Repeat test: {phrase}"
-        })
-    
-    # Test 151-170: Edge cases with typos
-    for i in range(20):
+        prefix = rng.choice(repeat_prefixes)
+        return {"prefix": prefix, "pinyin": pinyin, "expected_contains": phrase,
+                "description": f"Repeat test: {phrase}"}
+    if category == "edge":
         if i < len(long_phrases):
             phrase, pinyin = long_phrases[i]
         else:
-            phrase, pinyin = random.choice(test_data)
-        test_cases.append({
-            "id": i + 151,
-            "prefix": "",
-            "pinyin": pinyin,
-            "expected_contains": None,  # May fail, that's ok
-            "description": f"Edge case: {pinyin}"
-        })
-    
-    # Test 171-200: Mixed complexity
-    for i in range(30):
-        prefix = random.choice(prefixes + ["今天我", "我们的", "这个是", "那个是"])
-        phrase, pinyin = random.choice(test_data)
-        test_cases.append({
-            "id": i + 171,
-            "prefix": prefix,
-            "pinyin": pinyin,
-            "expected_contains": phrase,
-            "description": f"Mixed: prefix='{prefix}', phrase={phrase}"
-        })
-    
-    return test_cases
+            phrase, pinyin = rng.choice(test_data)
+        return {"prefix": "", "pinyin": pinyin,
+                "expected_contains": None,  # May fail, that's ok
+                "description": f"Edge case: {pinyin}"}
+    prefix = rng.choice(mixed_prefixes)
+    phrase, pinyin = rng.choice(test_data)
+    return {"prefix": prefix, "pinyin": pinyin, "expected_contains": phrase,
+            "description": f"Mixed: prefix='{prefix}', phrase={phrase}"}
+
+
+def iter_test_cases(num_tests=200, seed=None, mix=CATEGORIES):
+    """
+    Yield num_tests test cases one at a time
+    Categories come in contiguous id blocks, sized by category_sizes(), so
+    the default is the classic 1-50 basic, 51-100 prefix, ... layout. The
+    same seed always gives the same cases.
+    """
+    rng = random.Random(seed)
+    case_id = 1
+    for category, size in category_sizes(num_tests, mix):
+        for i in range(size):
+            test_case = {"id": case_id}
+            test_case.update(_make_case(rng, category, i))
+            yield test_case
+            case_id += 1
+
+
+def generate_test_cases(num_tests=200, seed=None, mix=CATEGORIES):
+    """Generate test cases for libpinyin"""
+    return list(iter_test_cases(num_tests, seed, mix))
 
 def save_test_cases(test_cases, filename="test_cases.json"):
     """Save test cases to JSON file"""
@@ -273,14 +301,41 @@ def save_test_cases(test_cases, filename="test_cases.json"):
     print(f"Generated {len(test_cases)} test cases and saved to {filename}")
 
 if __name__ == "__main__":
-    test_cases = generate_test_cases(200)
-    save_test_cases(test_cases)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate test cases for test_pinyin")
+    parser.add_argument("--count", type=int, default=200,
+                        help="number of test cases (default: 200)")
+    parser.add_argument("--seed", type=int,
+                        help="random seed; the same seed gives the same suite (default: a new one, printed)")
+    parser.add_argument("--mix", metavar="CAT=W,...",
+                        help="category weights, e.g. basic=1,long=3 (categories: "
+                             + ", ".join(name for name, _ in CATEGORIES) + ")")
+    parser.add_argument("--jsonl", action="store_true",
+                        help="write JSON Lines, streaming cases out as they are generated")
+    parser.add_argument("-o", "--output",
+                        help="output file (default: test_cases.json, or test_cases.jsonl with --jsonl)")
+    args = parser.parse_args()
+    if args.count < 0:
+        parser.error("--count must not be negative")
+    try:
+        mix = parse_mix(args.mix) if args.mix else CATEGORIES
+    except ValueError as e:
+        parser.error(str(e))
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    output = args.output or ("test_cases.jsonl" if args.jsonl else "test_cases.json")
+
+    if args.jsonl:
+        written = write_jsonl(iter_test_cases(args.count, seed, mix), output)
+        print(f"Generated {written} test cases and saved to {output}")
+    else:
+        save_test_cases(generate_test_cases(args.count, seed, mix), output)
+    print(f"Seed: {seed}")
     
     # Print summary
     print("\nTest Case Summary:")
-    print(f"  1-50:   Basic phrases without prefix")
-    print(f"  51-100: Phrases with prefix context")
-    print(f"  101-120: Long combined phrases")
-    print(f"  121-150: Repeated inputs (memory test)")
-    print(f"  151-170: Edge cases with potential typos")
-    print(f"  171-200: Mixed complexity tests")
+    first = 1
+    for category, size in category_sizes(args.count, mix):
+        if size:
+            print(f"  {first}-{first + size - 1}: {category} ({size})")
+        first += size
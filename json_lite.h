@@ -0,0 +1,318 @@
+/*
+ *  Minimal JSON reader/writer for test_pinyin
+ *
+ *  Just enough JSON for the test suites (--batch) and the event protocol
+ *  (--protocol=jsonl): a recursive-descent parser into Value and a string
+ *  quoter. UTF-8 text is passed through unchanged.
+ */
+
+#ifndef JSON_LITE_H
+#define JSON_LITE_H
+
+#include <stdexcept>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string>
+#include <utility>
+#include <vector>
+
+namespace json_lite {
+
+struct Value {
+    enum Type { NUL, BOOL, NUMBER, STRING, ARRAY, OBJECT };
+
+    Type type = NUL;
+    bool boolean = false;
+    double number = 0;
+    std::string text;       // STRING value, or the literal of a NUMBER
+    std::vector<Value> items;
+    std::vector<std::pair<std::string, Value>> members;
+
+    // Member of an OBJECT, or nullptr if absent (or not an object)
+    const Value* get(const std::string& key) const
+    {
+        if(type != OBJECT){
+            return nullptr;
+        }
+        for(const auto& member : members){
+            if(member.first == key){
+                return &member.second;
+            }
+        }
+        return nullptr;
+    }
+};
+
+class Parser {
+public:
+    explicit Parser(const std::string& input) : input_(input), pos_(0) {}
+
+    Value parse_document()
+    {
+        Value value = parse_value();
+        skip_space();
+        if(pos_ != input_.size()){
+            fail("trailing characters");
+        }
+        return value;
+    }
+
+private:
+    const std::string& input_;
+    size_t pos_;
+
+    [[noreturn]] void fail(const char* what)
+    {
+        throw std::runtime_error(std::string("JSON error at offset ") + std::to_string(pos_) + ": " + what);
+    }
+
+    void skip_space()
+    {
+        while(pos_ < input_.size() && (input_[pos_] == ' ' || input_[pos_] == '\t' ||
+                                       input_[pos_] == '\n' || input_[pos_] == '\r')){
+            ++pos_;
+        }
+    }
+
+    bool consume(char expected)
+    {
+        skip_space();
+        if(pos_ < input_.size() && input_[pos_] == expected){
+            ++pos_;
+            return true;
+        }
+        return false;
+    }
+
+    void expect_literal(const char* literal)
+    {
+        for(const char* p = literal; *p; ++p, ++pos_){
+            if(pos_ >= input_.size() || input_[pos_] != *p){
+                fail("invalid literal");
+            }
+        }
+    }
+
+    Value parse_value()
+    {
+        skip_space();
+        if(pos_ >= input_.size()){
+            fail("unexpected end of input");
+        }
+
+        Value value;
+        const char c = input_[pos_];
+        if(c == '{'){
+            ++pos_;
+            value.type = Value::OBJECT;
+            if(consume('}')){
+                return value;
+            }
+            do {
+                skip_space();
+                if(pos_ >= input_.size() || input_[pos_] != '"'){
+                    fail("expected a member name");
+                }
+                std::string key = parse_string();
+                if(!consume(':')){
+                    fail("expected ':'");
+                }
+                value.members.emplace_back(std::move(key), parse_value());
+            } while(consume(','));
+            if(!consume('}')){
+                fail("expected '}'");
+            }
+        }
+        else if(c == '['){
+            ++pos_;
+            value.type = Value::ARRAY;
+            if(consume(']')){
+                return value;
+            }
+            do {
+                value.items.push_back(parse_value());
+            } while(consume(','));
+            if(!consume(']')){
+                fail("expected ']'");
+            }
+        }
+        else if(c == '"'){
+            value.type = Value::STRING;
+            value.text = parse_string();
+        }
+        else if(c == 't'){
+            expect_literal("true");
+            value.type = Value::BOOL;
+            value.boolean = true;
+        }
+        else if(c == 'f'){
+            expect_literal("false");
+            value.type = Value::BOOL;
+        }
+        else if(c == 'n'){
+            expect_literal("null");
+        }
+        else {
+            const size_t start = pos_;
+            while(pos_ < input_.size() && is_number_char(input_[pos_])){
+                ++pos_;
+            }
+            if(start == pos_){
+                fail("unexpected character");
+            }
+            value.type = Value::NUMBER;
+            value.text = input_.substr(start, pos_ - start);
+            char* end = nullptr;
+            value.number = strtod(value.text.c_str(), &end);
+            if(*end != '\0'){
+                fail("invalid number");
+            }
+        }
+        return value;
+    }
+
+    static bool is_number_char(char c)
+    {
+        return (c >= '0' && c <= '9') || c == '-' || c == '+' || c == '.' || c == 'e' || c == 'E';
+    }
+
+    unsigned parse_hex4()
+    {
+        if(pos_ + 4 > input_.size()){
+            fail("short \\u escape");
+        }
+        unsigned code = 0;
+        for(int i = 0; i < 4; ++i){
+            const char h = input_[pos_++];
+            code <<= 4;
+            if(h >= '0' && h <= '9') code |= h - '0';
+            else if(h >= 'a' && h <= 'f') code |= h - 'a' + 10;
+            else if(h >= 'A' && h <= 'F') code |= h - 'A' + 10;
+            else fail("invalid \\u escape");
+        }
+        return code;
+    }
+
+    static void append_utf8(std::string& out, unsigned code)
+    {
+        if(code < 0x80){
+            out += static_cast<char>(code);
+        }
+        else if(code < 0x800){
+            out += static_cast<char>(0xC0 | (code >> 6));
+            out += static_cast<char>(0x80 | (code & 0x3F));
+        }
+        else if(code < 0x10000){
+            out += static_cast<char>(0xE0 | (code >> 12));
+            out += static_cast<char>(0x80 | ((code >> 6) & 0x3F));
+            out += static_cast<char>(0x80 | (code & 0x3F));
+        }
+        else {
+            out += static_cast<char>(0xF0 | (code >> 18));
+            out += static_cast<char>(0x80 | ((code >> 12) & 0x3F));
+            out += static_cast<char>(0x80 | ((code >> 6) & 0x3F));
+            out += static_cast<char>(0x80 | (code & 0x3F));
+        }
+    }
+
+    std::string parse_string()
+    {
+        ++pos_;  // opening quote
+        std::string out;
+        while(true){
+            if(pos_ >= input_.size()){
+                fail("unterminated string");
+            }
+            const char c = input_[pos_++];
+            if(c == '"'){
+                return out;
+            }
+            if(c != '\\'){
+                out += c;
+                continue;
+            }
+            if(pos_ >= input_.size()){
+                fail("unterminated escape");
+            }
+            const char e = input_[pos_++];
+            switch(e){
+            case '"': out += '"'; break;
+            case '\\': out += '\\'; break;
+            case '/': out += '/'; break;
+            case 'b': out += '\b'; break;
+            case 'f': out += '\f'; break;
+            case 'n': out += '\n'; break;
+            case 'r': out += '\r'; break;
+            case 't': out += '\t'; break;
+            case 'u': {
+                unsigned code = parse_hex4();
+                // Characters outside the BMP arrive as a surrogate pair;
+                // half a pair would encode to invalid UTF-8
+                if(code >= 0xD800 && code < 0xDC00){
+                    if(pos_ + 1 >= input_.size() || input_[pos_] != '\\' || input_[pos_ + 1] != 'u'){
+                        fail("unpaired high surrogate");
+                    }
+                    pos_ += 2;
+                    const unsigned low = parse_hex4();
+                    if(low < 0xDC00 || low > 0xDFFF){
+                        fail("invalid low surrogate");
+                    }
+                    code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00);
+                }
+                else if(code >= 0xDC00 && code < 0xE000){
+                    fail("unpaired low surrogate");
+                }
+                append_utf8(out, code);
+                break;
+            }
+            default:
+                fail("invalid escape");
+            }
+        }
+    }
+};
+
+inline Value parse(const std::string& input)
+{
+    return Parser(input).parse_document();
+}
+
+inline std::string quote(const std::string& text)
+{
+    std::string quoted = "\"";
+    for(const char ch : text){
+        const unsigned char c = static_cast<unsigned char>(ch);
+        if(c == '"' || c == '\\'){
+            quoted += '\\';
+            quoted += ch;
+        }
+        else if(c == '\n'){
+            quoted += "\\n";
+        }
+        else if(c < 0x20){
+            char escaped[8];
+            snprintf(escaped, sizeof(escaped), "\\u%04x", c);
+            quoted += escaped;
+        }
+        else {
+            quoted += ch;  // UTF-8 passes through unchanged
+        }
+    }
+    quoted += '"';
+    return quoted;
+}
+
+// Re-serialize a scalar (for echoing case ids back)
+inline std::string dump_scalar(const Value& value)
+{
+    switch(value.type){
+    case Value::STRING: return quote(value.text);
+    case Value::NUMBER: return value.text;
+    case Value::BOOL: return value.boolean ? "true" : "false";
+    default: return "null";
+    }
+}
+
+}  // namespace json_lite
+
+#endif  // JSON_LITE_H
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Latency percentiles for test results
+Every result carries its wall time as "duration"; results from prompt-aware
+runs (run_tests.py --session, run_multi_selection_tests.py --async) also
+carry per-step "timings". This summarizes both as p50/p90/p99/max for the
+whole suite and per category.
+
+Usage: python3 latency.py results.json [more results files...] [--json]
+"""
+
+import json
+import math
+import re
+
+PERCENTILES = (50, 90, 99)
+STEPS = ("first_candidates", "choose", "save")
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(values):
+    values = sorted(values)
+    summary = {"count": len(values)}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = percentile(values, p)
+    summary["max"] = values[-1]
+    return summary
+
+
+def description_category(detail):
+    """'Basic: 香蕉' -> 'Basic', "Long with prefix '我觉得': ..." -> 'Long with prefix'"""
+    description = detail.get("description", "")
+    if ":" not in description:
+        return None
+    return re.sub(r"\s*'[^']*'", "", description.split(":", 1)[0]).strip()
+
+
+def step_category(detail):
+    if "selections" in detail:
+        return f"{len(detail['selections'])}-step"
+    if "rounds" in detail:
+        # rounds holds the round results, a single error entry for a case
+        # that stopped early; results from before round_count only have that
+        return f"{detail.get('round_count', len(detail['rounds']))}-round"
+    return None
+
+
+def collect(details):
+    """Gather duration and step samples, grouped by metric and category"""
+    samples = {}
+
+    def add(metric, category, value):
+        samples.setdefault(metric, {}).setdefault(category, []).append(value)
+
+    for detail in details:
+        # A cache hit's duration is the lookup, not test_pinyin
+        if detail.get("cached") or "duration" not in detail:
+            continue
+        categories = ["all", description_category(detail), step_category(detail)]
+        categories = [category for category in categories if category]
+        for category in categories:
+            add("case", category, detail["duration"])
+
+        timings = detail.get("timings") or {}
+        for step in STEPS:
+            values = timings.get(step)
+            if values is None:
+                continue
+            for value in (values if isinstance(values, list) else [values]):
+                for category in categories:
+                    add(step, category, value)
+    return samples
+
+
+def latency_report(details):
+    """metric -> category -> summary dict"""
+    return {metric: {category: summarize(values) for category, values in by_category.items()}
+            for metric, by_category in collect(details).items()}
+
+
+def print_latency(details):
+    """Print the latency table for an iterable of result details"""
+    report = latency_report(details)
+    if not report:
+        return
+
+    print(f"\n{'=' * 80}")
+    print("Latency (ms):")
+    print(f"{'=' * 80}")
+    header = "".join(f"{name:>9s}" for name in ["count"] + [f"p{p}" for p in PERCENTILES] + ["max"])
+    for metric in ("case",) + STEPS:
+        if metric not in report:
+            continue
+        print(f"\n{metric + ':':32s}{header}")
+        by_category = report[metric]
+        # Suite-wide line first, then categories alphabetically
+        for category in ["all"] + sorted(c for c in by_category if c != "all"):
+            summary = by_category[category]
+            cells = f"{summary['count']:9d}" + "".join(
+                f"{summary[key] * 1000:9.1f}" for key in [f"p{p}" for p in PERCENTILES] + ["max"])
+            print(f"  {category[:30]:30s}{cells}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from merge_results import load_results
+
+    parser = argparse.ArgumentParser(description="Latency percentiles of test results")
+    parser.add_argument("files", nargs="+", help="results files (.json or --stream .jsonl)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON (seconds)")
+    args = parser.parse_args()
+
+    details = []
+    for path in args.files:
+        details.extend(load_results(path)[0]["details"])
+
+    if args.json:
+        json.dump(latency_report(details), sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_latency(details)
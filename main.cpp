@@ -23,43 +23,335 @@
 #endif
 
 #include "pinyin.h"
+#include "json_lite.h"
+#include <ctype.h>
+#include <errno.h>
+#include <limits.h>
+#include <poll.h>
+#include <signal.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <unistd.h>
+#include <chrono>
+#include <cmath>
+#include <exception>
+#include <fstream>
+#include <sstream>
 #include <string>
 #include <vector>
 
+using json_lite::quote;
+
 const int USER_DICTIONARY_INDEX = 7;
 const int USER_PHRASE_FREQUENCY = 100;
 const bool REMEMBER_EVERY_INPUT = true;  // Match ibus-libpinyin behavior
 
-bool read_stdin(const char* prompt, std::string &input)
+// --protocol=text (default) prints for humans; --protocol=jsonl prints one
+// JSON object per line for the test runners (see protocol.py)
+enum OutputMode { OUTPUT_TEXT, OUTPUT_JSONL };
+OutputMode output_mode = OUTPUT_TEXT;
+
+// Candidates shown per step (--max-candidates)
+size_t max_candidates = 40;
+
+// --read-only: never train, remember, add phrases or save, and never write
+// to data/, so any number of processes can share one data directory
+bool read_only = false;
+
+// In --batch mode a case's events are collected here instead of printed
+std::string* batch_events = nullptr;
+
+// --window=N: decode input longer than N syllables in overlapping windows of
+// N syllables, so guessing never works on more than one window (0 = off)
+size_t window_syllables = 0;
+// Longest syllable the windows are cut from ("zhuang", "shuang", "chuang")
+const size_t MAX_SYLLABLE_LETTERS = 6;
+
+// --lazy-sentence: a normal pick only marks the guessed sentence stale
+// instead of guessing it again right away. It is guessed before the NBEST
+// and LONGER candidates offered at offset 0, or pinyin_train. Under
+// DYNAMIC_ADJUST pinyin_guess_candidates at a later offset also reads the
+// sentence, for the token before that offset, and gets the stale one, so
+// candidate order after a pick can differ from eager guessing.
+// sentence_context is the prefix the deferred guess is due with.
+bool lazy_sentence = false;
+bool sentence_stale = false;
+std::string sentence_context;
+
+// --keystroke: the pinyin line is typed one key at a time, each character
+// a key and <BS> a backspace, with the candidates shown after every key
+bool keystroke_mode = false;
+const std::string BACKSPACE_KEY = "<BS>";
+
+// Set when a --window run left a window whose pinyin was incomplete; the
+// instance only holds the last window, so train_and_save cannot see it
+bool left_window_incomplete = false;
+
+// When the user tables are written (--save-policy):
+//   every:N     after every N trained sentences (every:1, the default, saves each one)
+//   interval:T  at most every T seconds, also while waiting for input
+//   idle:T      once input has been quiet for T seconds
+//   shutdown    only on exit (quit, EOF, SIGINT or SIGTERM)
+struct SavePolicy {
+    enum Kind { EVERY, INTERVAL, IDLE, SHUTDOWN };
+    Kind kind = EVERY;
+    unsigned every = 1;
+    double seconds = 0;
+};
+SavePolicy save_policy;
+// Longest interval/idle T whose milliseconds still fit the int poll timeout
+const double MAX_SAVE_SECONDS = INT_MAX / 1000 - 1;
+
+// Context the idle/interval saves in read_line() write; set once in main
+pinyin_context_t* save_context = nullptr;
+// Sentences trained since the last pinyin_save
+unsigned unsaved_sentences = 0;
+std::chrono::steady_clock::time_point last_save = std::chrono::steady_clock::now();
+std::chrono::steady_clock::time_point last_input = std::chrono::steady_clock::now();
+
+// Set by SIGINT/SIGTERM: input stops and main saves on the way out
+volatile sig_atomic_t stop_requested = 0;
+
+void emit_event(const std::string& event)
 {
-    fprintf(stdout, "%s", prompt);
-    fflush(stdout);
+    if(batch_events){
+        if(!batch_events->empty()){
+            *batch_events += ',';
+        }
+        *batch_events += event;
+        return;
+    }
+    fprintf(stdout, "%s\n", event.c_str());
+}
 
-    char *buffer = nullptr;
-    size_t bufsize = 0;
+const char* json_bool(bool value)
+{
+    return value ? "true" : "false";
+}
 
-    ssize_t read = getline(&buffer, &bufsize, stdin);
-    if(read == -1){
-        return false;
+const char* candidate_type_name(lookup_candidate_type_t type)
+{
+    switch(type){
+    case BEST_MATCH_CANDIDATE: return "BEST_MATCH_CANDIDATE";
+    case NORMAL_CANDIDATE: return "NORMAL_CANDIDATE";
+    case ZOMBIE_CANDIDATE: return "ZOMBIE_CANDIDATE";
+    case PREDICTED_BIGRAM_CANDIDATE: return "PREDICTED_BIGRAM_CANDIDATE";
+    case ADDON_CANDIDATE: return "ADDON_CANDIDATE";
+    case LONGER_CANDIDATE: return "LONGER_CANDIDATE";
+    case NBEST_MATCH_CANDIDATE: return "NBEST_MATCH_CANDIDATE";
+    default: return "UNKNOWN";
     }
+}
 
-    input = buffer;
-    free(buffer);
+void report_error(const std::string& message)
+{
+    if(output_mode == OUTPUT_JSONL){
+        emit_event("{\"event\":\"error\",\"message\":" + quote(message) + "}");
+        fflush(stdout);
+    }
+    else {
+        fprintf(stderr, "Error: %s\n", message.c_str());
+    }
+}
 
-    while(!input.empty() && input.back() == '\n'){
-        input.pop_back();
+bool parse_save_policy(const std::string& text, SavePolicy& policy)
+{
+    const size_t colon = text.find(':');
+    const std::string kind = text.substr(0, colon);
+    const std::string value = colon == std::string::npos ? "" : text.substr(colon + 1);
+    char* end = nullptr;
+
+    if(kind == "shutdown" && value.empty()){
+        policy.kind = SavePolicy::SHUTDOWN;
+        return true;
     }
-    return true;
+    if(kind == "every"){
+        // strtoul accepts a sign and wraps "-1" around, so require digits only
+        if(value.empty() || !isdigit(static_cast<unsigned char>(value[0]))){
+            return false;
+        }
+        errno = 0;
+        const unsigned long every = strtoul(value.c_str(), &end, 10);
+        if(*end != '\0' || errno == ERANGE || every == 0 || every > UINT_MAX){
+            return false;
+        }
+        policy.kind = SavePolicy::EVERY;
+        policy.every = every;
+        return true;
+    }
+    if(kind == "interval" || kind == "idle"){
+        const double seconds = strtod(value.c_str(), &end);
+        // strtod also takes "nan" and "inf"
+        if(value.empty() || *end != '\0' || !std::isfinite(seconds) || seconds < 0 || seconds > MAX_SAVE_SECONDS){
+            return false;
+        }
+        policy.kind = kind == "interval" ? SavePolicy::INTERVAL : SavePolicy::IDLE;
+        policy.seconds = seconds;
+        return true;
+    }
+    return false;
+}
+
+double seconds_since(std::chrono::steady_clock::time_point then)
+{
+    return std::chrono::duration<double>(std::chrono::steady_clock::now() - then).count();
+}
+
+void save_user_data(pinyin_context_t* context, const char* reason)
+{
+    const bool saved = pinyin_save(context);
+    if(output_mode == OUTPUT_JSONL){
+        emit_event(std::string("{\"event\":\"saved\",\"success\":") + json_bool(saved) + ",\"reason\":\"" + reason +
+                   "\",\"sentences\":" + std::to_string(unsaved_sentences) + "}");
+    }
+    unsaved_sentences = 0;
+    last_save = std::chrono::steady_clock::now();
+}
+
+// Called after each trained sentence; saves if the policy says so
+void sentence_trained(pinyin_context_t* context)
+{
+    ++unsaved_sentences;
+    if(save_policy.kind == SavePolicy::EVERY && unsaved_sentences >= save_policy.every){
+        save_user_data(context, "every");
+    }
+    else if(save_policy.kind == SavePolicy::INTERVAL && seconds_since(last_save) >= save_policy.seconds){
+        save_user_data(context, "interval");
+    }
+}
+
+// How long read_line() may wait for input before a deferred save is due
+// (milliseconds, -1 for "forever")
+int save_wait_ms()
+{
+    if(!unsaved_sentences || !save_context){
+        return -1;
+    }
+    double remaining;
+    if(save_policy.kind == SavePolicy::INTERVAL){
+        remaining = save_policy.seconds - seconds_since(last_save);
+    }
+    else if(save_policy.kind == SavePolicy::IDLE){
+        remaining = save_policy.seconds - seconds_since(last_input);
+    }
+    else {
+        return -1;
+    }
+    return remaining <= 0 ? 0 : static_cast<int>(remaining * 1000) + 1;
+}
+
+void request_stop(int)
+{
+    stop_requested = 1;
+}
+
+void install_stop_handlers()
+{
+    struct sigaction action;
+    memset(&action, 0, sizeof(action));
+    action.sa_handler = request_stop;
+    sigemptyset(&action.sa_mask);
+    // No SA_RESTART, so a blocked ppoll()/read() returns EINTR right away
+    action.sa_flags = 0;
+    sigaction(SIGINT, &action, nullptr);
+    sigaction(SIGTERM, &action, nullptr);
+}
+
+// Line reader on fd 0. stdio's getline() blocks with no way to time out,
+// and idle/interval saves have to happen while we wait for input.
+std::string stdin_buffer;
+bool stdin_eof = false;
+
+bool read_line(std::string& line)
+{
+    // SIGINT/SIGTERM are blocked from the last stop_requested check until
+    // ppoll() unblocks them atomically, so one arriving in between still
+    // interrupts the wait instead of being noticed only on the next input
+    sigset_t stop_signals;
+    sigemptyset(&stop_signals);
+    sigaddset(&stop_signals, SIGINT);
+    sigaddset(&stop_signals, SIGTERM);
+
+    while(true){
+        // Checked before every line, so a stop is not put off until
+        // input already buffered from a pipe runs out
+        if(stop_requested){
+            return false;
+        }
+        const size_t newline = stdin_buffer.find('\n');
+        if(newline != std::string::npos){
+            line = stdin_buffer.substr(0, newline);
+            stdin_buffer.erase(0, newline + 1);
+            return true;
+        }
+        if(stdin_eof){
+            // A last line without a newline still counts, like getline()
+            if(stdin_buffer.empty()){
+                return false;
+            }
+            line.swap(stdin_buffer);
+            stdin_buffer.clear();
+            return true;
+        }
+
+        sigset_t wait_mask;
+        sigprocmask(SIG_BLOCK, &stop_signals, &wait_mask);
+        if(stop_requested){
+            sigprocmask(SIG_SETMASK, &wait_mask, nullptr);
+            return false;
+        }
+        struct pollfd fd = {STDIN_FILENO, POLLIN, 0};
+        const int wait_ms = save_wait_ms();
+        const struct timespec timeout = {wait_ms / 1000, (wait_ms % 1000) * 1000000L};
+        const int ready = ppoll(&fd, 1, wait_ms < 0 ? nullptr : &timeout, &wait_mask);
+        sigprocmask(SIG_SETMASK, &wait_mask, nullptr);
+        if(ready == 0){
+            save_user_data(save_context, save_policy.kind == SavePolicy::IDLE ? "idle" : "interval");
+            continue;
+        }
+
+        char chunk[4096];
+        const ssize_t got = ready < 0 ? -1 : read(STDIN_FILENO, chunk, sizeof(chunk));
+        if(got < 0){
+            if(errno != EINTR){
+                stdin_eof = true;
+            }
+            continue;
+        }
+        if(got == 0){
+            stdin_eof = true;
+            continue;
+        }
+        stdin_buffer.append(chunk, got);
+        last_input = std::chrono::steady_clock::now();
+    }
+}
+
+bool read_stdin(const char* prompt, std::string &input)
+{
+    if(output_mode == OUTPUT_JSONL){
+        emit_event(std::string("{\"event\":\"prompt\",\"prompt\":") + quote(prompt) + "}");
+    }
+    else {
+        fprintf(stdout, "%s", prompt);
+    }
+    fflush(stdout);
+
+    return read_line(input);
 }
 
-void display_candidates(pinyin_instance_t* instance, size_t max)
+void display_candidates(pinyin_instance_t* instance, size_t start, size_t max)
 {
     guint num = 0;
     pinyin_get_n_candidate(instance, &num);
 
+    std::string event;
+    if(output_mode == OUTPUT_JSONL){
+        event = "{\"event\":\"candidates\",\"start\":" + std::to_string(start) +
+                ",\"total\":" + std::to_string(num) + ",\"candidates\":[";
+    }
+
     for(size_t i = 0; i < std::min<size_t>(num, max); ++i){
         lookup_candidate_t* candidate = nullptr;
         pinyin_get_candidate(instance, i, &candidate);
@@ -70,9 +362,22 @@ void display_candidates(pinyin_instance_t* instance, size_t max)
         lookup_candidate_type_t type;
         pinyin_get_candidate_type(instance, candidate, &type);
 
-        printf("%zu:%s(%d)\t", i, word, static_cast<int>(type));
+        if(output_mode == OUTPUT_JSONL){
+            event += std::string(i ? "," : "") + "{\"index\":" + std::to_string(i) +
+                     ",\"string\":" + quote(word) + ",\"type\":" + std::to_string(static_cast<int>(type)) +
+                     ",\"type_name\":\"" + candidate_type_name(type) + "\"}";
+        }
+        else {
+            printf("%zu:%s(%d)\t", i, word, static_cast<int>(type));
+        }
+    }
+
+    if(output_mode == OUTPUT_JSONL){
+        emit_event(event + "]}");
+    }
+    else {
+        printf("\n");
     }
-    printf("\n");
 }
 
 void add_to_user_dictionary(pinyin_context_t* context, const std::string& phrase, const std::string& pinyin_input)
@@ -84,7 +389,14 @@ void add_to_user_dictionary(pinyin_context_t* context, const std::string& phrase
     // Check phrase length against libpinyin's limit (MAX_PHRASE_LENGTH from novel_types.h)
     glong phrase_length = g_utf8_strlen(phrase.c_str(), -1);
     if(phrase_length >= MAX_PHRASE_LENGTH){
-        fprintf(stdout, "Phrase '%s' too long (%ld chars, max %d). Not added to dictionary.\n", phrase.c_str(), phrase_length, MAX_PHRASE_LENGTH - 1);
+        if(output_mode == OUTPUT_JSONL){
+            emit_event("{\"event\":\"phrase_skipped\",\"phrase\":" + quote(phrase) +
+                       ",\"reason\":\"too_long\",\"length\":" + std::to_string(phrase_length) +
+                       ",\"max\":" + std::to_string(MAX_PHRASE_LENGTH - 1) + "}");
+        }
+        else {
+            fprintf(stdout, "Phrase '%s' too long (%ld chars, max %d). Not added to dictionary.\n", phrase.c_str(), phrase_length, MAX_PHRASE_LENGTH - 1);
+        }
         return;
     }
 
@@ -92,15 +404,75 @@ void add_to_user_dictionary(pinyin_context_t* context, const std::string& phrase
     bool added = pinyin_iterator_add_phrase(iter, phrase.c_str(), pinyin_input.c_str(), USER_PHRASE_FREQUENCY);
     pinyin_end_add_phrases(iter);
 
-    fprintf(stdout, "Added phrase '%s' (pinyin: %s): %s\n", phrase.c_str(), pinyin_input.c_str(), added ? "success" : "failed");
+    if(output_mode == OUTPUT_JSONL){
+        emit_event("{\"event\":\"phrase_added\",\"phrase\":" + quote(phrase) + ",\"pinyin\":" + quote(pinyin_input) +
+                   ",\"success\":" + json_bool(added) + "}");
+    }
+    else {
+        fprintf(stdout, "Added phrase '%s' (pinyin: %s): %s\n", phrase.c_str(), pinyin_input.c_str(), added ? "success" : "failed");
+    }
+}
+
+// The window a --window run is decoding: where it starts in the pinyin
+// input, the sentence committed from the windows before it, and the end of
+// that sentence, which later guesses continue from. Without --window there
+// is one window covering the whole input.
+struct DecodeWindow {
+    size_t offset = 0;
+    std::string committed;
+    std::string context;
+};
+
+// The last MAX_PHRASE_LENGTH characters of text, all that
+// pinyin_guess_sentence_with_prefix looks at
+std::string context_tail(const std::string& text)
+{
+    const glong length = g_utf8_strlen(text.c_str(), -1);
+    if(length <= MAX_PHRASE_LENGTH){
+        return text;
+    }
+    return g_utf8_offset_to_pointer(text.c_str(), length - MAX_PHRASE_LENGTH);
+}
+
+void guess_sentence(pinyin_instance_t* instance, const std::string& context)
+{
+    sentence_stale = false;
+    if(context.empty()){
+        pinyin_guess_sentence(instance);
+    }
+    else {
+        pinyin_guess_sentence_with_prefix(instance, context.c_str());
+    }
+}
+
+// Guess the sentence now, or with --lazy-sentence when it is next read
+void update_sentence(pinyin_instance_t* instance, const std::string& context)
+{
+    if(lazy_sentence){
+        sentence_stale = true;
+        sentence_context = context;
+        return;
+    }
+    guess_sentence(instance, context);
+}
+
+// Catch up on a guess --lazy-sentence put off, before the sentence is read
+void refresh_sentence(pinyin_instance_t* instance)
+{
+    if(sentence_stale){
+        guess_sentence(instance, sentence_context);
+    }
 }
 
-bool select_candidate(pinyin_instance_t* instance, int chosen, size_t* start_pos, std::string& generated_sentence)
+bool select_candidate(pinyin_instance_t* instance, int chosen, size_t* start_pos, std::string& generated_sentence,
+                      const DecodeWindow& window = DecodeWindow())
 {
     guint num = 0;
     pinyin_get_n_candidate(instance, &num);
     if(chosen < 0 || static_cast<guint>(chosen) >= num){
-        fprintf(stderr, "Error: Invalid candidate index %d (valid: 0-%u)\n", chosen, num - 1);
+        char message[96];
+        snprintf(message, sizeof(message), "Invalid candidate index %d (valid: 0-%u)", chosen, num - 1);
+        report_error(message);
         return false;
     }
 
@@ -123,7 +495,7 @@ bool select_candidate(pinyin_instance_t* instance, int chosen, size_t* start_pos
         pinyin_get_candidate_nbest_index(instance, candidate, &index);
 
         // Train if not the top choice (ibus-libpinyin pattern)
-        if(index != 0){
+        if(index != 0 && !read_only){
             pinyin_train(instance, index);
         }
 
@@ -151,72 +523,344 @@ bool select_candidate(pinyin_instance_t* instance, int chosen, size_t* start_pos
         *start_pos = pinyin_choose_candidate(instance, *start_pos, candidate);
 
         // Guess generated_sentence for better next predictions (ibus-libpinyin pattern)
-        pinyin_guess_sentence(instance);
+        update_sentence(instance, window.context);
     }
 
-    fprintf(stdout, "generated_sentence:%s\n", generated_sentence.c_str());
-    fflush(stdout);
+    if(output_mode == OUTPUT_JSONL){
+        emit_event("{\"event\":\"selected\",\"index\":" + std::to_string(chosen) + ",\"string\":" + quote(word) +
+                   ",\"type\":" + std::to_string(static_cast<int>(type)) +
+                   ",\"type_name\":\"" + candidate_type_name(type) + "\",\"start\":" +
+                   std::to_string(window.offset + *start_pos) +
+                   ",\"sentence\":" + quote(window.committed + generated_sentence) + "}");
+    }
+    else {
+        fprintf(stdout, "generated_sentence:%s%s\n", window.committed.c_str(), generated_sentence.c_str());
+    }
+    if(!batch_events){
+        fflush(stdout);
+    }
 
     return true;
 }
 
-std::pair<std::string, bool> process_pinyin_input(pinyin_instance_t* instance, const std::string &prefix_input, const std::string &pinyin_input)
+// Where the answers to choose: come from: stdin, or a --batch case's list
+struct SelectionSource {
+    const std::vector<int>* scripted = nullptr;
+    size_t next = 0;
+    // A scripted case ran out of selections before the sentence was complete
+    bool exhausted = false;
+};
+
+bool next_selection(SelectionSource& source, int& chosen)
 {
-    bool skip_train = false;
-    std::string generated_sentence;
+    if(source.scripted){
+        if(source.next >= source.scripted->size()){
+            source.exhausted = true;
+            report_error("Ran out of selections");
+            return false;
+        }
+        chosen = (*source.scripted)[source.next++];
+        return true;
+    }
 
-    // if(!prefix_input.empty()){
-    //     pinyin_guess_sentence_with_prefix(instance, prefix_input.c_str());
-    // }
+    std::string chosen_str;
+    if(!read_stdin("choose:", chosen_str)){
+        return false;
+    }
 
-    for(size_t start = 0; start < pinyin_input.size();){
-        pinyin_guess_candidates(instance, start, SORT_BY_PHRASE_LENGTH_AND_PINYIN_LENGTH_AND_FREQUENCY);
-        display_candidates(instance, 40); // print first 40 candidates
+    try {
+        chosen = std::stoi(chosen_str);
+    }
+    catch(const std::exception&){
+        // Still aborts like before, but tell a protocol reader why
+        if(output_mode == OUTPUT_JSONL){
+            report_error("Invalid selection '" + chosen_str + "'");
+        }
+        throw;
+    }
+    return true;
+}
+
+// LONGER and NBEST candidates re-match from the beginning of the input
+bool is_restart_candidate(pinyin_instance_t* instance, int chosen)
+{
+    guint num = 0;
+    pinyin_get_n_candidate(instance, &num);
+    if(chosen < 0 || static_cast<guint>(chosen) >= num){
+        return false;
+    }
+
+    lookup_candidate_t* candidate = nullptr;
+    pinyin_get_candidate(instance, chosen, &candidate);
+
+    lookup_candidate_type_t type;
+    pinyin_get_candidate_type(instance, candidate, &type);
+    return type == LONGER_CANDIDATE || type == NBEST_MATCH_CANDIDATE;
+}
+
+bool is_input_complete_pinyin(pinyin_instance_t* instance)
+{
+    size_t n_pinyin = pinyin_get_parsed_input_length(instance);
+    for (size_t i = 0; i < n_pinyin; ++i){
+        ChewingKey* key = nullptr;
+        if(pinyin_get_pinyin_key(instance, i, &key) && key){
+            if(pinyin_get_pinyin_is_incomplete(instance, key)){
+                return false;
+            }
+        }
+    }
+    return true;
+}
+
+// Parse the window of pinyin_input that starts at offset: at most
+// window_syllables syllables, cut at a syllable boundary. Returns its length.
+size_t parse_window(pinyin_instance_t* instance, const std::string& pinyin_input, size_t offset)
+{
+    pinyin_reset(instance);
+    const std::string chunk = pinyin_input.substr(offset, window_syllables * MAX_SYLLABLE_LETTERS);
+    const size_t parsed = pinyin_parse_more_full_pinyins(instance, chunk.c_str());
+
+    size_t end = 0;
+    for(size_t i = 0; i < window_syllables && end < parsed; ++i){
+        size_t right = end;
+        if(!pinyin_get_right_pinyin_offset(instance, end, &right) || right <= end){
+            break;
+        }
+        end = right;
+    }
+    if(end == 0 || end >= chunk.size()){
+        return chunk.size();
+    }
+
+    // Parse again without the letters past the cut, which may have started another syllable
+    pinyin_reset(instance);
+    pinyin_parse_more_full_pinyins(instance, chunk.substr(0, end).c_str());
+    return end;
+}
 
-        std::string chosen_str;
-        if(!read_stdin("choose:", chosen_str)){
+// Syllables of the parsed window from start up to length, counting at most limit
+size_t syllables_after(pinyin_instance_t* instance, size_t start, size_t length, size_t limit)
+{
+    size_t count = 0;
+    for(size_t offset = start; offset < length && count < limit; ++count){
+        size_t right = offset;
+        if(!pinyin_get_right_pinyin_offset(instance, offset, &right) || right <= offset){
             break;
         }
+        offset = right;
+    }
+    return count;
+}
 
-        const int chosen = std::stoi(chosen_str);
+void report_window(const DecodeWindow& window, size_t length)
+{
+    if(output_mode == OUTPUT_JSONL){
+        emit_event("{\"event\":\"window\",\"offset\":" + std::to_string(window.offset) + ",\"length\":" +
+                   std::to_string(length) + ",\"committed\":" + quote(window.committed) + "}");
+    }
+    else {
+        fprintf(stdout, "window:%zu+%zu\n", window.offset, length);
+    }
+}
 
-        guint num = 0;
-        pinyin_get_n_candidate(instance, &num);
+// Split a --keystroke line into keys: single (UTF-8) characters and <BS>
+std::vector<std::string> split_keys(const std::string& line)
+{
+    std::vector<std::string> keys;
+    for(size_t i = 0; i < line.size();){
+        if(line.compare(i, BACKSPACE_KEY.size(), BACKSPACE_KEY) == 0){
+            keys.push_back(BACKSPACE_KEY);
+            i += BACKSPACE_KEY.size();
+            continue;
+        }
+        size_t length = 1;
+        while(i + length < line.size() && (line[i + length] & 0xC0) == 0x80){
+            ++length;
+        }
+        keys.push_back(line.substr(i, length));
+        i += length;
+    }
+    return keys;
+}
 
-        if(chosen >= 0 && static_cast<guint>(chosen) < num){
-            lookup_candidate_t* candidate = nullptr;
-            pinyin_get_candidate(instance, chosen, &candidate);
+// Type line into the instance key by key like an IME does: after every key
+// the input so far is parsed, the sentence guessed and the candidates at
+// offset 0 shown. libpinyin can only parse a whole input, but a key it does
+// not consume leaves the lattice as it was, and then the previous guesses
+// are kept. Returns the input the keys leave, parsed.
+std::string type_keys(pinyin_instance_t* instance, const std::string& line)
+{
+    std::string input;
+    // The part of input libpinyin consumed, which the guesses were made for
+    std::string parsed_input;
+    bool guessed = false;
 
-            lookup_candidate_type_t type;
-            pinyin_get_candidate_type(instance, candidate, &type);
+    for(const std::string& key : split_keys(line)){
+        const auto started = std::chrono::steady_clock::now();
+        if(key != BACKSPACE_KEY){
+            input += key;
+        }
+        else if(!input.empty()){
+            size_t last = input.size() - 1;
+            while(last > 0 && (input[last] & 0xC0) == 0x80){
+                --last;
+            }
+            input.erase(last);
+        }
 
-            // LONGER or NBEST candidates selected after position 0 cause training conflicts
-            // These candidates try to match from the beginning but constraints are already set, skip training for these cases
-            if((type == LONGER_CANDIDATE || type == NBEST_MATCH_CANDIDATE) && start > 0){
-                skip_train = true;
+        bool reused = false;
+        if(input.empty()){
+            pinyin_reset(instance);
+            parsed_input.clear();
+            guessed = false;
+        }
+        else {
+            const size_t parsed = pinyin_parse_more_full_pinyins(instance, input.c_str());
+            reused = guessed && input.compare(0, parsed, parsed_input) == 0 && parsed == parsed_input.size();
+            if(!reused){
+                parsed_input = input.substr(0, parsed);
+                guess_sentence(instance, std::string());
+                pinyin_guess_candidates(instance, 0, SORT_BY_PHRASE_LENGTH_AND_PINYIN_LENGTH_AND_FREQUENCY);
+                guessed = true;
             }
         }
+        const long long elapsed_us = std::chrono::duration_cast<std::chrono::microseconds>(
+            std::chrono::steady_clock::now() - started).count();
 
-        if(!select_candidate(instance, chosen, &start, generated_sentence)){
+        if(output_mode == OUTPUT_JSONL){
+            emit_event("{\"event\":\"key\",\"key\":" + quote(key) + ",\"input\":" + quote(input) +
+                       ",\"parsed\":" + std::to_string(parsed_input.size()) + ",\"reused\":" + json_bool(reused) +
+                       ",\"elapsed_us\":" + std::to_string(elapsed_us) + "}");
+        }
+        else {
+            fprintf(stdout, "key:%s input:%s (%lld us%s)\n", key.c_str(), input.c_str(), elapsed_us,
+                    reused ? ", reused" : "");
+        }
+        if(!input.empty()){
+            display_candidates(instance, 0, max_candidates);
+        }
+    }
+    return input;
+}
+
+// --window: decode pinyin_input one window at a time. Selections work as in
+// process_pinyin_input, at offsets within the window. Once no more than half
+// a window of syllables is left after the selected text, that text is
+// committed and the next window is parsed from where it ends and guessed
+// with the committed text as prefix, so parsing and guessing never cover
+// more than window_syllables syllables however long the input is.
+std::pair<std::string, bool> process_pinyin_windowed(pinyin_instance_t* instance, const std::string& pinyin_input,
+                                                     SelectionSource& source)
+{
+    bool skip_train = false;
+    // Sentence of the current window; earlier windows' is in window.committed
+    std::string generated_sentence;
+    DecodeWindow window;
+    const size_t overlap = window_syllables / 2;
+    left_window_incomplete = false;
+    sentence_stale = false;
+
+    size_t length = parse_window(instance, pinyin_input, 0);
+    report_window(window, length);
+
+    for(size_t start = 0; window.offset + start < pinyin_input.size();){
+        const bool last = window.offset + length >= pinyin_input.size();
+        if(!last && start > 0 && syllables_after(instance, start, length, overlap + 1) <= overlap){
+            // The selections so far are final. The window is not trained on
+            // its own: past start it only holds a guess, and pinyin_train
+            // would learn that too. train_and_save still remembers the
+            // whole sentence.
+            if(!is_input_complete_pinyin(instance)){
+                left_window_incomplete = true;
+            }
+            window.committed += generated_sentence;
+            window.context = context_tail(window.committed);
+            window.offset += start;
+            generated_sentence.clear();
+
+            length = parse_window(instance, pinyin_input, window.offset);
+            update_sentence(instance, window.context);
+            report_window(window, length);
+            start = 0;
+            continue;
+        }
+
+        if(start == 0){
+            refresh_sentence(instance);
+        }
+        pinyin_guess_candidates(instance, start, SORT_BY_PHRASE_LENGTH_AND_PINYIN_LENGTH_AND_FREQUENCY);
+        display_candidates(instance, window.offset + start, max_candidates);
+
+        int chosen = 0;
+        if(!next_selection(source, chosen)){
+            break;
+        }
+        // Within a window, like process_pinyin_input does for the whole input
+        if(start > 0 && is_restart_candidate(instance, chosen)){
+            skip_train = true;
+        }
+
+        if(!select_candidate(instance, chosen, &start, generated_sentence, window)){
             continue;
         }
     }
 
-    return std::make_pair(generated_sentence, skip_train);
+    return std::make_pair(window.committed + generated_sentence, skip_train);
 }
 
-bool is_input_complete_pinyin(pinyin_instance_t* instance)
+std::pair<std::string, bool> process_pinyin_input(pinyin_instance_t* instance, const std::string &prefix_input,
+                                                  const std::string &pinyin_input, SelectionSource& source)
 {
-    size_t n_pinyin = pinyin_get_parsed_input_length(instance);
-    for (size_t i = 0; i < n_pinyin; ++i){
-        ChewingKey* key = nullptr;
-        if(pinyin_get_pinyin_key(instance, i, &key) && key){
-            if(pinyin_get_pinyin_is_incomplete(instance, key)){
-                return false;
+    if(window_syllables){
+        return process_pinyin_windowed(instance, pinyin_input, source);
+    }
+
+    bool skip_train = false;
+    std::string generated_sentence;
+    // Nothing is pending from the previous input
+    sentence_stale = false;
+
+    // --keystroke input was parsed key by key already
+    if(!keystroke_mode){
+        pinyin_parse_more_full_pinyins(instance, pinyin_input.c_str());
+    }
+
+    // if(!prefix_input.empty()){
+    //     pinyin_guess_sentence_with_prefix(instance, prefix_input.c_str());
+    // }
+
+    // After the last key type_keys has guessed and shown offset 0 already
+    bool shown = keystroke_mode;
+    for(size_t start = 0; start < pinyin_input.size();){
+        if(shown){
+            shown = false;
+        }
+        else {
+            // NBEST and LONGER candidates, offered only at offset 0, come from the guessed sentence
+            if(start == 0){
+                refresh_sentence(instance);
             }
+            pinyin_guess_candidates(instance, start, SORT_BY_PHRASE_LENGTH_AND_PINYIN_LENGTH_AND_FREQUENCY);
+            display_candidates(instance, start, max_candidates);
+        }
+
+        int chosen = 0;
+        if(!next_selection(source, chosen)){
+            break;
+        }
+
+        // LONGER or NBEST candidates selected after position 0 cause training conflicts
+        // These candidates try to match from the beginning but constraints are already set, skip training for these cases
+        if(start > 0 && is_restart_candidate(instance, chosen)){
+            skip_train = true;
+        }
+
+        if(!select_candidate(instance, chosen, &start, generated_sentence)){
+            continue;
         }
     }
-    return true;
+
+    return std::make_pair(generated_sentence, skip_train);
 }
 
 void train_and_save(pinyin_context_t* context, pinyin_instance_t* instance,
@@ -227,12 +871,20 @@ void train_and_save(pinyin_context_t* context, pinyin_instance_t* instance,
     if(generated_sentence.empty()){
         return;
     }
+    if(read_only){
+        if(output_mode == OUTPUT_JSONL){
+            emit_event("{\"event\":\"trained\",\"sentence\":" + quote(generated_sentence) +
+                       ",\"skipped\":true,\"read_only\":true}");
+        }
+        return;
+    }
 
     // LONGER/NBEST candidates selected after position 0 are special cases
     // They try to re-match from beginning which conflicts with existing constraints
     // Do NOT call train() or remember_user_input() for them
     if(!skip_train){
         // Train bigram model with user selections
+        refresh_sentence(instance);
         pinyin_train(instance, 0);
 
         // Remember user input - matches ibus-libpinyin behavior
@@ -240,37 +892,269 @@ void train_and_save(pinyin_context_t* context, pinyin_instance_t* instance,
             pinyin_remember_user_input(instance, generated_sentence.c_str(), -1);
         }
     }
+    if(output_mode == OUTPUT_JSONL){
+        emit_event("{\"event\":\"trained\",\"sentence\":" + quote(generated_sentence) +
+                   ",\"skipped\":" + json_bool(skip_train) + "}");
+    }
 
     // Add complete phrases to user dictionary for direct lookup
     // Check if input is complete pinyin (before selections modify state)
-    if(is_input_complete_pinyin(instance)){
+    if(!left_window_incomplete && is_input_complete_pinyin(instance)){
         add_to_user_dictionary(context, generated_sentence, pinyin_input);
     }
+    else if(output_mode == OUTPUT_JSONL){
+        emit_event("{\"event\":\"phrase_skipped\",\"phrase\":" + quote(generated_sentence) +
+                   ",\"reason\":\"incomplete_pinyin\"}");
+    }
     else {
         fprintf(stdout, "Skipped adding phrase '%s' - incomplete pinyin input\n", generated_sentence.c_str());
     }
 
     // Log what we're learning
     if(!prefix_input.empty()){
-        fprintf(stdout, "Learning: '%s' → '%s'\n", prefix_input.c_str(), generated_sentence.c_str());
+        if(output_mode == OUTPUT_JSONL){
+            emit_event("{\"event\":\"learning\",\"prefix\":" + quote(prefix_input) +
+                       ",\"sentence\":" + quote(generated_sentence) + "}");
+        }
+        else {
+            fprintf(stdout, "Learning: '%s' → '%s'\n", prefix_input.c_str(), generated_sentence.c_str());
+        }
+    }
+
+    // Save to persistent storage, now or later depending on --save-policy
+    sentence_trained(context);
+}
+
+// One input cycle of a --batch case: prefix, pinyin and the choose: answers
+struct BatchRound {
+    std::string prefix;
+    std::string pinyin;
+    std::vector<int> selections;
+};
+
+struct BatchCase {
+    std::string id;  // JSON of the case's id, empty if it has none
+    std::vector<BatchRound> rounds;
+};
+
+std::vector<int> batch_selections(const json_lite::Value* selections)
+{
+    // No list means "take the first candidate", like run_tests.py
+    std::vector<int> indexes;
+    if(!selections){
+        indexes.push_back(0);
+        return indexes;
+    }
+    for(const auto& selection : selections->items){
+        const json_lite::Value* index = &selection;
+        if(selection.type == json_lite::Value::OBJECT){
+            index = selection.get("index");
+            if(!index){
+                index = selection.get("choice_index");
+            }
+        }
+        if(!index || index->type != json_lite::Value::NUMBER){
+            throw std::runtime_error("selection without an index");
+        }
+        indexes.push_back(static_cast<int>(index->number));
+    }
+    return indexes;
+}
+
+std::string string_member(const json_lite::Value& object, const char* key)
+{
+    const json_lite::Value* value = object.get(key);
+    return value && value->type == json_lite::Value::STRING ? value->text : std::string();
+}
+
+// Accepts every suite's case shape: test_cases.json, long_sentence_tests.json,
+// multi_selection_tests.json and multi_round_tests.json (one round per entry)
+BatchCase batch_case(const json_lite::Value& value)
+{
+    if(value.type != json_lite::Value::OBJECT){
+        throw std::runtime_error("test case is not an object");
+    }
+
+    BatchCase test_case;
+    if(const json_lite::Value* id = value.get("id")){
+        test_case.id = json_lite::dump_scalar(*id);
+    }
+
+    if(const json_lite::Value* rounds = value.get("rounds")){
+        for(const auto& round : rounds->items){
+            test_case.rounds.push_back({std::string(), string_member(round, "pinyin"),
+                                        batch_selections(round.get("selections"))});
+        }
+    }
+    else {
+        test_case.rounds.push_back({string_member(value, "prefix"), string_member(value, "pinyin"),
+                                    batch_selections(value.get("selections"))});
+    }
+    return test_case;
+}
+
+std::vector<BatchCase> load_batch(const std::string& path)
+{
+    std::ifstream file(path);
+    if(!file){
+        throw std::runtime_error("cannot open " + path);
+    }
+
+    std::vector<BatchCase> cases;
+    const bool lines = path.size() > 6 && path.compare(path.size() - 6, 6, ".jsonl") == 0;
+    if(lines){
+        std::string line;
+        while(std::getline(file, line)){
+            if(line.find_first_not_of(" \t\r") != std::string::npos){
+                cases.push_back(batch_case(json_lite::parse(line)));
+            }
+        }
+    }
+    else {
+        std::stringstream content;
+        content << file.rdbuf();
+        const json_lite::Value suite = json_lite::parse(content.str());
+        for(const auto& value : suite.items){
+            cases.push_back(batch_case(value));
+        }
+    }
+    return cases;
+}
+
+// Run every case of a suite against one context and print one line per case:
+// {"index":i,"id":...,"complete":bool,"duration":seconds,"events":[...]}
+int run_batch(pinyin_context_t* context, pinyin_instance_t* instance, const std::string& path)
+{
+    std::vector<BatchCase> cases;
+    try {
+        cases = load_batch(path);
+    }
+    catch(const std::exception& e){
+        report_error(std::string("Cannot load batch file: ") + e.what());
+        return 1;
+    }
+
+    for(size_t i = 0; i < cases.size() && !stop_requested; ++i){
+        std::string events;
+        batch_events = &events;
+        const auto started = std::chrono::steady_clock::now();
+
+        bool complete = true;
+        for(const auto& round : cases[i].rounds){
+            std::string pinyin = round.pinyin;
+            if(keystroke_mode && !pinyin.empty()){
+                pinyin = type_keys(instance, pinyin);
+            }
+            if(pinyin.empty()){
+                continue;
+            }
+            SelectionSource source;
+            source.scripted = &round.selections;
+            const auto [generated_sentence, skip_train] = process_pinyin_input(instance, round.prefix, pinyin, source);
+            // Running out of selections mid-sentence is where an interactive
+            // run would abort, so nothing of this case is trained or saved
+            if(source.exhausted){
+                complete = false;
+            }
+            else {
+                train_and_save(context, instance, round.prefix, pinyin, generated_sentence, skip_train);
+            }
+            pinyin_reset(instance);
+            if(!complete){
+                break;
+            }
+        }
+
+        batch_events = nullptr;
+        const std::chrono::duration<double> elapsed = std::chrono::steady_clock::now() - started;
+        printf("{\"index\":%zu,%s%s\"complete\":%s,\"duration\":%.6f,\"events\":[%s]}\n",
+               i, cases[i].id.empty() ? "" : ("\"id\":" + cases[i].id).c_str(), cases[i].id.empty() ? "" : ",",
+               json_bool(complete), elapsed.count(), events.c_str());
+        // One flush per case so the runner can follow progress
+        fflush(stdout);
     }
+    return 0;
+}
 
-    // Save to persistent storage
-    pinyin_save(context);
+void print_usage(const char* program)
+{
+    fprintf(stderr, "Usage: %s [--protocol=text|jsonl] [--max-candidates=N] [--batch FILE.json|FILE.jsonl]\n"
+                    "       [--save-policy=every:N|interval:SECONDS|idle:SECONDS|shutdown] [--read-only]\n"
+                    "       [--window=SYLLABLES] [--lazy-sentence] [--keystroke]\n", program);
 }
 
 int main(int argc, char* argv[])
 {
-    if(FILE* check_file = fopen("data/user.conf", "r")){
-        fclose(check_file);
+    std::string batch_file;
+    for(int i = 1; i < argc; ++i){
+        const std::string arg = argv[i];
+        if(arg == "--protocol=jsonl"){
+            output_mode = OUTPUT_JSONL;
+        }
+        else if(arg == "--protocol=text"){
+            output_mode = OUTPUT_TEXT;
+        }
+        else if(arg.rfind("--max-candidates=", 0) == 0){
+            max_candidates = strtoul(arg.c_str() + strlen("--max-candidates="), nullptr, 10);
+        }
+        else if(arg == "--batch" && i + 1 < argc){
+            batch_file = argv[++i];
+        }
+        else if(arg.rfind("--batch=", 0) == 0){
+            batch_file = arg.substr(strlen("--batch="));
+        }
+        else if(arg == "--read-only"){
+            read_only = true;
+        }
+        else if(arg == "--keystroke"){
+            keystroke_mode = true;
+        }
+        else if(arg == "--lazy-sentence"){
+            lazy_sentence = true;
+        }
+        else if(arg.rfind("--window=", 0) == 0){
+            char* end = nullptr;
+            window_syllables = strtoul(arg.c_str() + strlen("--window="), &end, 10);
+            if(*end != '\0'){
+                print_usage(argv[0]);
+                return 2;
+            }
+        }
+        else if(arg.rfind("--save-policy=", 0) == 0){
+            if(!parse_save_policy(arg.substr(strlen("--save-policy=")), save_policy)){
+                print_usage(argv[0]);
+                return 2;
+            }
+        }
+        else {
+            print_usage(argv[0]);
+            return 2;
+        }
+    }
+    // type_keys parses the whole input, which --window never does
+    if(keystroke_mode && window_syllables){
+        fprintf(stderr, "--keystroke cannot be combined with --window\n");
+        print_usage(argv[0]);
+        return 2;
+    }
+    // Batch results are always JSON
+    if(!batch_file.empty()){
+        output_mode = OUTPUT_JSONL;
     }
-    else if(FILE* create_file = fopen("data/user.conf", "w")){
-        fclose(create_file);
+
+    // --read-only leaves data/ exactly as it finds it
+    if(!read_only){
+        if(FILE* check_file = fopen("data/user.conf", "r")){
+            fclose(check_file);
+        }
+        else if(FILE* create_file = fopen("data/user.conf", "w")){
+            fclose(create_file);
+        }
     }
 
     pinyin_context_t* context = pinyin_init("data", "data");
     if(!context){
-        fprintf(stderr, "Error: Failed to initialize pinyin context\n");
+        report_error("Failed to initialize pinyin context");
         return 1;
     }
 
@@ -279,36 +1163,50 @@ int main(int argc, char* argv[])
 
     pinyin_instance_t* instance = pinyin_alloc_instance(context);
     if(!instance){
-        fprintf(stderr, "Error: Failed to allocate pinyin instance\n");
+        report_error("Failed to allocate pinyin instance");
         pinyin_fini(context);
         return 1;
     }
 
-    std::string prefix_input;
-    std::string pinyin_input;
+    save_context = context;
+    install_stop_handlers();
 
-    while(true){
-        if(!read_stdin("prefix(Chinese):", prefix_input)) break;
-        if(prefix_input == "quit") break;
+    int status = 0;
+    if(!batch_file.empty()){
+        status = run_batch(context, instance, batch_file);
+    }
+    else {
+        std::string prefix_input;
+        std::string pinyin_input;
 
-        if(!read_stdin("pinyin:", pinyin_input)) break;
-        if(pinyin_input == "quit") break;
-        if(pinyin_input.empty()) continue;
+        while(true){
+            if(!read_stdin("prefix(Chinese):", prefix_input)) break;
+            if(prefix_input == "quit") break;
 
-        pinyin_parse_more_full_pinyins(instance, pinyin_input.c_str());
+            if(!read_stdin("pinyin:", pinyin_input)) break;
+            if(pinyin_input == "quit") break;
+            if(pinyin_input.empty()) continue;
+            if(keystroke_mode){
+                pinyin_input = type_keys(instance, pinyin_input);
+                if(pinyin_input.empty()) continue;
+            }
 
-        const auto [generated_sentence, skip_train] = process_pinyin_input(instance, prefix_input, pinyin_input);
-        train_and_save(context, instance, prefix_input, pinyin_input, generated_sentence, skip_train);
+            SelectionSource source;
+            const auto [generated_sentence, skip_train] = process_pinyin_input(instance, prefix_input, pinyin_input, source);
+            train_and_save(context, instance, prefix_input, pinyin_input, generated_sentence, skip_train);
 
-        pinyin_reset(instance);
+            pinyin_reset(instance);
+        }
     }
 
-    pinyin_save(context);
+    // One save on the way out covers whatever the policy deferred
     pinyin_free_instance(instance);
 
-    pinyin_mask_out(context, 0x0, 0x0);
-    pinyin_save(context);
+    if(!read_only){
+        pinyin_mask_out(context, 0x0, 0x0);
+        save_user_data(context, "shutdown");
+    }
     pinyin_fini(context);
 
-    return 0;
+    return status;
 }
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Merge per-shard result files into one
+Accepts results JSON files, multi-round result lists and --stream files,
+sums the counters, puts the details back in case order and prints the same
+summary (and, for multi-selection runs, the same statistics) a single
+unsharded run would.
+
+Usage: python3 merge_results.py shard1.json shard2.json ... [-o merged.json]
+"""
+
+import json
+import sys
+
+from result_stream import rebuild_results
+from sharding import case_key
+
+COUNTERS = ("passed", "failed", "errors", "total")
+
+
+def load_results(path):
+    """Load one result file as a results dict; the second value is True for list-shaped files"""
+    if path.endswith(".jsonl"):
+        return rebuild_results(path), False
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return data, False
+
+    # multi_round_results.json is just the details list
+    passed = sum(1 for detail in data if detail.get("passed"))
+    return {
+        "passed": passed,
+        "failed": len(data) - passed,
+        "errors": 0,
+        "total": len(data),
+        "details": data
+    }, True
+
+
+def _sort_key(detail):
+    key = case_key(detail)
+    return (0, int(key), "") if key.isdigit() else (1, 0, key)
+
+
+def merge_results(all_results):
+    """Combine several results dicts into one"""
+    merged = {key: 0 for key in COUNTERS}
+    merged.update({"start_time": None, "end_time": None, "shards": [], "details": []})
+
+    for results in all_results:
+        for key, value in results.items():
+            if key in ("details", "start_time", "end_time", "shard"):
+                continue
+            # Runner-specific counters (too_long_but_worked, cached, ...) add up too
+            if isinstance(value, int) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+        if results.get("start_time"):
+            if merged["start_time"] is None or results["start_time"] < merged["start_time"]:
+                merged["start_time"] = results["start_time"]
+        if results.get("end_time"):
+            if merged["end_time"] is None or results["end_time"] > merged["end_time"]:
+                merged["end_time"] = results["end_time"]
+        if results.get("shard"):
+            merged["shards"].append(results["shard"])
+        merged["details"].extend(results.get("details", []))
+
+    merged["details"].sort(key=_sort_key)
+    return merged
+
+
+def check_coverage(merged):
+    """Warn about duplicated cases and missing shards"""
+    seen = set()
+    duplicates = set()
+    for detail in merged["details"]:
+        key = case_key(detail)
+        if key in seen:
+            duplicates.add(key)
+        seen.add(key)
+    if duplicates:
+        print(f"Warning: {len(duplicates)} case(s) appear in more than one file: {', '.join(sorted(duplicates)[:10])}")
+
+    counts = {shard.split("/")[1] for shard in merged["shards"]}
+    if len(counts) > 1:
+        print(f"Warning: shards come from different splits: {', '.join(merged['shards'])}")
+    elif counts:
+        count = int(counts.pop())
+        missing = [f"{i}/{count}" for i in range(1, count + 1) if f"{i}/{count}" not in merged["shards"]]
+        if missing:
+            print(f"Warning: missing shard(s) {', '.join(missing)}")
+
+
+def print_summary(merged):
+    total = merged["total"]
+    print("Merged Test Summary:")
+    if merged["shards"]:
+        print(f"  Shards:  {', '.join(sorted(merged['shards']))}")
+    for key in COUNTERS[:3]:
+        rate = merged[key] / total * 100 if total else 0
+        print(f"  {key.capitalize() + ':':8s} {merged[key]} ({rate:.1f}%)")
+    print(f"  Total:   {total}")
+    for key, value in merged.items():
+        if key not in COUNTERS and isinstance(value, int) and not isinstance(value, bool):
+            print(f"  {key}: {value}")
+
+    details = merged["details"]
+    if details and all("selections" in detail for detail in details):
+        from run_multi_selection_tests import MultiSelectionTestRunner
+        runner = MultiSelectionTestRunner()
+        runner.results = merged
+        runner.print_statistics()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge per-shard test result files")
+    parser.add_argument("files", nargs="+", help="result files (.json or --stream .jsonl) from each shard")
+    parser.add_argument("-o", "--output", help="merged results JSON to write")
+    args = parser.parse_args()
+
+    loaded = [load_results(path) for path in args.files]
+    merged = merge_results([results for results, _ in loaded])
+    check_coverage(merged)
+    print_summary(merged)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            # Multi-round shards merge back into the same list shape
+            if all(is_list for _, is_list in loaded):
+                json.dump(merged["details"], f, ensure_ascii=False, indent=2)
+            else:
+                json.dump(merged, f, ensure_ascii=False, indent=2)
+        print(f"\nMerged results saved to {args.output}")
+
+    sys.exit(1 if merged["failed"] or merged["errors"] else 0)
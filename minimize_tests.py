@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Deduplicate a suite and pick a small subset with the same coverage
+Cases with the same input (prefix, pinyin and selections, or the same
+rounds) are run once: the first one is kept. Every remaining case is then
+run read-only through the native engine (see native_engine.py) to find out
+what it exercises:
+
+  syllable  every syllable of libpinyin's best parse of its pinyin
+  length    its length in syllables
+  prefix    its prefix text ("" included)
+  path      the candidate types it selects, in order (e.g. NORMAL, LONGER)
+
+and a greedy set cover keeps the fewest cases that still cover every
+distinct value of every kind. The reduced suite is meant for per-commit
+runs; nightly runs keep the full suite.
+
+Usage: python3 minimize_tests.py test_cases.json [-o test_cases_min.json] [--report coverage_report.json]
+"""
+
+import heapq
+import json
+import os
+import sys
+
+import pinyin_binding as pb
+from generate_corpus_tests import typed_syllable
+from native_engine import NativeEngine, case_rounds
+from suite_file import load_test_cases, write_jsonl
+
+FEATURE_KINDS = ("syllable", "length", "prefix", "path")
+
+
+def input_key(test_case):
+    """What a run of test_case depends on; cases with equal keys give the same output"""
+    return json.dumps(case_rounds(test_case), ensure_ascii=False)
+
+
+def deduplicate(test_cases):
+    """(unique cases in order, number dropped, number dropped with a different expectation)"""
+    first = {}
+    unique = []
+    conflicts = 0
+    for test_case in test_cases:
+        key = input_key(test_case)
+        kept = first.get(key)
+        if kept is None:
+            first[key] = test_case
+            unique.append(test_case)
+        elif kept.get("expected_contains") != test_case.get("expected_contains"):
+            conflicts += 1
+    return unique, len(test_cases) - len(unique), conflicts
+
+
+def parse_syllables(engine, pinyin):
+    """Syllables of libpinyin's best parse of pinyin, tone digits dropped"""
+    instance = engine.instance
+    pb.pinyin_parse_more_full_pinyins(instance, pinyin)
+    syllables = []
+    # Every offset has a matrix column, alternative segmentations included;
+    # follow the best parse's keys from one end position to the next
+    offset = 0
+    length = pb.pinyin_get_parsed_input_length(instance)
+    while offset < length:
+        key = pb.pinyin_get_pinyin_key(instance, offset)
+        key_rest = pb.pinyin_get_pinyin_key_rest(instance, offset)
+        positions = pb.pinyin_get_pinyin_key_rest_positions(instance, key_rest) if key_rest else None
+        if not key or not positions or positions[1] <= offset:
+            # Nothing starts here, e.g. a ' separator
+            offset += 1
+            continue
+        syllable = pb.pinyin_get_pinyin_string(instance, key)
+        if syllable:
+            syllables.append(typed_syllable(syllable))
+        offset = positions[1]
+    pb.pinyin_reset(instance)
+    return syllables
+
+
+def case_features(engine, test_case):
+    """Set of (kind, value) test_case covers"""
+    features = set()
+    length = 0
+    for prefix, pinyin, _ in case_rounds(test_case):
+        features.add(("prefix", prefix))
+        syllables = parse_syllables(engine, pinyin)
+        features.update(("syllable", syllable) for syllable in syllables)
+        length += len(syllables)
+    features.add(("length", length))
+
+    events, _ = engine.run_case(test_case)
+    path = [event["type_name"] for event in events if event["event"] == "selected"]
+    features.add(("path", " > ".join(path) if path else "(none)"))
+    return features
+
+
+def greedy_cover(features):
+    """Indexes of a small subset of features (a list of sets) covering their union, in input order"""
+    uncovered = set().union(*features) if features else set()
+    # Lazy greedy: a case's gain only shrinks, so a stale heap entry is an upper bound
+    heap = [(-len(f), i) for i, f in enumerate(features)]
+    heapq.heapify(heap)
+    chosen = []
+    while uncovered and heap:
+        _, i = heapq.heappop(heap)
+        gain = len(features[i] & uncovered)
+        if gain == 0:
+            continue
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, i))
+            continue
+        chosen.append(i)
+        uncovered -= features[i]
+    return sorted(chosen)
+
+
+def coverage_report(all_features, chosen, totals):
+    """Per kind: distinct values with how many cases of the full and reduced suite cover each"""
+    report = {"cases": totals, "coverage": {}}
+    for kind in FEATURE_KINDS:
+        report["coverage"][kind] = {}
+    for features in all_features:
+        for kind, value in features:
+            counts = report["coverage"][kind].setdefault(str(value), {"full": 0, "reduced": 0})
+            counts["full"] += 1
+    for i in chosen:
+        for kind, value in all_features[i]:
+            report["coverage"][kind][str(value)]["reduced"] += 1
+    return report
+
+
+def minimize(test_cases, data_dir="data"):
+    """(reduced suite, coverage report) for test_cases"""
+    unique, duplicates, conflicts = deduplicate(test_cases)
+
+    engine = NativeEngine(data_dir, read_only=True)
+    try:
+        all_features = [case_features(engine, test_case) for test_case in unique]
+    finally:
+        engine.close()
+
+    chosen = greedy_cover(all_features)
+    totals = {
+        "total": len(test_cases),
+        "duplicates": duplicates,
+        "conflicting_duplicates": conflicts,
+        "unique": len(unique),
+        "reduced": len(chosen)
+    }
+    return [unique[i] for i in chosen], coverage_report(all_features, chosen, totals)
+
+
+def print_report(report):
+    totals = report["cases"]
+    print("\n" + "="*60)
+    print("SUITE MINIMIZATION")
+    print("="*60)
+    print(f"Cases:      {totals['total']}")
+    print(f"Duplicates: {totals['duplicates']}"
+          + (f" ({totals['conflicting_duplicates']} with a different expectation)"
+             if totals['conflicting_duplicates'] else ""))
+    print(f"Unique:     {totals['unique']}")
+    print(f"Reduced:    {totals['reduced']}")
+    print("\nCoverage (distinct values, all covered by the reduced suite):")
+    for kind in FEATURE_KINDS:
+        print(f"  {kind:<10} {len(report['coverage'][kind]):>6}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Deduplicate and minimize a test suite by coverage")
+    parser.add_argument("suite", help="suite to reduce, .json or .jsonl")
+    parser.add_argument("-o", "--output",
+                        help="reduced suite (default: <suite>_min.json / .jsonl)")
+    parser.add_argument("--report", default="coverage_report.json",
+                        help="coverage report file (default: coverage_report.json)")
+    parser.add_argument("--data", default="data", help="libpinyin data directory (default: data)")
+    args = parser.parse_args()
+    if not os.path.exists(args.suite):
+        print(f"Error: {args.suite} not found")
+        sys.exit(1)
+    root, extension = os.path.splitext(args.suite)
+    output = args.output or f"{root}_min{extension}"
+
+    reduced, report = minimize(load_test_cases(args.suite), args.data)
+    if output.endswith(".jsonl"):
+        write_jsonl(reduced, output)
+    else:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(reduced, f, ensure_ascii=False, indent=2)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_report(report)
+    print(f"\nReduced suite saved to {output}")
+    print(f"Coverage report saved to {args.report}")
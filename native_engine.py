@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-process test execution through pinyin_binding
+NativeEngine is a port of main.cpp's input loop (process_pinyin_input,
+select_candidate, train_and_save) that calls libpinyin directly and records
+the same events test_pinyin --protocol=jsonl prints. run_native() feeds a
+runner's cases through it and hands each case's events to the runner's
+evaluate(), so pass/fail logic is shared with the subprocess modes, without
+a process start-up or pipe round trip per case.
+
+A case that raises (a malformed selection, a binding error) is recorded
+through the runner's error_result() and the run carries on, as in the
+subprocess modes. --save-policy is applied the way test_pinyin --batch
+applies it: nothing waits for input, so idle:T only saves on close.
+"""
+
+import json
+import math
+import os
+import time
+
+import pinyin_binding as pb
+
+USER_DICTIONARY_INDEX = 7
+USER_PHRASE_FREQUENCY = 100
+REMEMBER_EVERY_INPUT = True  # Match ibus-libpinyin behavior
+# Limits main.cpp puts on --save-policy values
+MAX_SAVE_EVERY = 2 ** 32 - 1
+MAX_SAVE_SECONDS = (2 ** 31 - 1) // 1000 - 1
+
+_TYPE_NAMES = ("BEST_MATCH_CANDIDATE", "NORMAL_CANDIDATE", "ZOMBIE_CANDIDATE", "PREDICTED_BIGRAM_CANDIDATE",
+               "ADDON_CANDIDATE", "LONGER_CANDIDATE", "NBEST_MATCH_CANDIDATE")
+
+
+def parse_save_policy(text):
+    """(kind, value) of a --save-policy value, like main.cpp's parse_save_policy(); raises ValueError"""
+    kind, _, value = text.partition(":")
+    if kind == "shutdown" and not value:
+        return kind, None
+    if kind == "every" and value.isdigit() and 0 < int(value) <= MAX_SAVE_EVERY:
+        return kind, int(value)
+    if kind in ("interval", "idle"):
+        try:
+            seconds = float(value)
+        except ValueError:
+            seconds = None
+        # float() also takes "nan" and "inf"
+        if seconds is not None and math.isfinite(seconds) and 0 <= seconds <= MAX_SAVE_SECONDS:
+            return kind, seconds
+    raise ValueError(f"invalid save policy '{text}' (every:N, interval:SECONDS, idle:SECONDS or shutdown)")
+
+
+class SelectionsExhausted(Exception):
+    """A scripted case ran out of choose: answers before its sentence was complete"""
+
+
+def selection_indexes(selections):
+    """Candidate indexes of a case's selections, like main.cpp's batch_selections()"""
+    # No list means "take the first candidate", like run_tests.py
+    if selections is None:
+        return [0]
+    indexes = []
+    for selection in selections:
+        if isinstance(selection, dict):
+            selection = selection.get("index", selection.get("choice_index"))
+        if not isinstance(selection, (int, float)):
+            raise ValueError("selection without an index")
+        indexes.append(int(selection))
+    return indexes
+
+
+def case_rounds(test_case):
+    """(prefix, pinyin, selections) for each input cycle of any suite's case shape"""
+    if "rounds" in test_case:
+        return [("", round_data.get("pinyin", ""), selection_indexes(round_data.get("selections")))
+                for round_data in test_case["rounds"]]
+    return [(test_case.get("prefix", ""), test_case.get("pinyin", ""),
+             selection_indexes(test_case.get("selections")))]
+
+
+class NativeEngine:
+    """One libpinyin context and instance, driven like test_pinyin drives them"""
+
+    def __init__(self, data_dir="data", read_only=False, max_candidates=40, save_policy="every:1"):
+        self.save_kind, self.save_value = parse_save_policy(save_policy)
+        pb.load()
+        self.read_only = read_only
+        self.max_candidates = max_candidates
+        self.events = []
+        # Sentences trained since the last pinyin_save
+        self.unsaved_sentences = 0
+        self.last_save = time.monotonic()
+        self._type_names = {getattr(pb, name): name for name in _TYPE_NAMES}
+
+        user_conf = os.path.join(data_dir, "user.conf")
+        if not read_only and not os.path.exists(user_conf):
+            open(user_conf, 'w').close()
+
+        self.context = pb.pinyin_init(data_dir, data_dir)
+        if not self.context:
+            raise RuntimeError("Failed to initialize pinyin context")
+        pb.pinyin_set_options(self.context, pb.PINYIN_INCOMPLETE | pb.PINYIN_CORRECT_ALL | pb.USE_DIVIDED_TABLE |
+                              pb.USE_RESPLIT_TABLE | pb.DYNAMIC_ADJUST)
+        self.instance = pb.pinyin_alloc_instance(self.context)
+        if not self.instance:
+            pb.pinyin_fini(self.context)
+            raise RuntimeError("Failed to allocate pinyin instance")
+
+    def close(self):
+        """Free the instance and save, like test_pinyin does on exit"""
+        if self.context is None:
+            return
+        pb.pinyin_free_instance(self.instance)
+        if not self.read_only:
+            pb.pinyin_mask_out(self.context, 0, 0)
+            pb.pinyin_save(self.context)
+        pb.pinyin_fini(self.context)
+        self.context = self.instance = None
+
+    def _emit(self, event, **fields):
+        self.events.append({"event": event, **fields})
+
+    def type_name(self, candidate_type):
+        return self._type_names.get(candidate_type, "UNKNOWN")
+
+    def display_candidates(self, start):
+        instance = self.instance
+        num = pb.pinyin_get_n_candidate(instance)
+        candidates = []
+        for i in range(min(num, self.max_candidates)):
+            candidate = pb.pinyin_get_candidate(instance, i)
+            candidate_type = pb.pinyin_get_candidate_type(instance, candidate)
+            candidates.append({"index": i, "string": pb.pinyin_get_candidate_string(instance, candidate),
+                               "type": candidate_type, "type_name": self.type_name(candidate_type)})
+        self._emit("candidates", start=start, total=num, candidates=candidates)
+
+    def select_candidate(self, chosen, start, sentence):
+        """Apply one choose: answer; returns (start, sentence), or None for an invalid index"""
+        instance = self.instance
+        num = pb.pinyin_get_n_candidate(instance)
+        if not 0 <= chosen < num:
+            self._emit("error", message=f"Invalid candidate index {chosen} (valid: 0-{num - 1})")
+            return None
+
+        candidate = pb.pinyin_get_candidate(instance, chosen)
+        word = pb.pinyin_get_candidate_string(instance, candidate)
+        candidate_type = pb.pinyin_get_candidate_type(instance, candidate)
+
+        if candidate_type == pb.NBEST_MATCH_CANDIDATE:
+            # A whole-sentence match: choose from 0, train unless it is the top choice
+            start = pb.pinyin_choose_candidate(instance, 0, candidate)
+            index = pb.pinyin_get_candidate_nbest_index(instance, candidate)
+            if index != 0 and not self.read_only:
+                pb.pinyin_train(instance, index)
+            full_sentence = pb.pinyin_get_sentence(instance, index)
+            if full_sentence:
+                sentence = full_sentence
+        elif candidate_type == pb.LONGER_CANDIDATE:
+            # Starts from 0 and trains the uni-gram itself
+            start = pb.pinyin_choose_candidate(instance, 0, candidate)
+            sentence = word
+        else:
+            sentence += word
+            start = pb.pinyin_choose_candidate(instance, start, candidate)
+            pb.pinyin_guess_sentence(instance)
+
+        self._emit("selected", index=chosen, string=word, type=candidate_type,
+                   type_name=self.type_name(candidate_type), start=start, sentence=sentence)
+        return start, sentence
+
+    def process_pinyin_input(self, pinyin, selections):
+        """Walk the candidates through selections; returns (sentence, skip_train)"""
+        instance = self.instance
+        skip_train = False
+        sentence = ""
+        answers = iter(selections)
+
+        start = 0
+        while start < len(pinyin):
+            pb.pinyin_guess_candidates(instance, start, pb.SORT_BY_PHRASE_LENGTH_AND_PINYIN_LENGTH_AND_FREQUENCY)
+            self.display_candidates(start)
+
+            chosen = next(answers, None)
+            if chosen is None:
+                self._emit("error", message="Ran out of selections")
+                raise SelectionsExhausted()
+
+            if 0 <= chosen < pb.pinyin_get_n_candidate(instance):
+                candidate_type = pb.pinyin_get_candidate_type(instance, pb.pinyin_get_candidate(instance, chosen))
+                # LONGER/NBEST chosen after position 0 conflict with the constraints already set
+                if candidate_type in (pb.LONGER_CANDIDATE, pb.NBEST_MATCH_CANDIDATE) and start > 0:
+                    skip_train = True
+
+            selected = self.select_candidate(chosen, start, sentence)
+            if selected is not None:
+                start, sentence = selected
+        return sentence, skip_train
+
+    def is_input_complete_pinyin(self):
+        for i in range(pb.pinyin_get_parsed_input_length(self.instance)):
+            key = pb.pinyin_get_pinyin_key(self.instance, i)
+            if key and pb.pinyin_get_pinyin_is_incomplete(self.instance, key):
+                return False
+        return True
+
+    def add_to_user_dictionary(self, phrase, pinyin):
+        if not phrase or not pinyin:
+            return
+        if len(phrase) >= pb.MAX_PHRASE_LENGTH:
+            self._emit("phrase_skipped", phrase=phrase, reason="too_long", length=len(phrase),
+                       max=pb.MAX_PHRASE_LENGTH - 1)
+            return
+        iterator = pb.pinyin_begin_add_phrases(self.context, USER_DICTIONARY_INDEX)
+        added = pb.pinyin_iterator_add_phrase(iterator, phrase, pinyin, USER_PHRASE_FREQUENCY)
+        pb.pinyin_end_add_phrases(iterator)
+        self._emit("phrase_added", phrase=phrase, pinyin=pinyin, success=added)
+
+    def train_and_save(self, prefix, pinyin, sentence, skip_train):
+        if not sentence:
+            return
+        if self.read_only:
+            self._emit("trained", sentence=sentence, skipped=True, read_only=True)
+            return
+
+        if not skip_train:
+            pb.pinyin_train(self.instance, 0)
+            if REMEMBER_EVERY_INPUT:
+                pb.pinyin_remember_user_input(self.instance, sentence, -1)
+        self._emit("trained", sentence=sentence, skipped=skip_train)
+
+        if self.is_input_complete_pinyin():
+            self.add_to_user_dictionary(sentence, pinyin)
+        else:
+            self._emit("phrase_skipped", phrase=sentence, reason="incomplete_pinyin")
+
+        if prefix:
+            self._emit("learning", prefix=prefix, sentence=sentence)
+
+        # Save now or later depending on the save policy
+        self.sentence_trained()
+
+    def save(self, reason):
+        saved = pb.pinyin_save(self.context)
+        self._emit("saved", success=saved, reason=reason, sentences=self.unsaved_sentences)
+        self.unsaved_sentences = 0
+        self.last_save = time.monotonic()
+
+    def sentence_trained(self):
+        """Count a trained sentence and save if the policy says so, like main.cpp"""
+        self.unsaved_sentences += 1
+        if self.save_kind == "every" and self.unsaved_sentences >= self.save_value:
+            self.save("every")
+        elif self.save_kind == "interval" and time.monotonic() - self.last_save >= self.save_value:
+            self.save("interval")
+
+    def run_case(self, test_case):
+        """Run every round of test_case; returns (events, complete)"""
+        self.events = []
+        complete = True
+        for prefix, pinyin, selections in case_rounds(test_case):
+            if not pinyin:
+                continue
+            pb.pinyin_parse_more_full_pinyins(self.instance, pinyin)
+            try:
+                sentence, skip_train = self.process_pinyin_input(pinyin, selections)
+                self.train_and_save(prefix, pinyin, sentence, skip_train)
+            except SelectionsExhausted:
+                # Where an interactive run would abort: nothing of this case is trained
+                complete = False
+            finally:
+                # Also when the case raises, so the next one starts from clean input
+                pb.pinyin_reset(self.instance)
+            if not complete:
+                break
+        return self.events, complete
+
+
+def run_native(runner, test_cases):
+    """Yield runner.evaluate() results for test_cases, run in this process"""
+    engine = NativeEngine(os.path.join(runner.cwd or ".", "data"), read_only=runner.read_only,
+                          save_policy=runner.save_policy)
+    try:
+        for test_case in test_cases:
+            started = time.monotonic()
+            # Like the subprocess modes: a case that raises is recorded and the run goes on
+            try:
+                events, complete = engine.run_case(test_case)
+                elapsed = time.monotonic() - started
+                stdout = "\n".join(json.dumps(event, ensure_ascii=False, separators=(",", ":")) for event in events)
+                result = runner.evaluate(test_case, stdout, "", 0 if complete else 1)
+            except Exception as e:
+                yield runner.error_result(test_case, str(e))
+                continue
+            result["duration"] = round(elapsed, 4)
+            yield result
+    finally:
+        engine.close()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run test cases on a pool of worker processes
+Every worker gets a private copy of the data directory, because test_pinyin
+rewrites user_bigram.db and the user dictionary after each sentence. With
+runner.read_only test_pinyin never writes there, so workers share it.
+"""
+
+import copy
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import util
+
+from rate_limiter import run_throttled
+
+# Runner owned by this worker process, set up by _init_worker
+_worker_runner = None
+
+
+def prepare_worker_dir(data_dir="data"):
+    """Create a scratch directory holding a private copy of data_dir"""
+    workdir = tempfile.mkdtemp(prefix="pinyin_worker_")
+    shutil.copytree(data_dir, os.path.join(workdir, "data"))
+    return workdir
+
+
+def _close_session(runner):
+    if getattr(runner, "session", None) is not None:
+        runner.session.close()
+        runner.session = None
+
+
+def _init_worker(runner, data_dir):
+    """Point this worker's runner at its own copy of the data directory"""
+    global _worker_runner
+
+    # multiprocessing workers leave via os._exit(), so atexit would not fire
+    util.Finalize(None, _close_session, args=(runner,), exitpriority=20)
+    runner.program_path = os.path.abspath(runner.program_path)
+    if not getattr(runner, "read_only", False):
+        workdir = prepare_worker_dir(data_dir)
+        util.Finalize(None, shutil.rmtree, args=(workdir, True), exitpriority=10)
+        runner.cwd = workdir
+    _worker_runner = runner
+
+
+def _run_case(test_case):
+    return run_throttled(_worker_runner, test_case)
+
+
+def run_parallel(runner, test_cases, jobs, data_dir="data"):
+    """
+    Run runner.run_single_test over test_cases on jobs worker processes
+    Each worker throttles itself if runner.throttle is set.
+    Yields results in the order of test_cases, so merged output stays in
+    test-id order no matter which worker finishes first.
+    """
+    data_dir = os.path.join(runner.cwd or ".", data_dir)
+
+    # Workers get a copy without the parent's live process, open stream or database
+    worker_runner = copy.copy(runner)
+    for attr in ("session", "stream", "store"):
+        if hasattr(worker_runner, attr):
+            setattr(worker_runner, attr, None)
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(worker_runner, data_dir)) as pool:
+        yield from pool.map(_run_case, test_cases)
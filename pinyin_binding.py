@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ctypes binding to libpinyin
+Exposes the libpinyin calls main.cpp makes under the same names, taking and
+returning Python values: strings in and out are str (UTF-8 on the wire),
+out-parameters become return values. Contexts, instances, candidates and
+import iterators are opaque pointers (ints).
+
+The library is libpinyin_shim.so (see pinyin_shim.cpp, built by make),
+which links libpinyin and carries the pinyin.h constants ctypes cannot
+read, plus shim_token_get_pinyin() for phrase pronunciations. Set
+PINYIN_SHIM to load it from somewhere else.
+"""
+
+import ctypes
+import ctypes.util
+import os
+
+SHIM_PATH = os.environ.get("PINYIN_SHIM", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                       "libpinyin_shim.so"))
+
+# Exported by the shim as shim_<name>; set as module globals by load()
+_FLAG_CONSTANTS = (
+    "PINYIN_INCOMPLETE", "PINYIN_CORRECT_ALL", "USE_DIVIDED_TABLE", "USE_RESPLIT_TABLE", "DYNAMIC_ADJUST",
+    "SORT_BY_PHRASE_LENGTH_AND_PINYIN_LENGTH_AND_FREQUENCY",
+)
+_INT_CONSTANTS = (
+    "BEST_MATCH_CANDIDATE", "NORMAL_CANDIDATE", "ZOMBIE_CANDIDATE", "PREDICTED_BIGRAM_CANDIDATE",
+    "ADDON_CANDIDATE", "LONGER_CANDIDATE", "NBEST_MATCH_CANDIDATE",
+    "MAX_PHRASE_LENGTH",
+)
+
+_p = ctypes.c_void_p
+_bool = ctypes.c_bool
+_str = ctypes.c_char_p
+_size = ctypes.c_size_t
+_guint = ctypes.c_uint
+_guint8 = ctypes.c_uint8
+_guint16 = ctypes.c_uint16
+_guint32 = ctypes.c_uint32
+
+# name: (restype, argtypes), following pinyin.h
+_SIGNATURES = {
+    "pinyin_init": (_p, [_str, _str]),
+    "pinyin_set_options": (_bool, [_p, _guint32]),
+    "pinyin_save": (_bool, [_p]),
+    "pinyin_mask_out": (_bool, [_p, _guint32, _guint32]),
+    "pinyin_fini": (None, [_p]),
+    "pinyin_alloc_instance": (_p, [_p]),
+    "pinyin_free_instance": (None, [_p]),
+    "pinyin_parse_more_full_pinyins": (_size, [_p, _str]),
+    "pinyin_get_parsed_input_length": (_size, [_p]),
+    "pinyin_get_pinyin_key": (_bool, [_p, _size, ctypes.POINTER(_p)]),
+    "pinyin_get_pinyin_key_rest": (_bool, [_p, _size, ctypes.POINTER(_p)]),
+    "pinyin_get_pinyin_key_rest_positions": (_bool, [_p, _p, ctypes.POINTER(_guint16), ctypes.POINTER(_guint16)]),
+    "pinyin_get_pinyin_is_incomplete": (_bool, [_p, _p]),
+    "pinyin_get_pinyin_string": (_bool, [_p, _p, ctypes.POINTER(_p)]),
+    "pinyin_guess_candidates": (_bool, [_p, _size, _guint]),
+    "pinyin_get_n_candidate": (_bool, [_p, ctypes.POINTER(_guint)]),
+    "pinyin_get_candidate": (_bool, [_p, _guint, ctypes.POINTER(_p)]),
+    "pinyin_get_candidate_string": (_bool, [_p, _p, ctypes.POINTER(_str)]),
+    "pinyin_get_candidate_type": (_bool, [_p, _p, ctypes.POINTER(ctypes.c_int)]),
+    "pinyin_get_candidate_nbest_index": (_bool, [_p, _p, ctypes.POINTER(_guint8)]),
+    "pinyin_choose_candidate": (ctypes.c_int, [_p, _size, _p]),
+    "pinyin_guess_sentence": (_bool, [_p]),
+    "pinyin_guess_sentence_with_prefix": (_bool, [_p, _str]),
+    "pinyin_get_sentence": (_bool, [_p, _guint8, ctypes.POINTER(_p)]),
+    "pinyin_train": (_bool, [_p, _guint8]),
+    "pinyin_remember_user_input": (_bool, [_p, _str, ctypes.c_int]),
+    "pinyin_reset": (_bool, [_p]),
+    "pinyin_begin_add_phrases": (_p, [_p, _guint8]),
+    "pinyin_iterator_add_phrase": (_bool, [_p, _str, _str, ctypes.c_int]),
+    "pinyin_end_add_phrases": (None, [_p]),
+    "pinyin_phrase_segment": (_bool, [_p, _str]),
+    "pinyin_get_n_phrase": (_bool, [_p, ctypes.POINTER(_guint)]),
+    "pinyin_get_phrase_token": (_bool, [_p, _guint, ctypes.POINTER(_guint32)]),
+    "pinyin_token_get_phrase": (_bool, [_p, _guint32, ctypes.POINTER(_guint), ctypes.POINTER(_p)]),
+    "shim_token_get_pinyin": (_bool, [_p, _guint32, _guint, ctypes.POINTER(_p)]),
+}
+
+_lib = None
+_g_free = None
+
+
+def load(path=None):
+    """Load the shim (once) and return the ctypes library"""
+    global _lib, _g_free
+    if _lib is not None:
+        return _lib
+    lib = ctypes.CDLL(path or SHIM_PATH)
+    for name, (restype, argtypes) in _SIGNATURES.items():
+        function = getattr(lib, name)
+        function.restype = restype
+        function.argtypes = argtypes
+    for name in _FLAG_CONSTANTS:
+        globals()[name] = ctypes.c_uint.in_dll(lib, "shim_" + name).value
+    for name in _INT_CONSTANTS:
+        globals()[name] = ctypes.c_int.in_dll(lib, "shim_" + name).value
+
+    # Strings libpinyin allocates for us are released with glib's g_free
+    glib = ctypes.CDLL(ctypes.util.find_library("glib-2.0") or "libglib-2.0.so.0")
+    _g_free = glib.g_free
+    _g_free.argtypes = [_p]
+    _g_free.restype = None
+    _lib = lib
+    return lib
+
+
+def _encode(text):
+    return text.encode('utf-8') if text is not None else None
+
+
+def _take_string(pointer):
+    """Copy a g_malloc'ed UTF-8 string into a str and free it"""
+    if not pointer:
+        return None
+    try:
+        return ctypes.string_at(pointer).decode('utf-8')
+    finally:
+        _g_free(pointer)
+
+
+# Context
+
+def pinyin_init(systemdir, userdir):
+    return load().pinyin_init(_encode(systemdir), _encode(userdir))
+
+
+def pinyin_set_options(context, options):
+    return load().pinyin_set_options(context, options)
+
+
+def pinyin_save(context):
+    return load().pinyin_save(context)
+
+
+def pinyin_mask_out(context, mask, value):
+    return load().pinyin_mask_out(context, mask, value)
+
+
+def pinyin_fini(context):
+    load().pinyin_fini(context)
+
+
+def pinyin_alloc_instance(context):
+    return load().pinyin_alloc_instance(context)
+
+
+def pinyin_free_instance(instance):
+    load().pinyin_free_instance(instance)
+
+
+# Input
+
+def pinyin_parse_more_full_pinyins(instance, pinyins):
+    return load().pinyin_parse_more_full_pinyins(instance, _encode(pinyins))
+
+
+def pinyin_get_parsed_input_length(instance):
+    return load().pinyin_get_parsed_input_length(instance)
+
+
+def pinyin_get_pinyin_key(instance, index):
+    """ChewingKey pointer at index, or None"""
+    key = _p()
+    if not load().pinyin_get_pinyin_key(instance, index, ctypes.byref(key)):
+        return None
+    return key.value
+
+
+def pinyin_get_pinyin_key_rest(instance, index):
+    """ChewingKeyRest pointer at index, or None"""
+    key_rest = _p()
+    if not load().pinyin_get_pinyin_key_rest(instance, index, ctypes.byref(key_rest)):
+        return None
+    return key_rest.value
+
+
+def pinyin_get_pinyin_key_rest_positions(instance, key_rest):
+    """(begin, end) input offsets a ChewingKeyRest covers, or None"""
+    begin = _guint16()
+    end = _guint16()
+    if not load().pinyin_get_pinyin_key_rest_positions(instance, key_rest, ctypes.byref(begin), ctypes.byref(end)):
+        return None
+    return begin.value, end.value
+
+
+def pinyin_get_pinyin_is_incomplete(instance, key):
+    return load().pinyin_get_pinyin_is_incomplete(instance, key)
+
+
+def pinyin_get_pinyin_string(instance, key):
+    """The syllable of a ChewingKey (tone digit included if set), or None"""
+    syllable = _p()
+    if not load().pinyin_get_pinyin_string(instance, key, ctypes.byref(syllable)):
+        return None
+    return _take_string(syllable.value)
+
+
+def pinyin_reset(instance):
+    return load().pinyin_reset(instance)
+
+
+# Candidates
+
+def pinyin_guess_candidates(instance, offset, sort_option):
+    return load().pinyin_guess_candidates(instance, offset, sort_option)
+
+
+def pinyin_get_n_candidate(instance):
+    num = _guint()
+    load().pinyin_get_n_candidate(instance, ctypes.byref(num))
+    return num.value
+
+
+def pinyin_get_candidate(instance, index):
+    candidate = _p()
+    if not load().pinyin_get_candidate(instance, index, ctypes.byref(candidate)):
+        return None
+    return candidate.value
+
+
+def pinyin_get_candidate_string(instance, candidate):
+    word = _str()
+    load().pinyin_get_candidate_string(instance, candidate, ctypes.byref(word))
+    # Owned by the instance, not ours to free
+    return word.value.decode('utf-8') if word.value is not None else None
+
+
+def pinyin_get_candidate_type(instance, candidate):
+    candidate_type = ctypes.c_int()
+    load().pinyin_get_candidate_type(instance, candidate, ctypes.byref(candidate_type))
+    return candidate_type.value
+
+
+def pinyin_get_candidate_nbest_index(instance, candidate):
+    index = _guint8()
+    load().pinyin_get_candidate_nbest_index(instance, candidate, ctypes.byref(index))
+    return index.value
+
+
+def pinyin_choose_candidate(instance, offset, candidate):
+    return load().pinyin_choose_candidate(instance, offset, candidate)
+
+
+# Sentences and learning
+
+def pinyin_guess_sentence(instance):
+    return load().pinyin_guess_sentence(instance)
+
+
+def pinyin_guess_sentence_with_prefix(instance, prefix):
+    return load().pinyin_guess_sentence_with_prefix(instance, _encode(prefix))
+
+
+def pinyin_get_sentence(instance, index=0):
+    sentence = _p()
+    if not load().pinyin_get_sentence(instance, index, ctypes.byref(sentence)):
+        return None
+    return _take_string(sentence.value)
+
+
+def pinyin_train(instance, index=0):
+    return load().pinyin_train(instance, index)
+
+
+def pinyin_remember_user_input(instance, phrase, count=-1):
+    return load().pinyin_remember_user_input(instance, _encode(phrase), count)
+
+
+def pinyin_begin_add_phrases(context, index):
+    return load().pinyin_begin_add_phrases(context, index)
+
+
+def pinyin_iterator_add_phrase(iterator, phrase, pinyin, count):
+    return load().pinyin_iterator_add_phrase(iterator, _encode(phrase), _encode(pinyin), count)
+
+
+def pinyin_end_add_phrases(iterator):
+    load().pinyin_end_add_phrases(iterator)
+
+
+# Phrase segmentation (see extract.cpp)
+
+def pinyin_phrase_segment(instance, sentence):
+    return load().pinyin_phrase_segment(instance, _encode(sentence))
+
+
+def pinyin_get_n_phrase(instance):
+    num = _guint()
+    load().pinyin_get_n_phrase(instance, ctypes.byref(num))
+    return num.value
+
+
+def pinyin_get_phrase_token(instance, index):
+    token = _guint32()
+    if not load().pinyin_get_phrase_token(instance, index, ctypes.byref(token)):
+        return None
+    return token.value
+
+
+def pinyin_token_get_phrase(instance, token):
+    """The phrase text of token, or None"""
+    length = _guint()
+    phrase = _p()
+    if not load().pinyin_token_get_phrase(instance, token, ctypes.byref(length), ctypes.byref(phrase)):
+        return None
+    return _take_string(phrase.value)
+
+
+def shim_token_get_pinyin(instance, token, nth=0):
+    """Syllables of token's nth pronunciation as a list (tone digits kept), or None"""
+    pinyin = _p()
+    if not load().shim_token_get_pinyin(instance, token, nth, ctypes.byref(pinyin)):
+        return None
+    return _take_string(pinyin.value).split()
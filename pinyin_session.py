@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent test_pinyin session driver
+Keeps one test_pinyin process alive and feeds test cases through its
+prefix(Chinese): / pinyin: / choose: prompt loop
+"""
+
+import os
+import select
+import subprocess
+import time
+
+from protocol import protocol_args, prompt_line
+
+PREFIX_PROMPT = "prefix(Chinese):"
+PINYIN_PROMPT = "pinyin:"
+CHOOSE_PROMPT = "choose:"
+SENTENCE_MARKER = b"sentence:"
+EVENT_SENTENCE_MARKER = b'"event":"selected"'
+
+
+class SessionResult:
+    """Output of one test case run through a PinyinSession"""
+
+    def __init__(self, stdout, stderr, returncode, timings=None):
+        self.stdout = stdout
+        self.stderr = stderr
+        # 0 while the process survived the case, otherwise its exit code
+        self.returncode = returncode
+        # Per-step latencies in seconds, see PinyinSession.run_case
+        self.timings = timings
+
+
+class PinyinSession:
+    """Drive one long-lived test_pinyin process case after case"""
+
+    def __init__(self, program_path="./test_pinyin", timeout=10, args=(), cwd=None, protocol="text"):
+        self.program_path = program_path
+        self.timeout = timeout
+        self.args = list(args) + protocol_args(protocol)
+        self.cwd = cwd
+        self.protocol = protocol
+        self._sentence_marker = SENTENCE_MARKER if protocol == "text" else EVENT_SENTENCE_MARKER
+        self.process = None
+        self.restarts = 0
+        self._stdout = b""
+        self._stderr = b""
+        # Length of stdout at the last send; prompts before it are stale
+        self._mark = 0
+        # When the last chunk holding a sentence: line arrived
+        self._sentence_at = None
+
+    def start(self):
+        """Start test_pinyin and wait for its first prefix prompt"""
+        self.process = subprocess.Popen(
+            [self.program_path] + self.args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd
+        )
+        self._stdout = b""
+        self._stderr = b""
+        self._mark = 0
+        self.expect([PREFIX_PROMPT], time.monotonic() + self.timeout)
+        self.take_output()
+
+    def close(self):
+        """Ask the process to quit, killing it if it does not exit"""
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is None:
+                self.process.stdin.write(b"quit\n")
+                self.process.stdin.flush()
+                self.process.wait(timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        finally:
+            for stream in (self.process.stdin, self.process.stdout, self.process.stderr):
+                stream.close()
+            self.process = None
+
+    def kill(self):
+        """Kill the process without waiting for a clean exit"""
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout, self.process.stderr):
+            stream.close()
+        self.process = None
+
+    def restart(self):
+        """Replace a crashed, hung or desynchronized process"""
+        self.kill()
+        self.restarts += 1
+        self.start()
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def prompt_text(self, prompt):
+        """How prompt appears in this session's output"""
+        return prompt if self.protocol == "text" else prompt_line(prompt)
+
+    def send(self, line):
+        """Send one input line to the process"""
+        self._mark = len(self._stdout)
+        self.process.stdin.write(line.encode('utf-8') + b"\n")
+        self.process.stdin.flush()
+
+    def expect(self, prompts, deadline):
+        """
+        Read output until one of the prompts is printed
+        Returns the matched prompt, or None if the process exited first.
+        Raises subprocess.TimeoutExpired when the deadline passes.
+        """
+        encoded = [(prompt, self.prompt_text(prompt).encode('utf-8')) for prompt in prompts]
+        out_fd = self.process.stdout.fileno()
+        err_fd = self.process.stderr.fileno()
+        open_fds = [out_fd, err_fd]
+
+        while True:
+            # Prompts are printed without a trailing newline and the process
+            # then blocks on stdin, so a fresh prompt always ends the buffer
+            if len(self._stdout) > self._mark:
+                for prompt, raw in encoded:
+                    if self._stdout.endswith(raw):
+                        return prompt
+
+            if out_fd not in open_fds:
+                return None
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.program_path, self.timeout)
+
+            readable, _, _ = select.select(open_fds, [], [], remaining)
+            for fd in readable:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    open_fds.remove(fd)
+                elif fd == out_fd:
+                    self._stdout += chunk
+                    if self._sentence_marker in chunk:
+                        self._sentence_at = time.monotonic()
+                else:
+                    self._stderr += chunk
+
+    def take_output(self):
+        """Return and clear everything read since the last call"""
+        stdout = self._stdout.decode('utf-8', errors='replace')
+        stderr = self._stderr.decode('utf-8', errors='replace')
+        self._stdout = b""
+        self._stderr = b""
+        self._mark = 0
+        return stdout, stderr
+
+    def run_case(self, prefix, pinyin, selections):
+        """
+        Run one prefix/pinyin case, answering each choose: prompt with the
+        next selection index. Returns a SessionResult whose stdout starts at
+        the case's prefix prompt, like a fresh test_pinyin run would.
+        Raises subprocess.TimeoutExpired after restarting a hung process.
+
+        The result's timings hold first_candidates (pinyin sent to the first
+        prompt back), choose (each selection sent to its sentence line) and
+        save (last sentence line to the prefix prompt: training and saving).
+        """
+        if not self.alive():
+            if self.process is not None:
+                self.restarts += 1
+                self.kill()
+            self.start()
+
+        deadline = time.monotonic() + self.timeout
+        pending = [str(index) for index in selections]
+        timings = {"choose": []}
+
+        try:
+            self.send(prefix)
+            prompt = self.expect([PINYIN_PROMPT], deadline)
+            if prompt is not None:
+                self.send(pinyin)
+                sent = time.monotonic()
+                prompt = self.expect([CHOOSE_PROMPT, PREFIX_PROMPT], deadline)
+                timings["first_candidates"] = round(time.monotonic() - sent, 4)
+
+            while prompt == CHOOSE_PROMPT and pending:
+                self._sentence_at = None
+                self.send(pending.pop(0))
+                sent = time.monotonic()
+                prompt = self.expect([CHOOSE_PROMPT, PREFIX_PROMPT], deadline)
+                answered = time.monotonic()
+                replied = self._sentence_at or answered
+                timings["choose"].append(round(replied - sent, 4))
+                if prompt == PREFIX_PROMPT:
+                    timings["save"] = round(answered - replied, 4)
+        except subprocess.TimeoutExpired:
+            self.take_output()
+            self.restart()
+            raise
+        except BrokenPipeError:
+            prompt = None
+
+        stdout, stderr = self.take_output()
+        prefix_prompt = self.prompt_text(PREFIX_PROMPT)
+        stdout = prefix_prompt + stdout
+
+        if prompt == PREFIX_PROMPT:
+            # Back at the prefix prompt: the case finished cleanly
+            if stdout.endswith(prefix_prompt):
+                stdout = stdout[:-len(prefix_prompt)]
+            return SessionResult(stdout, stderr, 0, timings)
+
+        if prompt == CHOOSE_PROMPT:
+            # Selections ran out mid-sentence. A one-shot run would have fed
+            # "quit" into std::stoi and aborted here, so drop the process.
+            self.kill()
+            self.restarts += 1
+            return SessionResult(stdout, stderr, -6, timings)
+
+        # The process exited or crashed during the case
+        self.process.wait()
+        returncode = self.process.returncode
+        self.kill()
+        self.restarts += 1
+        return SessionResult(stdout, stderr, returncode, timings)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
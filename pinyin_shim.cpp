@@ -0,0 +1,77 @@
+/*
+ * Shared library for pinyin_binding.py
+ *
+ * ctypes can call libpinyin's functions directly but cannot see the enums
+ * and macros in pinyin.h, so this exports them as plain data symbols.
+ * Linking it against libpinyin also means loading this one library makes
+ * every pinyin_* function available. It also wraps the one call whose
+ * arguments ctypes cannot build: a phrase token's pronunciation, which
+ * libpinyin returns as a GArray of ChewingKey.
+ *
+ * Build: g++ -shared -fPIC pinyin_shim.cpp `pkg-config libpinyin --libs --cflags` -o libpinyin_shim.so
+ */
+
+#include "pinyin.h"
+
+extern "C" {
+
+// pinyin_set_options() flags used by main.cpp
+extern const unsigned int shim_PINYIN_INCOMPLETE = PINYIN_INCOMPLETE;
+extern const unsigned int shim_PINYIN_CORRECT_ALL = PINYIN_CORRECT_ALL;
+extern const unsigned int shim_USE_DIVIDED_TABLE = USE_DIVIDED_TABLE;
+extern const unsigned int shim_USE_RESPLIT_TABLE = USE_RESPLIT_TABLE;
+extern const unsigned int shim_DYNAMIC_ADJUST = DYNAMIC_ADJUST;
+
+// pinyin_guess_candidates() sort option
+extern const unsigned int shim_SORT_BY_PHRASE_LENGTH_AND_PINYIN_LENGTH_AND_FREQUENCY =
+    SORT_BY_PHRASE_LENGTH_AND_PINYIN_LENGTH_AND_FREQUENCY;
+
+// lookup_candidate_type_t
+extern const int shim_BEST_MATCH_CANDIDATE = BEST_MATCH_CANDIDATE;
+extern const int shim_NORMAL_CANDIDATE = NORMAL_CANDIDATE;
+extern const int shim_ZOMBIE_CANDIDATE = ZOMBIE_CANDIDATE;
+extern const int shim_PREDICTED_BIGRAM_CANDIDATE = PREDICTED_BIGRAM_CANDIDATE;
+extern const int shim_ADDON_CANDIDATE = ADDON_CANDIDATE;
+extern const int shim_LONGER_CANDIDATE = LONGER_CANDIDATE;
+extern const int shim_NBEST_MATCH_CANDIDATE = NBEST_MATCH_CANDIDATE;
+
+// Phrases of MAX_PHRASE_LENGTH characters or more cannot be added (novel_types.h)
+extern const int shim_MAX_PHRASE_LENGTH = MAX_PHRASE_LENGTH;
+
+// pinyin.h only declares ChewingKey; chewing_key.h packs it into one guint16
+static const guint CHEWING_KEY_SIZE = sizeof(guint16);
+
+/*
+ * The nth pronunciation of token as space separated pinyin syllables
+ * (with tone digits where the table has them), g_free()d by the caller.
+ */
+bool shim_token_get_pinyin(pinyin_instance_t* instance, phrase_token_t token, guint nth, gchar** pinyin)
+{
+    *pinyin = NULL;
+    ChewingKeyVector keys = g_array_new(FALSE, TRUE, CHEWING_KEY_SIZE);
+    if (!pinyin_token_get_nth_pronunciation(instance, token, nth, keys) || keys->len == 0) {
+        g_array_free(keys, TRUE);
+        return false;
+    }
+
+    GString* result = g_string_new(NULL);
+    for (guint i = 0; i < keys->len; i++) {
+        ChewingKey* key = (ChewingKey*)(keys->data + i * CHEWING_KEY_SIZE);
+        gchar* syllable = NULL;
+        if (!pinyin_get_pinyin_string(instance, key, &syllable) || !syllable) {
+            g_string_free(result, TRUE);
+            g_array_free(keys, TRUE);
+            return false;
+        }
+        if (i > 0) {
+            g_string_append_c(result, ' ');
+        }
+        g_string_append(result, syllable);
+        g_free(syllable);
+    }
+    g_array_free(keys, TRUE);
+    *pinyin = g_string_free(result, FALSE);
+    return true;
+}
+
+}
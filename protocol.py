@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Readers for test_pinyin output
+test_pinyin --protocol=text (the default) prints for humans; --protocol=jsonl
+prints one JSON object per event:
+
+  {"event":"prompt","prompt":"choose:"}
+  {"event":"candidates","start":0,"total":N,"candidates":[{"index","string","type","type_name"}, ...]}
+  {"event":"selected","index","string","type","type_name","start","sentence"}
+  {"event":"window","offset","length","committed"}   (--window only)
+  {"event":"key","key","input","parsed","reused","elapsed_us"}   (--keystroke only)
+  {"event":"trained","sentence","skipped"}
+  {"event":"phrase_added","phrase","pinyin","success"}
+  {"event":"phrase_skipped","phrase","reason":"too_long"|"incomplete_pinyin", ...}
+  {"event":"learning","prefix","sentence"}
+  {"event":"saved","success","reason":"every"|"interval"|"idle"|"shutdown","sentences"}
+  {"event":"error","message"}
+
+TextOutput and EventOutput answer the same questions about one run's
+output, so the runners do not care which protocol produced it.
+"""
+
+import json
+
+PROTOCOLS = ("text", "jsonl")
+
+
+def protocol_args(protocol):
+    """Extra test_pinyin arguments for protocol"""
+    return [] if protocol == "text" else [f"--protocol={protocol}"]
+
+
+def prompt_line(prompt):
+    """The exact line test_pinyin --protocol=jsonl prints for prompt"""
+    return json.dumps({"event": "prompt", "prompt": prompt}, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def iter_events(stdout):
+    """Yield the JSON events in stdout, skipping anything else"""
+    for line in stdout.split("\n"):
+        if not line.startswith("{"):
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # A killed process can leave a partial last line
+            continue
+
+
+class TextOutput:
+    """Human-readable test_pinyin output"""
+
+    def __init__(self, stdout):
+        self.stdout = stdout or ""
+        self.sentences = [line.split("sentence:", 1)[1].strip()
+                          for line in self.stdout.split("\n") if "sentence:" in line]
+        self.too_long = "too long" in self.stdout
+        self.errors = []
+
+    @property
+    def final_sentence(self):
+        return self.sentences[-1] if self.sentences else None
+
+    def contains(self, text):
+        """True if text shows up anywhere in the output"""
+        return text in self.stdout
+
+
+class EventOutput:
+    """test_pinyin --protocol=jsonl output"""
+
+    def __init__(self, stdout):
+        self.events = list(iter_events(stdout or ""))
+        self.sentences = []
+        self.candidates = []
+        self.too_long = False
+        self.errors = []
+        for event in self.events:
+            kind = event.get("event")
+            if kind == "selected":
+                self.sentences.append(event["sentence"])
+            elif kind == "candidates":
+                self.candidates.append(event["candidates"])
+            elif kind == "phrase_skipped" and event.get("reason") == "too_long":
+                self.too_long = True
+            elif kind == "error":
+                self.errors.append(event["message"])
+
+    @property
+    def final_sentence(self):
+        return self.sentences[-1] if self.sentences else None
+
+    def contains(self, text):
+        """True if text is in a generated sentence or a displayed candidate"""
+        if any(text in sentence for sentence in self.sentences):
+            return True
+        return any(text in candidate["string"] for candidates in self.candidates for candidate in candidates)
+
+
+def parse_output(stdout, protocol="text"):
+    return EventOutput(stdout) if protocol == "jsonl" else TextOutput(stdout)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Adaptive rate limiter for the test runners
+Runs at full speed and only inserts a delay between cases while test_pinyin
+latency has degraded against its own baseline or the machine is overloaded.
+"""
+
+import os
+import time
+
+
+class AdaptiveThrottle:
+    """Additive-decrease / multiplicative-increase delay between test cases"""
+
+    def __init__(self, latency_factor=2.0, load_limit=None, max_delay=1.0, warmup=5):
+        # Latency counts as degraded once it exceeds baseline * latency_factor
+        self.latency_factor = latency_factor
+        # 1-minute load average above which we back off; defaults to CPU count
+        self.load_limit = load_limit if load_limit is not None else (os.cpu_count() or 1)
+        self.max_delay = max_delay
+        self.warmup = warmup
+        self.delay = 0.0
+        self.samples = 0
+        self.baseline = None
+        self.recent = None
+
+    def wait(self):
+        """Sleep before the next case if we are currently backing off"""
+        if self.delay > 0:
+            time.sleep(self.delay)
+
+    def overloaded(self):
+        try:
+            return os.getloadavg()[0] > self.load_limit
+        except OSError:
+            return False
+
+    def observe(self, latency):
+        """Feed the wall time of one finished case and adjust the delay"""
+        self.samples += 1
+        if self.recent is None:
+            self.recent = latency
+        else:
+            self.recent = 0.7 * self.recent + 0.3 * latency
+
+        if self.samples <= self.warmup:
+            # Baseline is the best latency seen while warming up
+            self.baseline = latency if self.baseline is None else min(self.baseline, latency)
+            return
+
+        # Let the baseline drift slowly so a legitimately slower suite settles
+        self.baseline = 0.99 * self.baseline + 0.01 * min(self.recent, self.baseline * self.latency_factor)
+
+        if self.recent > self.baseline * self.latency_factor or self.overloaded():
+            self.delay = min(self.max_delay, max(0.01, self.delay * 2))
+        else:
+            self.delay = max(0.0, self.delay - 0.01)
+
+
+def run_throttled(runner, test_case):
+    """
+    Run one case through runner.run_single_test, honouring runner.throttle
+    and runner.isolation (a user_state.CaseIsolation). The wall time of the
+    case is recorded as result["duration"].
+
+    Cache hits neither feed nor wait on the throttle: their near-zero
+    latency would become its baseline. Since a hit is only known once the
+    case has run, the delay is slept after each case that ran test_pinyin.
+    """
+    throttle = getattr(runner, "throttle", None)
+    isolation = getattr(runner, "isolation", None)
+    if isolation is not None:
+        isolation.before_case(runner)
+    started = time.monotonic()
+    result = runner.run_single_test(test_case)
+    elapsed = time.monotonic() - started
+    if isolation is not None:
+        isolation.after_case(runner)
+    if throttle is not None and not result.get("cached"):
+        throttle.observe(elapsed)
+        throttle.wait()
+    result["duration"] = round(elapsed, 4)
+    return result
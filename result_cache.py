@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of test results
+A result is keyed on the test_pinyin binary, the system dictionaries, the
+user-learned files as they are just before the case runs, and the case
+input. Every case trains and saves, so an entry also records the user files
+the case left behind. On a hit those files are restored, and the next case
+sees exactly the state it would have seen had the case really run.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import data_files
+
+
+class ResultCache:
+    def __init__(self, cache_dir=".test_cache", program_path="./test_pinyin", refresh=False):
+        self.cache_dir = cache_dir
+        # refresh: never read entries, but still write fresh ones
+        self.refresh = refresh
+        self.program_hash = data_files.hash_file(program_path)
+        # System dictionaries are hashed once per data directory
+        self._system_hashes = {}
+
+    def _system_fingerprint(self, data_dir):
+        data_dir = os.path.abspath(data_dir)
+        if data_dir not in self._system_hashes:
+            names = data_files.list_files(data_dir, user=False)
+            self._system_hashes[data_dir] = data_files.fingerprint(data_files.hash_files(data_dir, names))
+        return self._system_hashes[data_dir]
+
+    def key(self, data_dir, case_input):
+        """Cache key for running case_input against data_dir in its current state"""
+        user_hashes = data_files.hash_files(data_dir, data_files.list_files(data_dir))
+        material = json.dumps({
+            "program": self.program_hash,
+            "system": self._system_fingerprint(data_dir),
+            "user": data_files.fingerprint(user_hashes),
+            "input": case_input
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, "entries", key[:2], key + ".json")
+
+    def _blob_path(self, sha):
+        return os.path.join(self.cache_dir, "blobs", sha[:2], sha)
+
+    def lookup(self, key):
+        """Return the cached entry for key, or None"""
+        if self.refresh:
+            return None
+        try:
+            with open(self._entry_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def restore(self, data_dir, entry):
+        """Put data_dir's user files into the state the cached run left"""
+        wanted = entry["user_files"]
+        for name in data_files.list_files(data_dir):
+            if name not in wanted:
+                os.remove(os.path.join(data_dir, name))
+        for name, sha in wanted.items():
+            shutil.copyfile(self._blob_path(sha), os.path.join(data_dir, name))
+
+    def store(self, key, data_dir, result):
+        """Record result and the user files left in data_dir after the run"""
+        user_hashes = data_files.hash_files(data_dir, data_files.list_files(data_dir))
+        for name, sha in user_hashes.items():
+            blob = self._blob_path(sha)
+            if not os.path.exists(blob):
+                _atomic_copy(os.path.join(data_dir, name), blob)
+
+        entry = {"result": result, "user_files": user_hashes}
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+def _atomic_copy(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst))
+    os.close(fd)
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
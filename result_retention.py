@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Retention policy for the raw test_pinyin output stored in results
+Failing cases always keep their full output. Passing cases can keep only a
+tail of it or only a content hash, and stored blobs can be gzip or zstd
+compressed (base64 encoded so they still fit in JSON).
+"""
+
+import base64
+import gzip
+import hashlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RETAIN_MODES = ("full", "tail", "hash")
+COMPRESSIONS = ("gzip", "zstd")
+OUTPUT_FIELDS = ("output", "error")
+
+
+class RetentionPolicy:
+    """Decide how much of each result's output/error text to keep"""
+
+    def __init__(self, mode="full", tail_lines=5, compress=None):
+        if mode not in RETAIN_MODES:
+            raise ValueError(f"Unknown retention mode '{mode}' (choose from {', '.join(RETAIN_MODES)})")
+        if compress is not None and compress not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compress}' (choose from {', '.join(COMPRESSIONS)})")
+        if tail_lines < 1:
+            raise ValueError(f"tail_lines must be at least 1, not {tail_lines}")
+        if compress == "zstd" and zstandard is None:
+            raise RuntimeError("zstd compression needs the 'zstandard' package (pip install zstandard)")
+        self.mode = mode
+        self.tail_lines = tail_lines
+        self.compress = compress
+
+    def apply(self, result):
+        """Trim and/or compress the stored output fields of result in place"""
+        passed = result.get("status") == "passed"
+        for field in OUTPUT_FIELDS:
+            text = result.get(field)
+            if not text:
+                continue
+
+            if passed and self.mode != "full":
+                result[f"{field}_sha256"] = hashlib.sha256(text.encode('utf-8')).hexdigest()
+                result[f"{field}_bytes"] = len(text.encode('utf-8'))
+                if self.mode == "hash":
+                    del result[field]
+                    continue
+                lines = text.rstrip('\n').split('\n')
+                if len(lines) > self.tail_lines:
+                    text = '\n'.join(lines[-self.tail_lines:])
+                    result[f"{field}_truncated"] = True
+
+            if self.compress is not None:
+                result[f"{field}_{self.compress}"] = _compress(text, self.compress)
+                del result[field]
+            else:
+                result[field] = text
+        return result
+
+
+def _compress(text, method):
+    raw = text.encode('utf-8')
+    if method == "gzip":
+        packed = gzip.compress(raw)
+    else:
+        packed = zstandard.ZstdCompressor().compress(raw)
+    return base64.b64encode(packed).decode('ascii')
+
+
+def get_output(result, field="output"):
+    """Return the stored text of field, decompressing it if needed"""
+    if field in result:
+        return result[field]
+    if f"{field}_gzip" in result:
+        return gzip.decompress(base64.b64decode(result[f"{field}_gzip"])).decode('utf-8')
+    if f"{field}_zstd" in result:
+        if zstandard is None:
+            raise RuntimeError("Reading zstd output needs the 'zstandard' package (pip install zstandard)")
+        packed = base64.b64decode(result[f"{field}_zstd"])
+        return zstandard.ZstdDecompressor().decompressobj().decompress(packed).decode('utf-8')
+    return None
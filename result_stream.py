@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stream test results to a JSON-lines file as each case completes
+The runners keep only counters in memory while streaming; the usual
+results JSON (test_results.json shape) can be rebuilt from the stream.
+
+Usage: python3 result_stream.py results.jsonl [-o test_results.json]
+"""
+
+import json
+import sys
+
+
+class ResultStreamWriter:
+    """Append one JSON line per finished test case"""
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # Flush per line so a crash loses at most the case in flight
+        self.file.flush()
+
+    def write_start(self, start_time, total):
+        self._write({"record": "start", "start_time": start_time, "total": total})
+
+    def write(self, result):
+        self._write(result)
+
+    def write_summary(self, results):
+        """Write the runner's counters (everything but details)"""
+        summary = {k: v for k, v in results.items() if k != "details"}
+        self._write(dict(summary, record="summary"))
+
+    def truncate_to(self, keep_ids):
+        """Drop every case not in keep_ids, and the summary, from the stream"""
+        self.file.close()
+        kept = []
+        if keep_ids:
+            for record in _read_records(self.path):
+                if record.get("record") == "start" or ("record" not in record and record.get("id") in keep_ids):
+                    kept.append(record)
+        self.file = open(self.path, 'w', encoding='utf-8')
+        for record in kept:
+            self._write(record)
+
+    def flush(self):
+        if not self.file.closed:
+            self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def _read_records(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write leaves a partial last line
+                continue
+
+
+def read_results(path):
+    """Yield the per-case results stored in a stream, in file order"""
+    for record in _read_records(path):
+        if "record" not in record:
+            yield record
+
+
+def _is_passed(result):
+    if "status" in result:
+        return result["status"] == "passed"
+    return bool(result.get("passed"))
+
+
+def rebuild_results(path):
+    """Rebuild the runners' results dict (with details) from a stream"""
+    results = {
+        "passed": 0,
+        "failed": 0,
+        "errors": 0,
+        "total": 0,
+        "start_time": None,
+        "end_time": None,
+        "details": []
+    }
+    summary = None
+
+    for record in _read_records(path):
+        kind = record.get("record")
+        if kind == "start":
+            results["start_time"] = record.get("start_time")
+            results["total"] = record.get("total", 0)
+        elif kind == "summary":
+            summary = record
+        else:
+            results["details"].append(record)
+
+    # Counters come from the details so an interrupted stream still adds up
+    for detail in results["details"]:
+        if _is_passed(detail):
+            results["passed"] += 1
+        elif detail.get("status", "failed") == "failed":
+            results["failed"] += 1
+        else:
+            results["errors"] += 1
+
+    if summary is not None:
+        for key, value in summary.items():
+            if key not in ("record", "passed", "failed", "errors"):
+                results[key] = value
+    results["total"] = max(results["total"], len(results["details"]))
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild a results JSON file from a result stream")
+    parser.add_argument("stream", help="JSON-lines file written with --stream")
+    parser.add_argument("-o", "--output", help="results JSON to write (default: stdout)")
+    parser.add_argument("--details-only", action="store_true",
+                        help="write only the details list (multi_round_results.json shape)")
+    args = parser.parse_args()
+
+    results = rebuild_results(args.stream)
+    if args.details_only:
+        results = results["details"]
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Rebuilt results into {args.output}")
+    else:
+        json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+        print()
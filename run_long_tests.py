@@ -6,14 +6,29 @@ Run long sentence tests for libpinyin test_pinyin program
 
 import subprocess
 import json
-import time
+import os
 import sys
 from datetime import datetime
 
-class LongTestRunner:
+from parallel_runner import run_parallel
+from rate_limiter import run_throttled
+from latency import print_latency
+from batch import run_batch
+from native_engine import run_native
+from protocol import parse_output
+from user_state import isolate
+from checkpoint import Checkpoint, checkpoint_path, resume_run
+from result_retention import get_output
+from runner_base import (RunnerBase, add_common_args, add_retention_args, add_checkpoint_args,
+                         check_common_args, configure_runner)
+
+class LongTestRunner(RunnerBase):
+    suite = "long"
+
     def __init__(self, program_path="./test_pinyin", test_file="long_sentence_tests.json"):
-        self.program_path = program_path
-        self.test_file = test_file
+        super().__init__(program_path, test_file)
+        # Optional Checkpoint saved every few cases for --resume
+        self.checkpoint = None
         self.results = {
             "passed": 0,
             "failed": 0,
@@ -25,19 +40,45 @@ class LongTestRunner:
             "details": []
         }
     
-    def load_test_cases(self):
-        """Load test cases from JSON file"""
-        with open(self.test_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    def evaluate(self, test_case, stdout, stderr, returncode):
+        """Check one run's output against test_case"""
+        expected = test_case.get('expected_contains')
+        full_sentence = test_case.get('full_sentence', expected)
+        result = {
+            "id": test_case['id'],
+            "description": test_case['description'],
+            "prefix": test_case['prefix'],
+            "pinyin": test_case['pinyin'],
+            "full_sentence": full_sentence,
+            "expected": expected,
+            "status": "unknown",
+            "output": stdout,
+            "error": stderr
+        }
+        
+        output = parse_output(stdout, self.protocol)
+        
+        # Check if sentence is too long (>15 chars)
+        is_too_long = len(full_sentence) >= 16
+        has_too_long_warning = output.too_long
+        
+        # Check if expected phrase appears in output
+        if output.contains(expected):
+            result["status"] = "passed"
+            
+            # Track if it worked despite being too long
+            if is_too_long and has_too_long_warning:
+                result["note"] = "Worked but not added to dictionary (too long)"
+        else:
+            result["status"] = "failed"
+            result["reason"] = f"Expected '{expected}' not found in output"
+        
+        return result
     
     def run_single_test(self, test_case):
         """Run a single test case"""
-        test_id = test_case['id']
         prefix = test_case['prefix']
         pinyin = test_case['pinyin']
-        expected = test_case.get('expected_contains')
-        full_sentence = test_case.get('full_sentence', expected)
-        description = test_case['description']
         
         # Prepare input: prefix + pinyin + select first candidate (0) + quit
         input_str = f"{prefix}\n{pinyin}\n0\nquit\n"
@@ -45,90 +86,89 @@ class LongTestRunner:
         try:
             # Run the program with timeout
             process = subprocess.Popen(
-                [self.program_path],
+                self.command(),
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
-                encoding='utf-8'
+                encoding='utf-8',
+                cwd=self.cwd
             )
             
             stdout, stderr = process.communicate(input=input_str, timeout=15)
-            
-            # Check results
-            result = {
-                "id": test_id,
-                "description": description,
-                "prefix": prefix,
-                "pinyin": pinyin,
-                "full_sentence": full_sentence,
-                "expected": expected,
-                "status": "unknown",
-                "output": stdout,
-                "error": stderr
-            }
-            
-            # Check if sentence is too long (>15 chars)
-            is_too_long = len(full_sentence) >= 16
-            has_too_long_warning = "too long" in stdout
-            
-            # Check if expected phrase appears in output
-            if expected in stdout:
-                result["status"] = "passed"
-                self.results["passed"] += 1
-                
-                # Track if it worked despite being too long
-                if is_too_long and has_too_long_warning:
-                    result["note"] = "Worked but not added to dictionary (too long)"
-                    self.results["too_long_but_worked"] += 1
-            else:
-                result["status"] = "failed"
-                result["reason"] = f"Expected '{expected}' not found in output"
-                self.results["failed"] += 1
-            
-            self.results["details"].append(result)
-            return result
+            return self.evaluate(test_case, stdout, stderr, process.returncode)
             
         except subprocess.TimeoutExpired:
             process.kill()
-            result = {
-                "id": test_id,
-                "description": description,
-                "prefix": prefix,
-                "pinyin": pinyin,
-                "full_sentence": full_sentence,
-                "status": "error",
-                "reason": "Timeout (>15s)"
-            }
-            self.results["errors"] += 1
-            self.results["details"].append(result)
-            return result
+            return self.error_result(test_case, "Timeout (>15s)")
             
         except Exception as e:
-            result = {
-                "id": test_id,
-                "description": description,
-                "prefix": prefix,
-                "pinyin": pinyin,
-                "full_sentence": full_sentence,
-                "status": "error",
-                "reason": str(e)
-            }
+            return self.error_result(test_case, str(e))
+    
+    def error_result(self, test_case, reason):
+        """Result for a case the harness could not run to the end"""
+        return {
+            "id": test_case['id'],
+            "description": test_case['description'],
+            "prefix": test_case['prefix'],
+            "pinyin": test_case['pinyin'],
+            "full_sentence": test_case.get('full_sentence', test_case.get('expected_contains')),
+            "status": "error",
+            "reason": reason
+        }
+    
+    def _record_result(self, result):
+        """Count a finished test case and keep its details"""
+        if result["status"] == "passed":
+            self.results["passed"] += 1
+        elif result["status"] == "failed":
+            self.results["failed"] += 1
+        else:
             self.results["errors"] += 1
+        if self.retention is not None:
+            self.retention.apply(result)
+        if result.get("note"):
+            self.results["too_long_but_worked"] += 1
+        if self.stream is not None:
+            self.stream.write(result)
+        else:
             self.results["details"].append(result)
-            return result
     
-    def run_all_tests(self):
-        """Run all test cases"""
+    def run_all_tests(self, jobs=1, resume=False):
+        """Run all test cases, on jobs worker processes if jobs > 1"""
         test_cases = self.load_test_cases()
-        self.results["total"] = len(test_cases)
-        self.results["start_time"] = datetime.now().isoformat()
+        if self.shard is not None:
+            test_cases = self.shard.select(test_cases)
+            self.results["shard"] = str(self.shard)
+            print(f"Shard {self.shard}: {len(test_cases)} case(s)")
+        done = set()
+        if resume and self.checkpoint is not None:
+            done = resume_run(self)
+        if not done:
+            self.results["total"] = len(test_cases)
+            self.results["start_time"] = datetime.now().isoformat()
+            if self.stream is not None:
+                self.stream.write_start(self.results["start_time"], self.results["total"])
+        pending = [test_case for test_case in test_cases if test_case['id'] not in done]
         
         print(f"Running {len(test_cases)} long sentence test cases...")
         print("=" * 70)
         
-        for i, test_case in enumerate(test_cases, 1):
-            result = self.run_single_test(test_case)
+        if self.batch:
+            results = run_batch(self, pending)
+        elif self.engine == "native":
+            results = run_native(self, pending)
+        elif jobs > 1:
+            results = run_parallel(self, pending, jobs)
+        else:
+            results = (run_throttled(self, test_case) for test_case in pending)
+        
+        for i, result in enumerate(results, len(done) + 1):
+            self._record_result(result)
+            done.add(result['id'])
+            if self.checkpoint is not None:
+                self.checkpoint.update(self.test_file, self.results, done,
+                                       os.path.join(self.cwd or ".", "data"))
             
             # Print progress
             status_symbol = {
@@ -146,19 +186,22 @@ class LongTestRunner:
                 print(f"         Reason: {result.get('reason', 'Unknown')}")
             elif result["status"] == "passed" and result.get("note"):
                 print(f"         Note: {result['note']}")
-            
-            # Small delay
-            time.sleep(0.05)
         
         self.results["end_time"] = datetime.now().isoformat()
+        if self.stream is not None:
+            self.stream.write_summary(self.results)
+        if self.checkpoint is not None:
+            self.checkpoint.remove()
         
         # Print summary
         print("=" * 70)
         print("\nLong Sentence Test Summary:")
         print(f"  Total:   {self.results['total']}")
-        print(f"  Passed:  {self.results['passed']} ({self.results['passed']/self.results['total']*100:.1f}%)")
-        print(f"  Failed:  {self.results['failed']} ({self.results['failed']/self.results['total']*100:.1f}%)")
-        print(f"  Errors:  {self.results['errors']} ({self.results['errors']/self.results['total']*100:.1f}%)")
+        # An empty shard or query still gets a summary
+        total = self.results['total'] or 1
+        print(f"  Passed:  {self.results['passed']} ({self.results['passed']/total*100:.1f}%)")
+        print(f"  Failed:  {self.results['failed']} ({self.results['failed']/total*100:.1f}%)")
+        print(f"  Errors:  {self.results['errors']} ({self.results['errors']/total*100:.1f}%)")
         print(f"\n  Worked but too long for dictionary: {self.results['too_long_but_worked']}")
         
         # Calculate duration
@@ -171,13 +214,18 @@ class LongTestRunner:
     
     def save_results(self, filename="long_test_results.json"):
         """Save test results to JSON file"""
+        if self.stream is not None:
+            # Everything is already on disk; rebuild with result_stream.py
+            self.stream.close()
+            print(f"\nDetailed results streamed to {self.stream.path}")
+            return
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(self.results, f, ensure_ascii=False, indent=2)
         print(f"\nDetailed results saved to {filename}")
     
     def print_failures(self):
         """Print detailed information about failures"""
-        failures = [d for d in self.results["details"] if d["status"] != "passed"]
+        failures = [d for d in self.iter_details() if d["status"] != "passed"]
         
         if not failures:
             print("\n🎉 All long sentence tests passed!")
@@ -194,32 +242,50 @@ class LongTestRunner:
             print(f"    Pinyin: {fail['pinyin']}")
             print(f"    Reason: {fail.get('reason', 'Unknown')}")
             
-            if fail.get('output'):
-                # Find the actual sentence generated
-                lines = fail['output'].strip().split('\n')
-                for line in lines:
-                    if 'sentence:' in line:
-                        print(f"    Got: {line}")
-                        break
+            output = get_output(fail)
+            if output:
+                # Show the first sentence actually generated
+                sentences = parse_output(output, self.protocol).sentences
+                if sentences:
+                    print(f"    Got: {sentences[0]}")
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Run long sentence test cases")
+    add_common_args(parser)
+    add_retention_args(parser)
+    add_checkpoint_args(parser)
+    args = parser.parse_args()
+    shard = check_common_args(parser, args)
+    
     # Check if program exists
-    import os
-    if not os.path.exists("./test_pinyin"):
+    if args.engine == "process" and not os.path.exists("./test_pinyin"):
         print("Error: test_pinyin program not found!")
         print("Please run 'make' first to build the program.")
         sys.exit(1)
     
     # Check if test cases exist
-    if not os.path.exists("long_sentence_tests.json"):
+    if not args.db and not os.path.exists("long_sentence_tests.json"):
         print("Generating long sentence test cases...")
         subprocess.run(["python3", "generate_long_tests.py"])
     
     # Run tests
     runner = LongTestRunner()
-    results = runner.run_all_tests()
+    configure_runner(runner, args, shard)
+    # Workers train their own copies of data/, which a checkpoint would not capture
+    if args.checkpoint_every > 0 and not args.batch and args.jobs == 1:
+        runner.checkpoint = Checkpoint(checkpoint_path("long_test_results", shard), every=args.checkpoint_every)
+    finish_isolation = isolate(runner, args.isolate, args.snapshot_store)
+    try:
+        results = runner.run_all_tests(jobs=args.jobs, resume=args.resume)
+    finally:
+        finish_isolation()
     runner.save_results()
+    if runner.store is not None:
+        runner.store.record_results(runner.suite, runner.iter_details())
     runner.print_failures()
+    print_latency(runner.iter_details())
     
     # Exit with appropriate code
     if results["failed"] > 0 or results["errors"] > 0:
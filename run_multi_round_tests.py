@@ -8,25 +8,38 @@ and accepts multiple input-search-select cycles.
 import json
 import subprocess
 import sys
-import select
 import os
 
-def run_multi_round_tests(test_file, executable="./test_pinyin"):
-    """Run multi-round tests from a JSON file."""
-    
-    # Load test cases
-    with open(test_file, 'r', encoding='utf-8') as f:
-        test_cases = json.load(f)
-    
-    print(f"Running {len(test_cases)} multi-round test cases...\n")
-    
-    results = []
-    passed = 0
-    failed = 0
-    
-    for idx, test_case in enumerate(test_cases):
-        print(f"Test {idx + 1}/{len(test_cases)}: {test_case['description']}")
-        
+from parallel_runner import run_parallel
+from rate_limiter import run_throttled
+from latency import print_latency
+from batch import run_batch
+from native_engine import run_native
+from protocol import parse_output
+from user_state import isolate
+from runner_base import RunnerBase, add_common_args, check_common_args, configure_runner
+
+class MultiRoundTestRunner(RunnerBase):
+    suite = "multi_round"
+
+    def __init__(self, program_path="./test_pinyin", test_file="multi_round_tests.json"):
+        super().__init__(program_path, test_file)
+        self.results = {
+            "passed": 0,
+            "failed": 0,
+            "total": 0,
+            "details": []
+        }
+
+    def load_test_cases(self):
+        """Load test cases from a JSON or JSONL file or the test store, numbering them from 1"""
+        test_cases = super().load_test_cases()
+        for idx, test_case in enumerate(test_cases):
+            test_case.setdefault('test_number', idx + 1)
+        return test_cases
+
+    def run_single_test(self, test_case):
+        """Run one multi-round test case in a single test_pinyin process"""
         # Prepare all inputs upfront
         inputs = []
         for round_data in test_case['rounds']:
@@ -34,111 +47,185 @@ def run_multi_round_tests(test_file, executable="./test_pinyin"):
             inputs.append(round_data['pinyin'])
             for selection in round_data['selections']:
                 inputs.append(str(selection['choice_index']))
-        
+
         # Add EOF marker
         input_str = '\n'.join(inputs) + '\n'
-        
+
         # Run the process
         try:
             result = subprocess.run(
-                [executable],
+                self.command(),
                 input=input_str,
                 capture_output=True,
                 text=True,
-                timeout=10
+                timeout=10,
+                cwd=self.cwd
             )
-            
-            output = result.stdout
-            
-            # Parse output to extract sentences
-            sentences = []
-            for line in output.split('\n'):
-                if "sentence:" in line:
-                    # Extract sentence after "sentence:" marker
-                    sentence = line.split("sentence:", 1)[1].strip()
-                    sentences.append(sentence)
-            
-            # Check if we got the right number of sentences (one per round)
-            test_passed = True
-            round_results = []
-            
-            if len(sentences) < len(test_case['rounds']):
-                test_passed = False
-                print(f"  ✗ FAILED: Expected {len(test_case['rounds'])} sentences, got {len(sentences)}")
-                round_results.append({"error": f"Not enough sentences: {len(sentences)}/{len(test_case['rounds'])}"})
-            else:
-                # Check each round's expected result
-                for round_idx, round_data in enumerate(test_case['rounds']):
-                    expected = round_data['expected']
-                    # Each round produces one final sentence
-                    if round_idx < len(sentences):
-                        actual = sentences[round_idx]
-                        if actual == expected:
-                            round_results.append({
-                                "round": round_idx + 1,
-                                "passed": True
-                            })
-                            print(f"  Round {round_idx + 1}: ✓ PASSED")
-                        else:
-                            test_passed = False
-                            round_results.append({
-                                "round": round_idx + 1,
-                                "passed": False,
-                                "expected": expected,
-                                "actual": actual
-                            })
-                            print(f"  Round {round_idx + 1}: ✗ FAILED - expected '{expected}', got '{actual}'")
-                    else:
-                        test_passed = False
-                        round_results.append({
-                            "round": round_idx + 1,
-                            "passed": False,
-                            "error": "No sentence found"
-                        })
-                        print(f"  Round {round_idx + 1}: ✗ FAILED - no sentence")
-            
+            return self.evaluate(test_case, result.stdout, result.stderr, result.returncode)
+
         except subprocess.TimeoutExpired:
-            test_passed = False
-            print(f"  ✗ TIMEOUT")
-            round_results.append({"error": "Timeout"})
+            return self.error_result(test_case, "Timeout")
         except Exception as e:
+            return self.error_result(test_case, str(e))
+
+    def error_result(self, test_case, reason):
+        """Result for a case the harness could not run to the end"""
+        return {
+            "test_number": test_case['test_number'],
+            "description": test_case['description'],
+            "passed": False,
+            "round_count": len(test_case['rounds']),
+            "rounds": [{"error": reason}]
+        }
+
+    def evaluate(self, test_case, stdout, stderr, returncode):
+        """Check one run's output against test_case"""
+        test_passed = True
+        round_results = []
+
+        # Parse output to extract sentences
+        sentences = parse_output(stdout, self.protocol).sentences
+
+        # Check if we got the right number of sentences (one per round)
+        if len(sentences) < len(test_case['rounds']):
             test_passed = False
-            print(f"  ✗ ERROR: {e}")
-            round_results.append({"error": str(e)})
-        
-        if test_passed:
-            passed += 1
-            print(f"  Overall: ✓ PASSED\n")
+            round_results.append({"error": f"Not enough sentences: {len(sentences)}/{len(test_case['rounds'])}"})
         else:
-            failed += 1
-            print(f"  Overall: ✗ FAILED\n")
-        
-        results.append({
-            "test_number": idx + 1,
+            # Check each round's expected result
+            for round_idx, round_data in enumerate(test_case['rounds']):
+                expected = round_data['expected']
+                # Each round produces one final sentence
+                actual = sentences[round_idx]
+                if actual == expected:
+                    round_results.append({
+                        "round": round_idx + 1,
+                        "passed": True
+                    })
+                else:
+                    test_passed = False
+                    round_results.append({
+                        "round": round_idx + 1,
+                        "passed": False,
+                        "expected": expected,
+                        "actual": actual
+                    })
+
+        return {
+            "test_number": test_case['test_number'],
             "description": test_case['description'],
             "passed": test_passed,
+            "round_count": len(test_case['rounds']),
             "rounds": round_results
-        })
-    
-    # Summary
-    print("=" * 60)
-    print(f"Total: {len(test_cases)} tests")
-    print(f"Passed: {passed}")
-    print(f"Failed: {failed}")
-    print(f"Success rate: {100 * passed / len(test_cases):.1f}%")
-    
-    # Save results
-    output_file = "multi_round_results.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
-    print(f"\nResults saved to {output_file}")
-    
-    return failed == 0
+        }
+
+    def _record_result(self, result):
+        """Count a finished test case and keep its details"""
+        if result["passed"]:
+            self.results["passed"] += 1
+        else:
+            self.results["failed"] += 1
+        if self.stream is not None:
+            self.stream.write(result)
+        else:
+            self.results["details"].append(result)
+
+    def print_result(self, result):
+        """Print the per-round outcome of one test case"""
+        for round_result in result["rounds"]:
+            if "error" in round_result:
+                if round_result["error"] == "Timeout":
+                    print(f"  ✗ TIMEOUT")
+                elif round_result["error"].startswith("Not enough sentences"):
+                    print(f"  ✗ FAILED: {round_result['error']}")
+                else:
+                    print(f"  ✗ ERROR: {round_result['error']}")
+            elif round_result["passed"]:
+                print(f"  Round {round_result['round']}: ✓ PASSED")
+            else:
+                print(f"  Round {round_result['round']}: ✗ FAILED - expected '{round_result['expected']}', got '{round_result['actual']}'")
+
+        if result["passed"]:
+            print(f"  Overall: ✓ PASSED\n")
+        else:
+            print(f"  Overall: ✗ FAILED\n")
+
+    def run_all_tests(self, jobs=1):
+        """Run all test cases, on jobs worker processes if jobs > 1"""
+        test_cases = self.load_test_cases()
+        if self.shard is not None:
+            test_cases = self.shard.select(test_cases)
+            self.results["shard"] = str(self.shard)
+            print(f"Shard {self.shard}: {len(test_cases)} case(s)")
+        self.results["total"] = len(test_cases)
+
+        print(f"Running {len(test_cases)} multi-round test cases...\n")
+        if self.stream is not None:
+            self.stream.write_start(None, self.results["total"])
+
+        if self.batch:
+            results = run_batch(self, test_cases)
+        elif self.engine == "native":
+            results = run_native(self, test_cases)
+        elif jobs > 1:
+            results = run_parallel(self, test_cases, jobs)
+        else:
+            results = (run_throttled(self, test_case) for test_case in test_cases)
+
+        for idx, result in enumerate(results):
+            self._record_result(result)
+            print(f"Test {idx + 1}/{len(test_cases)}: {result['description']}")
+            self.print_result(result)
+
+        if self.stream is not None:
+            self.stream.write_summary(self.results)
+
+        # Summary
+        print("=" * 60)
+        print(f"Total: {self.results['total']} tests")
+        print(f"Passed: {self.results['passed']}")
+        print(f"Failed: {self.results['failed']}")
+        # An empty shard or query still gets a summary
+        print(f"Success rate: {100 * self.results['passed'] / (self.results['total'] or 1):.1f}%")
+
+        return self.results
+
+    def save_results(self, filename="multi_round_results.json"):
+        """Save per-test results to JSON file"""
+        if self.stream is not None:
+            # Everything is already on disk; rebuild with result_stream.py --details-only
+            self.stream.close()
+            print(f"\nResults streamed to {self.stream.path}")
+            return
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.results["details"], f, ensure_ascii=False, indent=2)
+        print(f"\nResults saved to {filename}")
+
+def run_multi_round_tests(test_file, executable="./test_pinyin", args=None, shard=None):
+    """Run multi-round tests from a JSON file, with the runner options in args if given"""
+    runner = MultiRoundTestRunner(program_path=executable, test_file=test_file)
+    jobs, isolate_mode, snapshot_store = 1, "none", "memory"
+    if args is not None:
+        configure_runner(runner, args, shard)
+        jobs, isolate_mode, snapshot_store = args.jobs, args.isolate, args.snapshot_store
+    finish_isolation = isolate(runner, isolate_mode, snapshot_store)
+    try:
+        results = runner.run_all_tests(jobs=jobs)
+    finally:
+        finish_isolation()
+    runner.save_results()
+    if runner.store is not None:
+        runner.store.record_results(runner.suite, runner.iter_details())
+    print_latency(runner.iter_details())
+    return results["failed"] == 0
 
 if __name__ == "__main__":
-    test_file = "multi_round_tests.json"
-    if len(sys.argv) > 1:
-        test_file = sys.argv[1]
-    
-    success = run_multi_round_tests(test_file)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run multi-round test cases")
+    parser.add_argument("test_file", nargs="?", default="multi_round_tests.json")
+    add_common_args(parser)
+    args = parser.parse_args()
+    shard = check_common_args(parser, args)
+
+    success = run_multi_round_tests(args.test_file, args=args, shard=shard)
     sys.exit(0 if success else 1)
@@ -7,14 +7,28 @@ Simulates real user behavior with multiple candidate selections
 
 import subprocess
 import json
-import time
+import os
 import sys
 from datetime import datetime
 
-class MultiSelectionTestRunner:
+from parallel_runner import run_parallel
+from rate_limiter import run_throttled
+from latency import print_latency
+from batch import run_batch
+from native_engine import run_native
+from protocol import parse_output
+from user_state import isolate
+from checkpoint import Checkpoint, checkpoint_path, resume_run
+from runner_base import (RunnerBase, add_common_args, add_retention_args, add_checkpoint_args,
+                         check_common_args, configure_runner)
+
+class MultiSelectionTestRunner(RunnerBase):
+    suite = "multi_selection"
+
     def __init__(self, program_path="./test_pinyin", test_file="multi_selection_tests.json"):
-        self.program_path = program_path
-        self.test_file = test_file
+        super().__init__(program_path, test_file)
+        # Optional Checkpoint saved every few cases for --resume
+        self.checkpoint = None
         self.results = {
             "passed": 0,
             "failed": 0,
@@ -25,19 +39,67 @@ class MultiSelectionTestRunner:
             "details": []
         }
     
-    def load_test_cases(self):
-        """Load test cases from JSON file"""
-        with open(self.test_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    def evaluate(self, test_case, stdout, stderr, returncode):
+        """Check one run's output against test_case"""
+        selections = test_case['selections']
+        final_sentence = test_case['final_sentence']
+        
+        # Parse output to check each selection
+        result = {
+            "id": test_case['id'],
+            "description": test_case['description'],
+            "prefix": test_case['prefix'],
+            "pinyin": test_case['pinyin'],
+            "selections": selections,
+            "final_sentence": final_sentence,
+            "status": "unknown",
+            "output": stdout,
+            "error": stderr,
+            "selection_results": []
+        }
+        
+        # Extract sentence outputs
+        output = parse_output(stdout, self.protocol)
+        sentence_lines = output.sentences
+        
+        # Check each selection result
+        all_selections_passed = True
+        for i, (selection, sentence) in enumerate(zip(selections, sentence_lines)):
+            expected = selection['expected_contains']
+            found = expected in sentence
+            
+            result["selection_results"].append({
+                "step": i + 1,
+                "expected": expected,
+                "found": found,
+                "actual": sentence
+            })
+            
+            if not found:
+                all_selections_passed = False
+        
+        # Overall result
+        if all_selections_passed and len(sentence_lines) >= len(selections):
+            result["status"] = "passed"
+            
+            # Check if final sentence is too long
+            if output.too_long:
+                result["note"] = f"Final sentence too long ({len(final_sentence)} chars)"
+        else:
+            result["status"] = "failed"
+            if len(sentence_lines) < len(selections):
+                result["reason"] = f"Expected {len(selections)} selections, got {len(sentence_lines)}"
+            else:
+                failed_steps = [r["step"] for r in result["selection_results"] if not r["found"]]
+                result["reason"] = f"Selection step(s) {failed_steps} failed"
+        
+        return result
     
     def run_single_test(self, test_case):
         """Run a single multi-selection test case"""
-        test_id = test_case['id']
         prefix = test_case['prefix']
         pinyin = test_case['pinyin']
         selections = test_case['selections']
-        final_sentence = test_case['final_sentence']
-        description = test_case['description']
         
         # Build input: prefix + pinyin + multiple selections + quit
         input_lines = [prefix, pinyin]
@@ -49,112 +111,88 @@ class MultiSelectionTestRunner:
         try:
             # Run the program with timeout
             process = subprocess.Popen(
-                [self.program_path],
+                self.command(),
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
-                encoding='utf-8'
+                encoding='utf-8',
+                cwd=self.cwd
             )
             
             stdout, stderr = process.communicate(input=input_str, timeout=20)
-            
-            # Parse output to check each selection
-            result = {
-                "id": test_id,
-                "description": description,
-                "prefix": prefix,
-                "pinyin": pinyin,
-                "selections": selections,
-                "final_sentence": final_sentence,
-                "status": "unknown",
-                "output": stdout,
-                "error": stderr,
-                "selection_results": []
-            }
-            
-            # Extract sentence outputs
-            lines = stdout.split('\n')
-            sentence_lines = [line for line in lines if 'sentence:' in line]
-            
-            # Check each selection result
-            all_selections_passed = True
-            for i, (selection, sentence_line) in enumerate(zip(selections, sentence_lines)):
-                expected = selection['expected_contains']
-                found = expected in sentence_line
-                
-                result["selection_results"].append({
-                    "step": i + 1,
-                    "expected": expected,
-                    "found": found,
-                    "actual": sentence_line.replace('sentence:', '').strip() if 'sentence:' in sentence_line else ""
-                })
-                
-                if not found:
-                    all_selections_passed = False
-            
-            # Overall result
-            if all_selections_passed and len(sentence_lines) >= len(selections):
-                result["status"] = "passed"
-                self.results["passed"] += 1
-                
-                # Check if final sentence is too long
-                if "too long" in stdout:
-                    result["note"] = f"Final sentence too long ({len(final_sentence)} chars)"
-            else:
-                result["status"] = "failed"
-                if len(sentence_lines) < len(selections):
-                    result["reason"] = f"Expected {len(selections)} selections, got {len(sentence_lines)}"
-                else:
-                    failed_steps = [r["step"] for r in result["selection_results"] if not r["found"]]
-                    result["reason"] = f"Selection step(s) {failed_steps} failed"
-                self.results["failed"] += 1
-            
-            self.results["details"].append(result)
-            return result
+            return self.evaluate(test_case, stdout, stderr, process.returncode)
             
         except subprocess.TimeoutExpired:
             process.kill()
-            result = {
-                "id": test_id,
-                "description": description,
-                "prefix": prefix,
-                "pinyin": pinyin,
-                "selections": selections,
-                "final_sentence": final_sentence,
-                "status": "error",
-                "reason": "Timeout (>20s)"
-            }
-            self.results["errors"] += 1
-            self.results["details"].append(result)
-            return result
+            return self.error_result(test_case, "Timeout (>20s)")
             
         except Exception as e:
-            result = {
-                "id": test_id,
-                "description": description,
-                "prefix": prefix,
-                "pinyin": pinyin,
-                "selections": selections,
-                "final_sentence": final_sentence,
-                "status": "error",
-                "reason": str(e)
-            }
+            return self.error_result(test_case, str(e))
+    
+    def error_result(self, test_case, reason):
+        """Result for a case the harness could not run to the end"""
+        return {
+            "id": test_case['id'],
+            "description": test_case['description'],
+            "prefix": test_case['prefix'],
+            "pinyin": test_case['pinyin'],
+            "selections": test_case['selections'],
+            "final_sentence": test_case['final_sentence'],
+            "status": "error",
+            "reason": reason
+        }
+    
+    def _record_result(self, result):
+        """Count a finished test case and keep its details"""
+        if result["status"] == "passed":
+            self.results["passed"] += 1
+        elif result["status"] == "failed":
+            self.results["failed"] += 1
+        else:
             self.results["errors"] += 1
+        if self.retention is not None:
+            self.retention.apply(result)
+        if self.stream is not None:
+            self.stream.write(result)
+        else:
             self.results["details"].append(result)
-            return result
     
-    def run_all_tests(self):
-        """Run all test cases"""
+    def run_all_tests(self, jobs=1, resume=False):
+        """Run all test cases, on jobs worker processes if jobs > 1"""
         test_cases = self.load_test_cases()
-        self.results["total"] = len(test_cases)
-        self.results["start_time"] = datetime.now().isoformat()
+        if self.shard is not None:
+            test_cases = self.shard.select(test_cases)
+            self.results["shard"] = str(self.shard)
+            print(f"Shard {self.shard}: {len(test_cases)} case(s)")
+        done = set()
+        if resume and self.checkpoint is not None:
+            done = resume_run(self)
+        if not done:
+            self.results["total"] = len(test_cases)
+            self.results["start_time"] = datetime.now().isoformat()
+            if self.stream is not None:
+                self.stream.write_start(self.results["start_time"], self.results["total"])
+        pending = [test_case for test_case in test_cases if test_case['id'] not in done]
         
         print(f"Running {len(test_cases)} multi-selection test cases...")
         print("=" * 80)
         
-        for i, test_case in enumerate(test_cases, 1):
-            result = self.run_single_test(test_case)
+        if self.batch:
+            results = run_batch(self, pending)
+        elif self.engine == "native":
+            results = run_native(self, pending)
+        elif jobs > 1:
+            results = run_parallel(self, pending, jobs)
+        else:
+            results = (run_throttled(self, test_case) for test_case in pending)
+        
+        for i, result in enumerate(results, len(done) + 1):
+            self._record_result(result)
+            done.add(result['id'])
+            if self.checkpoint is not None:
+                self.checkpoint.update(self.test_file, self.results, done,
+                                       os.path.join(self.cwd or ".", "data"))
             
             # Print progress
             status_symbol = {
@@ -178,19 +216,22 @@ class MultiSelectionTestRunner:
                             print(f"        Step {sr['step']}: Expected '{sr['expected']}', got '{sr['actual']}'")
             elif result["status"] == "passed" and result.get("note"):
                 print(f"        Note: {result['note']}")
-            
-            # Small delay
-            time.sleep(0.05)
         
         self.results["end_time"] = datetime.now().isoformat()
+        if self.stream is not None:
+            self.stream.write_summary(self.results)
+        if self.checkpoint is not None:
+            self.checkpoint.remove()
         
         # Print summary
         print("=" * 80)
         print("\nMulti-Selection Test Summary:")
         print(f"  Total:   {self.results['total']}")
-        print(f"  Passed:  {self.results['passed']} ({self.results['passed']/self.results['total']*100:.1f}%)")
-        print(f"  Failed:  {self.results['failed']} ({self.results['failed']/self.results['total']*100:.1f}%)")
-        print(f"  Errors:  {self.results['errors']} ({self.results['errors']/self.results['total']*100:.1f}%)")
+        # An empty shard or query still gets a summary
+        total = self.results['total'] or 1
+        print(f"  Passed:  {self.results['passed']} ({self.results['passed']/total*100:.1f}%)")
+        print(f"  Failed:  {self.results['failed']} ({self.results['failed']/total*100:.1f}%)")
+        print(f"  Errors:  {self.results['errors']} ({self.results['errors']/total*100:.1f}%)")
         
         # Calculate duration
         start = datetime.fromisoformat(self.results["start_time"])
@@ -202,13 +243,18 @@ class MultiSelectionTestRunner:
     
     def save_results(self, filename="multi_selection_results.json"):
         """Save test results to JSON file"""
+        if self.stream is not None:
+            # Everything is already on disk; rebuild with result_stream.py
+            self.stream.close()
+            print(f"\nDetailed results streamed to {self.stream.path}")
+            return
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(self.results, f, ensure_ascii=False, indent=2)
         print(f"\nDetailed results saved to {filename}")
     
     def print_failures(self):
         """Print detailed information about failures"""
-        failures = [d for d in self.results["details"] if d["status"] != "passed"]
+        failures = [d for d in self.iter_details() if d["status"] != "passed"]
         
         if not failures:
             print("\n🎉 All multi-selection tests passed!")
@@ -235,16 +281,25 @@ class MultiSelectionTestRunner:
     
     def print_statistics(self):
         """Print detailed statistics"""
-        if not self.results["details"]:
+        if not self.results["total"]:
             return
         
         print(f"\n{'=' * 80}")
         print("Detailed Statistics:")
         print(f"{'=' * 80}")
         
-        # Count by number of steps
+        # Count by number of steps and by prefix usage in one pass
         step_counts = {}
-        for detail in self.results["details"]:
+        prefix_counts = {
+            True: {"passed": 0, "total": 0},
+            False: {"passed": 0, "total": 0}
+        }
+        for detail in self.iter_details():
+            with_prefix = bool(detail.get('prefix'))
+            prefix_counts[with_prefix]["total"] += 1
+            if detail["status"] == "passed":
+                prefix_counts[with_prefix]["passed"] += 1
+            
             num_steps = len(detail.get('selections', []))
             if num_steps not in step_counts:
                 step_counts[num_steps] = {"passed": 0, "failed": 0, "total": 0}
@@ -261,36 +316,73 @@ class MultiSelectionTestRunner:
             print(f"  {steps}-step: {counts['passed']}/{counts['total']} passed ({pass_rate:.1f}%)")
         
         # Count with/without prefix
-        with_prefix = [d for d in self.results["details"] if d.get('prefix')]
-        without_prefix = [d for d in self.results["details"] if not d.get('prefix')]
+        with_prefix = prefix_counts[True]
+        without_prefix = prefix_counts[False]
         
         print(f"\nBy prefix usage:")
-        if with_prefix:
-            passed_with = len([d for d in with_prefix if d['status'] == 'passed'])
-            print(f"  With prefix: {passed_with}/{len(with_prefix)} passed ({passed_with/len(with_prefix)*100:.1f}%)")
-        if without_prefix:
-            passed_without = len([d for d in without_prefix if d['status'] == 'passed'])
-            print(f"  Without prefix: {passed_without}/{len(without_prefix)} passed ({passed_without/len(without_prefix)*100:.1f}%)")
+        if with_prefix["total"]:
+            passed_with = with_prefix["passed"]
+            print(f"  With prefix: {passed_with}/{with_prefix['total']} passed ({passed_with/with_prefix['total']*100:.1f}%)")
+        if without_prefix["total"]:
+            passed_without = without_prefix["passed"]
+            print(f"  Without prefix: {passed_without}/{without_prefix['total']} passed ({passed_without/without_prefix['total']*100:.1f}%)")
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Run multi-selection test cases")
+    add_common_args(parser)
+    add_retention_args(parser)
+    add_checkpoint_args(parser)
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="drive --jobs prompt-aware sessions from one asyncio event loop")
+    args = parser.parse_args()
+    shard = check_common_args(parser, args)
+    if args.use_async and args.engine == "native":
+        parser.error("--engine native runs every case in this process; drop --async")
+    if args.use_async and args.isolate == "case":
+        parser.error("--isolate case is not supported with --async; use --isolate suite")
+    if args.use_async and args.resume:
+        parser.error("--resume cannot be combined with --async")
+    if args.use_async and args.batch:
+        parser.error("--batch cannot be combined with --async")
+    if args.use_async and args.throttle:
+        parser.error("--throttle cannot be combined with --async")
+    if args.use_async and args.protocol != "text":
+        parser.error("--async only understands --protocol text")
+    
     # Check if program exists
-    import os
-    if not os.path.exists("./test_pinyin"):
+    if args.engine == "process" and not os.path.exists("./test_pinyin"):
         print("Error: test_pinyin program not found!")
         print("Please run 'make' first to build the program.")
         sys.exit(1)
     
     # Check if test cases exist
-    if not os.path.exists("multi_selection_tests.json"):
+    if not args.db and not os.path.exists("multi_selection_tests.json"):
         print("Generating multi-selection test cases...")
         subprocess.run(["python3", "generate_multi_selection_tests.py"])
     
     # Run tests
-    runner = MultiSelectionTestRunner()
-    results = runner.run_all_tests()
+    if args.use_async:
+        from async_runner import AsyncMultiSelectionTestRunner
+        runner = AsyncMultiSelectionTestRunner(concurrency=args.jobs)
+    else:
+        runner = MultiSelectionTestRunner()
+    configure_runner(runner, args, shard)
+    # Workers train their own copies of data/, which a checkpoint would not capture
+    if args.checkpoint_every > 0 and not args.use_async and not args.batch and args.jobs == 1:
+        runner.checkpoint = Checkpoint(checkpoint_path("multi_selection_results", shard), every=args.checkpoint_every)
+    finish_isolation = isolate(runner, args.isolate, args.snapshot_store)
+    try:
+        results = runner.run_all_tests(jobs=args.jobs, resume=args.resume)
+    finally:
+        finish_isolation()
     runner.save_results()
+    if runner.store is not None:
+        runner.store.record_results(runner.suite, runner.iter_details())
     runner.print_failures()
     runner.print_statistics()
+    print_latency(runner.iter_details())
     
     # Exit with appropriate code
     if results["failed"] > 0 or results["errors"] > 0:
@@ -6,14 +6,36 @@ Run automated tests for libpinyin test_pinyin program
 
 import subprocess
 import json
-import time
+import os
 import sys
 from datetime import datetime
 
-class TestRunner:
-    def __init__(self, program_path="./test_pinyin", test_file="test_cases.json"):
-        self.program_path = program_path
-        self.test_file = test_file
+from pinyin_session import PinyinSession
+from parallel_runner import run_parallel
+from rate_limiter import run_throttled
+from latency import print_latency
+from batch import run_batch
+from native_engine import run_native
+from protocol import parse_output
+from user_state import isolate
+from result_retention import get_output
+from result_cache import ResultCache
+from runner_base import (RunnerBase, add_common_args, add_retention_args, check_common_args,
+                         configure_runner)
+
+class TestRunner(RunnerBase):
+    suite = "basic"
+
+    def __init__(self, program_path="./test_pinyin", test_file="test_cases.json", use_session=False):
+        super().__init__(program_path, test_file)
+        # Keep one test_pinyin alive for all cases instead of one process per case
+        self.use_session = use_session
+        self.session = None
+        # Set when a cache hit restored data/ under a live session, whose
+        # in-memory tables then no longer match the files
+        self.session_stale = False
+        # Optional ResultCache; hits skip test_pinyin entirely
+        self.cache = None
         self.results = {
             "passed": 0,
             "failed": 0,
@@ -24,106 +46,186 @@ class TestRunner:
             "details": []
         }
     
-    def load_test_cases(self):
-        """Load test cases from JSON file"""
-        with open(self.test_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    
     def run_single_test(self, test_case):
-        """Run a single test case"""
-        test_id = test_case['id']
+        """Run a single test case, answering from the result cache when possible"""
+        if self.cache is None:
+            return self._execute_test(test_case)
+        
+        data_dir = os.path.join(self.cwd or ".", "data")
+        cache_key = self.cache.key(data_dir, {
+            "prefix": test_case['prefix'],
+            "pinyin": test_case['pinyin'],
+            "selections": [0],
+            "expected_contains": test_case.get('expected_contains'),
+            "protocol": self.protocol,
+            "read_only": self.read_only,
+            "window": self.window,
+            "lazy_sentence": self.lazy_sentence,
+            "save_policy": self.save_policy
+        })
+        entry = self.cache.lookup(cache_key)
+        if entry is not None:
+            # A read-only run left the user files as they are now
+            if not self.read_only:
+                self.cache.restore(data_dir, entry)
+                # Replaced only if a later case misses, so runs of hits keep the session
+                if self.session is not None:
+                    self.session_stale = True
+            result = entry["result"]
+            result["id"] = test_case['id']
+            result["description"] = test_case['description']
+            result["cached"] = True
+            return result
+        
+        result = self._execute_test(test_case)
+        # Timeouts and crashes of the harness itself are not worth remembering
+        if result["status"] != "error":
+            self.cache.store(cache_key, data_dir, result)
+        return result
+    
+    def _drop_stale_session(self):
+        """Kill a session that cache hits left behind, without the save it would make on exit"""
+        if self.session_stale:
+            self.session.kill()
+            self.session = None
+            self.session_stale = False
+
+    def evaluate(self, test_case, stdout, stderr, returncode):
+        """Check one run's output against test_case"""
+        expected = test_case.get('expected_contains')
+        result = {
+            "id": test_case['id'],
+            "description": test_case['description'],
+            "prefix": test_case['prefix'],
+            "pinyin": test_case['pinyin'],
+            "status": "unknown",
+            "output": stdout,
+            "error": stderr
+        }
+        
+        output = parse_output(stdout, self.protocol)
+        
+        # Check if expected phrase appears in output
+        if expected:
+            if output.contains(expected):
+                result["status"] = "passed"
+            else:
+                result["status"] = "failed"
+                result["reason"] = f"Expected '{expected}' not found in output"
+        else:
+            # Edge case - just check it didn't crash
+            if returncode == 0 or output.sentences:
+                result["status"] = "passed"
+            else:
+                result["status"] = "failed"
+                result["reason"] = "Program crashed or no output"
+        
+        return result
+    
+    def _execute_test(self, test_case):
+        """Run a single test case through test_pinyin"""
         prefix = test_case['prefix']
         pinyin = test_case['pinyin']
-        expected = test_case.get('expected_contains')
-        description = test_case['description']
         
         # Prepare input: prefix + pinyin + select first candidate (0) + quit
         input_str = f"{prefix}\n{pinyin}\n0\nquit\n"
         
         try:
-            # Run the program with timeout
-            process = subprocess.Popen(
-                [self.program_path],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='utf-8'
-            )
-            
-            stdout, stderr = process.communicate(input=input_str, timeout=10)
-            
-            # Check results
-            result = {
-                "id": test_id,
-                "description": description,
-                "prefix": prefix,
-                "pinyin": pinyin,
-                "status": "unknown",
-                "output": stdout,
-                "error": stderr
-            }
-            
-            # Check if expected phrase appears in output
-            if expected:
-                if expected in stdout:
-                    result["status"] = "passed"
-                    self.results["passed"] += 1
-                else:
-                    result["status"] = "failed"
-                    result["reason"] = f"Expected '{expected}' not found in output"
-                    self.results["failed"] += 1
+            if self.use_session:
+                self._drop_stale_session()
+                if self.session is None:
+                    self.session = PinyinSession(self.program_path, timeout=10, cwd=self.cwd,
+                                                 args=self.test_pinyin_args(), protocol=self.protocol)
+                outcome = self.session.run_case(prefix, pinyin, [0])
+                stdout, stderr, returncode = outcome.stdout, outcome.stderr, outcome.returncode
+                timings = outcome.timings
             else:
-                # Edge case - just check it didn't crash
-                if process.returncode == 0 or "sentence:" in stdout:
-                    result["status"] = "passed"
-                    self.results["passed"] += 1
-                else:
-                    result["status"] = "failed"
-                    result["reason"] = "Program crashed or no output"
-                    self.results["failed"] += 1
+                # Run the program with timeout
+                process = subprocess.Popen(
+                    self.command(),
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    encoding='utf-8',
+                    cwd=self.cwd
+                )
+                
+                stdout, stderr = process.communicate(input=input_str, timeout=10)
+                returncode = process.returncode
+                # One-shot runs only get the total duration
+                timings = None
             
-            self.results["details"].append(result)
+            result = self.evaluate(test_case, stdout, stderr, returncode)
+            if timings is not None:
+                result["timings"] = timings
             return result
             
         except subprocess.TimeoutExpired:
-            process.kill()
-            result = {
-                "id": test_id,
-                "description": description,
-                "prefix": prefix,
-                "pinyin": pinyin,
-                "status": "error",
-                "reason": "Timeout (>10s)"
-            }
-            self.results["errors"] += 1
-            self.results["details"].append(result)
-            return result
+            # The session restarts its own hung process
+            if not self.use_session:
+                process.kill()
+            return self.error_result(test_case, "Timeout (>10s)")
             
         except Exception as e:
-            result = {
-                "id": test_id,
-                "description": description,
-                "prefix": prefix,
-                "pinyin": pinyin,
-                "status": "error",
-                "reason": str(e)
-            }
+            return self.error_result(test_case, str(e))
+    
+    def error_result(self, test_case, reason):
+        """Result for a case the harness could not run to the end"""
+        return {
+            "id": test_case['id'],
+            "description": test_case['description'],
+            "prefix": test_case['prefix'],
+            "pinyin": test_case['pinyin'],
+            "status": "error",
+            "reason": reason
+        }
+    
+    def _record_result(self, result):
+        """Count a finished test case and keep its details"""
+        if result["status"] == "passed":
+            self.results["passed"] += 1
+        elif result["status"] == "failed":
+            self.results["failed"] += 1
+        else:
             self.results["errors"] += 1
+        if result.get("cached"):
+            self.results["cached"] += 1
+        if self.retention is not None:
+            self.retention.apply(result)
+        if self.stream is not None:
+            self.stream.write(result)
+        else:
             self.results["details"].append(result)
-            return result
     
-    def run_all_tests(self):
-        """Run all test cases"""
+    def run_all_tests(self, jobs=1):
+        """Run all test cases, on jobs worker processes if jobs > 1"""
         test_cases = self.load_test_cases()
+        if self.shard is not None:
+            test_cases = self.shard.select(test_cases)
+            self.results["shard"] = str(self.shard)
+            print(f"Shard {self.shard}: {len(test_cases)} case(s)")
         self.results["total"] = len(test_cases)
         self.results["start_time"] = datetime.now().isoformat()
+        if self.cache is not None:
+            self.results["cached"] = 0
+        if self.stream is not None:
+            self.stream.write_start(self.results["start_time"], self.results["total"])
         
         print(f"Running {len(test_cases)} test cases...")
         print("=" * 70)
         
-        for i, test_case in enumerate(test_cases, 1):
-            result = self.run_single_test(test_case)
+        if self.batch:
+            results = run_batch(self, test_cases)
+        elif self.engine == "native":
+            results = run_native(self, test_cases)
+        elif jobs > 1:
+            results = run_parallel(self, test_cases, jobs)
+        else:
+            results = (run_throttled(self, test_case) for test_case in test_cases)
+        
+        for i, result in enumerate(results, 1):
+            self._record_result(result)
             
             # Print progress
             status_symbol = {
@@ -137,19 +239,27 @@ class TestRunner:
             # Print details for failures
             if result["status"] in ["failed", "error"]:
                 print(f"         Reason: {result.get('reason', 'Unknown')}")
-            
-            # Small delay to avoid overwhelming the system
-            time.sleep(0.05)
+        
+        self._drop_stale_session()
+        if self.session is not None:
+            self.session.close()
+            self.session = None
         
         self.results["end_time"] = datetime.now().isoformat()
+        if self.stream is not None:
+            self.stream.write_summary(self.results)
         
         # Print summary
         print("=" * 70)
         print("\nTest Summary:")
         print(f"  Total:  {self.results['total']}")
-        print(f"  Passed: {self.results['passed']} ({self.results['passed']/self.results['total']*100:.1f}%)")
-        print(f"  Failed: {self.results['failed']} ({self.results['failed']/self.results['total']*100:.1f}%)")
-        print(f"  Errors: {self.results['errors']} ({self.results['errors']/self.results['total']*100:.1f}%)")
+        # An empty shard or query still gets a summary
+        total = self.results['total'] or 1
+        print(f"  Passed: {self.results['passed']} ({self.results['passed']/total*100:.1f}%)")
+        print(f"  Failed: {self.results['failed']} ({self.results['failed']/total*100:.1f}%)")
+        print(f"  Errors: {self.results['errors']} ({self.results['errors']/total*100:.1f}%)")
+        if self.cache is not None:
+            print(f"  Cached: {self.results['cached']} (re-ran {self.results['total'] - self.results['cached']})")
         
         # Calculate duration
         start = datetime.fromisoformat(self.results["start_time"])
@@ -161,13 +271,18 @@ class TestRunner:
     
     def save_results(self, filename="test_results.json"):
         """Save test results to JSON file"""
+        if self.stream is not None:
+            # Everything is already on disk; rebuild with result_stream.py
+            self.stream.close()
+            print(f"\nDetailed results streamed to {self.stream.path}")
+            return
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(self.results, f, ensure_ascii=False, indent=2)
         print(f"\nDetailed results saved to {filename}")
     
     def print_failures(self):
         """Print detailed information about failures"""
-        failures = [d for d in self.results["details"] if d["status"] != "passed"]
+        failures = [d for d in self.iter_details() if d["status"] != "passed"]
         
         if not failures:
             print("\n🎉 All tests passed!")
@@ -184,32 +299,70 @@ class TestRunner:
             print(f"    Pinyin: {fail['pinyin']}")
             print(f"    Reason: {fail.get('reason', 'Unknown')}")
             
-            if fail.get('output'):
+            output = get_output(fail)
+            if output:
                 # Show last few lines of output
-                output_lines = fail['output'].strip().split('\n')
+                output_lines = output.strip().split('\n')
                 print(f"    Output (last 3 lines):")
                 for line in output_lines[-3:]:
                     print(f"      {line}")
 
 if __name__ == "__main__":
-    # Check if program exists
+    import argparse
     import os
-    if not os.path.exists("./test_pinyin"):
+    
+    parser = argparse.ArgumentParser(description="Run test_pinyin test cases")
+    parser.add_argument("--tests", default="test_cases.json", metavar="FILE",
+                        help="suite to run, .json or .jsonl (default: test_cases.json)")
+    parser.add_argument("--session", action="store_true",
+                        help="reuse one test_pinyin process for all cases")
+    add_common_args(parser)
+    add_retention_args(parser)
+    parser.add_argument("--no-cache", action="store_true",
+                        help="run every case and leave the result cache alone")
+    parser.add_argument("--refresh", action="store_true",
+                        help="run every case and overwrite its cache entry")
+    parser.add_argument("--cache-dir", default=".test_cache",
+                        help="where cached results and user-file snapshots live")
+    args = parser.parse_args()
+    shard = check_common_args(parser, args)
+    if args.session and (args.batch or args.engine == "native"):
+        parser.error("--session keeps one test_pinyin process for the cases; drop --batch/--engine native")
+    if args.session and args.isolate == "case":
+        parser.error("--isolate case restarts test_pinyin after every case, which defeats --session; "
+                     "use --isolate suite")
+    
+    # Check if program exists
+    if args.engine == "process" and not os.path.exists("./test_pinyin"):
         print("Error: test_pinyin program not found!")
         print("Please run 'make' first to build the program.")
         sys.exit(1)
     
     # Check if test cases exist
-    if not os.path.exists("test_cases.json"):
+    if not args.db and not os.path.exists(args.tests):
         print("Generating test cases...")
         import subprocess
-        subprocess.run(["python3", "generate_tests.py"])
+        generate = ["python3", "generate_tests.py", "-o", args.tests]
+        if args.tests.endswith(".jsonl"):
+            generate.append("--jsonl")
+        subprocess.run(generate)
     
     # Run tests
-    runner = TestRunner()
-    results = runner.run_all_tests()
+    runner = TestRunner(test_file=args.tests, use_session=args.session)
+    configure_runner(runner, args, shard)
+    # --batch and --engine native run cases without run_single_test, so a cache would never be consulted
+    if not args.no_cache and not args.batch and args.engine != "native":
+        runner.cache = ResultCache(args.cache_dir, runner.program_path, refresh=args.refresh)
+    finish_isolation = isolate(runner, args.isolate, args.snapshot_store)
+    try:
+        results = runner.run_all_tests(jobs=args.jobs)
+    finally:
+        finish_isolation()
     runner.save_results()
+    if runner.store is not None:
+        runner.store.record_results(runner.suite, runner.iter_details())
     runner.print_failures()
+    print_latency(runner.iter_details())
     
     # Exit with appropriate code
     if results["failed"] > 0 or results["errors"] > 0:
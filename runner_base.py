@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+What the test runners share
+RunnerBase holds the settings every runner drives test_pinyin with and
+builds its command line from them. add_common_args and friends register
+the matching command-line options, check_common_args rejects combinations
+that cannot work, and configure_runner copies the options onto a runner.
+Options only one runner has (--session, --async, the result cache) stay
+in that runner.
+"""
+
+import sys
+
+from native_engine import parse_save_policy
+from protocol import PROTOCOLS, protocol_args
+from rate_limiter import AdaptiveThrottle
+from result_retention import RetentionPolicy, RETAIN_MODES, COMPRESSIONS
+from result_stream import ResultStreamWriter, read_results
+from sharding import Shard, parse_shard, load_durations
+from suite_file import load_test_cases
+from test_store import parse_query, use_store
+from user_state import ISOLATE_MODES, SNAPSHOT_STORES
+
+
+class RunnerBase:
+    # The runner's suite in the test store, see test_store.SUITES
+    suite = None
+
+    def __init__(self, program_path, test_file):
+        self.program_path = program_path
+        self.test_file = test_file
+        # Working directory for test_pinyin; parallel workers use private copies
+        self.cwd = None
+        # Optional AdaptiveThrottle; None runs cases back to back
+        self.throttle = None
+        # Optional ResultStreamWriter; when set, details are not kept in memory
+        self.stream = None
+        # Optional Shard; only its share of the suite is run
+        self.shard = None
+        # test_pinyin output protocol, see protocol.py
+        self.protocol = "text"
+        # Run the whole suite in one test_pinyin --batch process, see batch.py
+        self.batch = False
+        # Pass --read-only: nothing is learned or written to data/
+        self.read_only = False
+        # Pass --window=N: test_pinyin decodes long input N syllables at a time (0 = all at once)
+        self.window = 0
+        # Pass --lazy-sentence: test_pinyin only re-guesses the sentence when it is read
+        self.lazy_sentence = False
+        # test_pinyin --save-policy; the native engine applies it itself
+        self.save_policy = "every:1"
+        # "native" runs cases in-process through pinyin_binding, see native_engine.py
+        self.engine = "process"
+        # Optional user_state.CaseIsolation restoring data/ after every case
+        self.isolation = None
+        # Optional test_store.TestStore; cases then come from store_query instead of test_file
+        self.store = None
+        self.store_query = ""
+        # Optional RetentionPolicy trimming/compressing stored output
+        self.retention = None
+
+    def test_pinyin_args(self):
+        """test_pinyin options for this runner's settings, except --protocol, which sessions add themselves"""
+        args = []
+        if self.read_only:
+            args.append("--read-only")
+        if self.window:
+            args.append(f"--window={self.window}")
+        if self.lazy_sentence:
+            args.append("--lazy-sentence")
+        if self.save_policy != "every:1":
+            args.append(f"--save-policy={self.save_policy}")
+        return args
+
+    def command(self):
+        """test_pinyin command line for this runner's settings"""
+        return [self.program_path] + protocol_args(self.protocol) + self.test_pinyin_args()
+
+    def load_test_cases(self):
+        """Load test cases from a JSON or JSONL file, or from the test store"""
+        if self.store is not None:
+            return list(self.store.query(self.store_query, suite=self.suite))
+        return load_test_cases(self.test_file)
+
+    def error_result(self, test_case, reason):
+        """Result for a case the harness could not run to the end (timeout, crash)"""
+        raise NotImplementedError
+
+    def iter_details(self):
+        """Yield every recorded result, reading back the stream if there is one"""
+        if self.stream is not None:
+            self.stream.flush()
+            yield from read_results(self.stream.path)
+        else:
+            yield from self.results["details"]
+
+
+def add_common_args(parser):
+    """Options every runner takes"""
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="worker processes, each with its own copy of data/")
+    parser.add_argument("--throttle", action="store_true",
+                        help="back off between cases when latency or load average degrades")
+    parser.add_argument("--stream", metavar="JSONL",
+                        help="write each result to a JSON-lines file as it finishes instead of keeping it in memory")
+    parser.add_argument("--protocol", choices=PROTOCOLS, default="text",
+                        help="have test_pinyin print JSON-lines events instead of text")
+    parser.add_argument("--batch", action="store_true",
+                        help="run the whole suite inside one test_pinyin --batch process (implies --protocol jsonl)")
+    parser.add_argument("--read-only", action="store_true",
+                        help="have test_pinyin skip all learning and saving; --jobs workers then share data/")
+    parser.add_argument("--window", type=int, default=0, metavar="SYLLABLES",
+                        help="have test_pinyin decode input longer than this many syllables in overlapping windows")
+    parser.add_argument("--lazy-sentence", action="store_true",
+                        help="have test_pinyin guess the sentence after a selection only when it is next read")
+    parser.add_argument("--save-policy", default="every:1", metavar="POLICY",
+                        help="when test_pinyin writes the user tables: every:N sentences, interval:SECONDS, "
+                             "idle:SECONDS or shutdown")
+    parser.add_argument("--engine", choices=("process", "native"), default="process",
+                        help="native runs cases inside this process through pinyin_binding.py "
+                             "(needs libpinyin_shim.so; implies --protocol jsonl)")
+    parser.add_argument("--isolate", choices=ISOLATE_MODES, default="none",
+                        help="put data/'s user files back after every case, or once after the whole suite")
+    parser.add_argument("--snapshot-store", choices=SNAPSHOT_STORES, default="memory",
+                        help="keep --isolate snapshots in memory or as reflinked/copied files next to data/")
+    parser.add_argument("--shard", metavar="I/N",
+                        help="run only shard I of N (1-based), e.g. 2/4")
+    parser.add_argument("--durations", metavar="RESULTS",
+                        help="results file of an earlier run; shards are balanced by its case durations")
+    parser.add_argument("--db", metavar="SQLITE",
+                        help="take cases from a test_store.py database instead of the JSON suite")
+    parser.add_argument("--query", default="", metavar="TERMS",
+                        help="test_store.py query selecting the cases to run, e.g. \"prefix=* length>=10\" (needs --db)")
+
+
+def add_retention_args(parser):
+    """Options for how much of each passing case's output is stored"""
+    parser.add_argument("--retain", choices=RETAIN_MODES, default="full",
+                        help="output kept for passing cases: everything, a tail, or only a hash")
+    parser.add_argument("--tail-lines", type=int, default=5,
+                        help="lines of output kept with --retain tail")
+    parser.add_argument("--compress", choices=COMPRESSIONS,
+                        help="compress stored output (zstd needs the zstandard package)")
+
+
+def add_checkpoint_args(parser):
+    """Options for checkpointing and resuming a run"""
+    parser.add_argument("--checkpoint-every", type=int, default=10, metavar="N",
+                        help="checkpoint progress and data/ every N cases (0 disables checkpoints; off with --jobs)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its last checkpoint")
+
+
+def check_common_args(parser, args):
+    """Reject unusable combinations of the shared options; returns the Shard to run, or None"""
+    try:
+        parse_save_policy(args.save_policy)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.query and not args.db:
+        parser.error("--query selects cases from a --db store")
+    try:
+        parse_query(args.query)
+    except ValueError as e:
+        parser.error(str(e))
+    shard = None
+    if args.shard:
+        try:
+            shard = Shard(*parse_shard(args.shard),
+                          durations=load_durations(args.durations) if args.durations else None)
+        except ValueError as e:
+            parser.error(str(e))
+    resume = getattr(args, "resume", False)
+    if args.batch and (args.jobs > 1 or resume):
+        parser.error("--batch runs every case in one process; drop --jobs/--resume")
+    if args.jobs > 1 and resume:
+        parser.error("--resume restores the shared data/, not the --jobs workers' copies; drop --jobs")
+    if args.engine == "native" and (args.batch or args.jobs > 1):
+        parser.error("--engine native runs every case in this process; drop --batch/--jobs")
+    if getattr(args, "tail_lines", 1) < 1:
+        parser.error("--tail-lines must be at least 1")
+    if args.window < 0:
+        parser.error("--window must be at least 0")
+    if (args.window or args.lazy_sentence) and args.engine == "native":
+        parser.error("--window and --lazy-sentence are test_pinyin options; drop --engine native")
+    if (args.batch or args.engine == "native") and args.isolate == "case":
+        parser.error("--isolate case needs a process per case; use --isolate suite")
+    return shard
+
+
+def configure_runner(runner, args, shard):
+    """Copy the shared options onto runner; exits if --query matches no cases"""
+    if args.throttle:
+        runner.throttle = AdaptiveThrottle()
+    runner.shard = shard
+    runner.protocol = "jsonl" if args.batch or args.engine == "native" else args.protocol
+    runner.batch = args.batch
+    runner.read_only = args.read_only
+    runner.window = args.window
+    runner.lazy_sentence = args.lazy_sentence
+    runner.save_policy = args.save_policy
+    runner.engine = args.engine
+    if args.db:
+        try:
+            use_store(runner, args.db, args.query, suite=runner.suite)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    if args.stream:
+        runner.stream = ResultStreamWriter(args.stream, append=getattr(args, "resume", False))
+    if getattr(args, "retain", "full") != "full" or getattr(args, "compress", None):
+        runner.retention = RetentionPolicy(args.retain, args.tail_lines, args.compress)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Deterministic sharding of test suites across machines
+Every node loads the same suite and keeps only its own shard, so no
+coordination is needed. Without timing history the cases are ordered by
+sha1(case id) and dealt round-robin, so shard sizes differ by at most one
+and no shard is empty while N <= the number of cases. Given a results file from an earlier run, cases are
+balanced by their recorded duration instead (longest first, each to the
+least loaded shard). Every node must then be handed the same results file.
+"""
+
+import hashlib
+import json
+
+from result_stream import read_results
+
+
+def case_key(test_case):
+    """Stable identity of a case: its id, or test_number for multi-round suites"""
+    if "id" in test_case:
+        return str(test_case["id"])
+    return str(test_case["test_number"])
+
+
+def stable_hash(key):
+    return int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+def parse_shard(text):
+    """Parse 'i/N' (1-based) into (i, N)"""
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/N, got '{text}'")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Shard {text} is out of range (need 1 <= i <= N)")
+    return index, count
+
+
+def load_durations(path):
+    """
+    Map case key -> duration (seconds) from a results file
+    Accepts a results JSON, a multi-round results list or a --stream file.
+    Cache hits are skipped since they say nothing about the real cost.
+    """
+    if path.endswith(".jsonl"):
+        details = read_results(path)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        details = data if isinstance(data, list) else data.get("details", [])
+
+    durations = {}
+    for detail in details:
+        if "duration" in detail and not detail.get("cached"):
+            durations[case_key(detail)] = detail["duration"]
+    return durations
+
+
+class Shard:
+    def __init__(self, index, count, durations=None):
+        self.index = index
+        self.count = count
+        self.durations = durations or {}
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def _assign(self, test_cases):
+        """Shard number (0-based) for every case, in test_cases order"""
+        keys = [case_key(test_case) for test_case in test_cases]
+        if not self.durations:
+            # Plain hash mod N leaves small suites with empty shards
+            assignment = [0] * len(keys)
+            order = sorted(range(len(keys)), key=lambda i: (stable_hash(keys[i]), keys[i]))
+            for position, i in enumerate(order):
+                assignment[i] = position % self.count
+            return assignment
+
+        # Cases without history are assumed to cost the median known duration
+        known = sorted(self.durations[key] for key in keys if key in self.durations)
+        default = known[len(known) // 2] if known else 1.0
+        costs = [self.durations.get(key, default) for key in keys]
+
+        loads = [0.0] * self.count
+        assignment = [0] * len(keys)
+        order = sorted(range(len(keys)), key=lambda i: (-costs[i], stable_hash(keys[i])))
+        for i in order:
+            shard = min(range(self.count), key=lambda s: (loads[s], s))
+            loads[shard] += costs[i]
+            assignment[i] = shard
+        return assignment
+
+    def select(self, test_cases):
+        """Keep this shard's cases, in their original order"""
+        assignment = self._assign(test_cases)
+        return [test_case for test_case, shard in zip(test_cases, assignment)
+                if shard == self.index - 1]
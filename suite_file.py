@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reading and writing test suite files
+A suite is either a JSON list of cases (what the generators have always
+written) or JSON Lines, one case per line. JSONL suites can be written and
+read one case at a time, so a generator can stream millions of cases
+without holding them in memory.
+"""
+
+import json
+
+
+def iter_test_cases(path):
+    """Yield the cases of a .json or .jsonl suite"""
+    if not path.endswith(".jsonl"):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def load_test_cases(path):
+    """Load a .json or .jsonl suite as a list"""
+    return list(iter_test_cases(path))
+
+
+def write_jsonl(test_cases, path):
+    """Write test_cases (any iterable) one per line; returns how many were written"""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for test_case in test_cases:
+            f.write(json.dumps(test_case, ensure_ascii=False) + "\n")
+            count += 1
+    return count
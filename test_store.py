@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite store for all test suites
+Every suite (test_cases.json, long_sentence_tests.json,
+multi_selection_tests.json, multi_round_tests.json, or any .jsonl suite) is
+imported into one table, a row per case, with the columns the runners
+filter on pulled out and indexed. Runners given --db take their cases from
+a query instead of loading a whole file, and record each case's status
+after the run, so "what failed last time" is a query too.
+
+Queries are space separated terms, all of which must hold:
+
+  suite=multi_selection   basic, long, multi_selection or multi_round
+  category=Long           description category, as in the latency report
+  prefix=我们  prefix=*  prefix=    that prefix, any prefix, no prefix
+  length>=10              characters of the expected sentence
+  steps>=3                selections (multi-selection) or rounds (multi-round)
+  status=failed           last recorded status; "failing" means failed or error
+
+Usage:
+  python3 test_store.py import tests.db test_cases.json multi_selection_tests.json ...
+  python3 test_store.py results tests.db test_results.json [--suite basic]
+  python3 test_store.py query tests.db "suite=multi_selection prefix=* steps>=3" [-o slice.json]
+  python3 test_store.py stats tests.db
+"""
+
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from latency import description_category
+from merge_results import load_results
+from sharding import case_key
+from suite_file import iter_test_cases
+
+SUITES = ("basic", "long", "multi_selection", "multi_round")
+
+# Default suite of the repo's suite and result files
+SUITE_FILES = {
+    "test_cases.json": "basic",
+    "long_sentence_tests.json": "long",
+    "multi_selection_tests.json": "multi_selection",
+    "multi_round_tests.json": "multi_round",
+    "test_results.json": "basic",
+    "long_test_results.json": "long",
+    "multi_selection_results.json": "multi_selection",
+    "multi_round_results.json": "multi_round",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    suite TEXT NOT NULL,
+    case_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    category TEXT,
+    prefix TEXT NOT NULL,
+    has_prefix INTEGER NOT NULL,
+    length INTEGER,
+    steps INTEGER NOT NULL,
+    status TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (suite, case_key)
+);
+CREATE INDEX IF NOT EXISTS cases_position ON cases (suite, position);
+CREATE INDEX IF NOT EXISTS cases_category ON cases (category, length);
+CREATE INDEX IF NOT EXISTS cases_prefix ON cases (prefix);
+CREATE INDEX IF NOT EXISTS cases_steps ON cases (steps, has_prefix);
+CREATE INDEX IF NOT EXISTS cases_length ON cases (length);
+CREATE INDEX IF NOT EXISTS cases_status ON cases (status) WHERE status IS NOT NULL;
+"""
+
+TERM_RE = re.compile(r"^(suite|category|prefix|length|steps|status)(<=|>=|=|<|>)(.*)$")
+NUMERIC = ("length", "steps")
+
+
+def suite_of(test_case):
+    """Which suite a case belongs to, from its shape"""
+    if "rounds" in test_case:
+        return "multi_round"
+    if "selections" in test_case:
+        return "multi_selection"
+    if "full_sentence" in test_case:
+        return "long"
+    return "basic"
+
+
+def case_length(test_case):
+    """Characters of the sentence the case expects, or None if it expects nothing"""
+    if "rounds" in test_case:
+        return sum(len(round_data.get("expected") or "") for round_data in test_case["rounds"])
+    expected = (test_case.get("full_sentence") or test_case.get("final_sentence")
+                or test_case.get("expected_contains"))
+    return len(expected) if expected else None
+
+
+def case_steps(test_case):
+    if "rounds" in test_case:
+        return len(test_case["rounds"])
+    if "selections" in test_case:
+        return len(test_case["selections"])
+    return 1
+
+
+def parse_query(text):
+    """Turn a query into (SQL condition, parameters)"""
+    conditions = []
+    params = []
+    for term in (text or "").replace(",", " ").split():
+        if term == "failing":
+            conditions.append("status IN ('failed', 'error')")
+            continue
+        match = TERM_RE.match(term)
+        if not match:
+            raise ValueError(f"bad query term '{term}'")
+        field, op, value = match.groups()
+        if field in NUMERIC:
+            if not value.isdigit():
+                raise ValueError(f"'{field}' needs a number: '{term}'")
+            conditions.append(f"{field} {op} ?")
+            params.append(int(value))
+        elif op != "=":
+            raise ValueError(f"'{field}' only supports '=': '{term}'")
+        elif field == "prefix" and value in ("*", ""):
+            conditions.append("has_prefix = ?")
+            params.append(1 if value == "*" else 0)
+        elif field == "suite" and value not in SUITES:
+            raise ValueError(f"unknown suite '{value}' (choose from {', '.join(SUITES)})")
+        else:
+            conditions.append(f"{field} = ?")
+            params.append(value)
+    return " AND ".join(conditions) or "1", params
+
+
+class TestStore:
+    def __init__(self, path="tests.db"):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def import_suite(self, path, suite=None):
+        """Add (or replace) the cases of a suite file; returns how many were imported"""
+        def rows():
+            for position, test_case in enumerate(iter_test_cases(path)):
+                kind = suite or suite_of(test_case)
+                if kind == "multi_round":
+                    # Numbered the way MultiRoundTestRunner numbers them
+                    test_case.setdefault("test_number", position + 1)
+                prefix = test_case.get("prefix") or ""
+                yield (kind, case_key(test_case), position, description_category(test_case) or kind,
+                       prefix, 1 if prefix else 0, case_length(test_case), case_steps(test_case),
+                       json.dumps(test_case, ensure_ascii=False))
+
+        before = self.db.total_changes
+        with self.db:
+            # A re-imported case keeps its last status
+            self.db.executemany(
+                "INSERT INTO cases (suite, case_key, position, category, prefix, has_prefix, length, steps, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (suite, case_key) DO UPDATE SET position = excluded.position, "
+                "category = excluded.category, prefix = excluded.prefix, has_prefix = excluded.has_prefix, "
+                "length = excluded.length, steps = excluded.steps, data = excluded.data",
+                rows())
+            # Fresh statistics, so the planner picks the most selective index
+            self.db.execute("ANALYZE")
+        return self.db.total_changes - before
+
+    def record_results(self, suite, details):
+        """Store each detail's status ('passed', 'failed' or 'error') on its case"""
+        def rows():
+            for detail in details:
+                status = detail.get("status")
+                if status is None:
+                    # Multi-round details only say passed or not
+                    status = "passed" if detail.get("passed") else "failed"
+                yield status, suite, case_key(detail)
+
+        before = self.db.total_changes
+        with self.db:
+            self.db.executemany("UPDATE cases SET status = ? WHERE suite = ? AND case_key = ?", rows())
+        return self.db.total_changes - before
+
+    def query(self, text="", suite=None):
+        """Yield the cases matching query text (and suite, if given), in suite order"""
+        condition, params = parse_query(text)
+        # With a filter, sorting the matches beats walking every row in position order
+        order = "+suite, +position" if params or condition != "1" else "suite, position"
+        if suite is not None:
+            condition += " AND suite = ?"
+            params.append(suite)
+        cursor = self.db.execute(f"SELECT data FROM cases WHERE {condition} ORDER BY {order}", params)
+        for (data,) in cursor:
+            yield json.loads(data)
+
+    def count(self, text="", suite=None):
+        condition, params = parse_query(text)
+        if suite is not None:
+            condition += " AND suite = ?"
+            params.append(suite)
+        return self.db.execute(f"SELECT COUNT(*) FROM cases WHERE {condition}", params).fetchone()[0]
+
+    def stats(self):
+        """(suite, cases, failed or error) rows"""
+        return self.db.execute(
+            "SELECT suite, COUNT(*), SUM(status IN ('failed', 'error')) FROM cases GROUP BY suite ORDER BY suite"
+        ).fetchall()
+
+
+def use_store(runner, db_path, query="", suite=None):
+    """Have runner take its cases from the store at db_path instead of its suite file"""
+    store = TestStore(db_path)
+    if not store.count(query, suite):
+        store.close()
+        raise ValueError(f"No {suite + ' ' if suite else ''}cases in {db_path} match '{query}'")
+    runner.store = store
+    runner.store_query = query
+    # Checkpoints are only valid for the same selection
+    runner.test_file = f"{db_path}?{query}"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SQLite store for test_pinyin test suites")
+    parser.add_argument("command", choices=("import", "results", "query", "stats"))
+    parser.add_argument("db", help="SQLite database file (created if missing)")
+    parser.add_argument("args", nargs="*",
+                        help="import/results: suite or result files; query: the query")
+    parser.add_argument("--suite", choices=SUITES,
+                        help="suite of the imported files (default: from the file name, else the case shape)")
+    parser.add_argument("-o", "--output", help="query: write the matching cases to this .json/.jsonl suite")
+    args = parser.parse_args()
+    store = TestStore(args.db)
+
+    if args.command == "import":
+        for path in args.args:
+            started = time.monotonic()
+            count = store.import_suite(path, args.suite or SUITE_FILES.get(os.path.basename(path)))
+            print(f"Imported {count} cases from {path} in {time.monotonic() - started:.2f}s")
+    elif args.command == "results":
+        for path in args.args:
+            suite = args.suite or SUITE_FILES.get(os.path.basename(path))
+            if suite is None:
+                parser.error(f"cannot tell which suite {path} belongs to; pass --suite")
+            results, _ = load_results(path)
+            count = store.record_results(suite, results["details"])
+            print(f"Recorded {count} {suite} statuses from {path}")
+    elif args.command == "query":
+        text = " ".join(args.args)
+        try:
+            started = time.monotonic()
+            cases = list(store.query(text))
+        except ValueError as e:
+            parser.error(str(e))
+        elapsed = time.monotonic() - started
+        if args.output:
+            from suite_file import write_jsonl
+            if args.output.endswith(".jsonl"):
+                write_jsonl(cases, args.output)
+            else:
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    json.dump(cases, f, ensure_ascii=False, indent=2)
+            print(f"Saved to {args.output}")
+        else:
+            for test_case in cases:
+                print(json.dumps(test_case, ensure_ascii=False))
+        print(f"{len(cases)} case(s) in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    else:
+        print(f"{'suite':<18}{'cases':>10}{'failing':>10}")
+        for suite, count, failing in store.stats():
+            print(f"{suite:<18}{count:>10}{failing or 0:>10}")
+    store.close()
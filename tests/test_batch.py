@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""run_batch() round trip against a stand-in for test_pinyin --batch"""
+
+import json
+import os
+import stat
+import sys
+import tempfile
+
+import run_tests
+from batch import run_batch
+
+# Answers every case with its "answer" field, in the record format main.cpp's
+# run_batch() prints, and exits 3 on a case marked "crash"
+FAKE_BATCH = """#!{python}
+import json
+import sys
+
+arguments = sys.argv[1:]
+assert arguments[:2] == ["--protocol=jsonl", "--batch"], arguments
+with open(arguments[2], encoding="utf-8") as f:
+    cases = [json.loads(line) for line in f if line.strip()]
+print("Loading data...")
+for index, case in enumerate(cases):
+    if case.get("crash"):
+        print("partial output", file=sys.stderr)
+        sys.exit(3)
+    events = [{{"event": "selected", "index": 0, "string": case["answer"], "sentence": case["answer"]}}]
+    print(json.dumps({{"index": index, "id": case["id"], "complete": True,
+                      "duration": 0.25, "events": events}}, ensure_ascii=False))
+"""
+
+
+def make_runner(tmp_path):
+    program = tmp_path / "fake_test_pinyin"
+    program.write_text(FAKE_BATCH.format(python=sys.executable))
+    program.chmod(program.stat().st_mode | stat.S_IXUSR)
+    runner = run_tests.TestRunner(program_path=str(program))
+    runner.protocol = "jsonl"
+    runner.batch = True
+    return runner
+
+
+def case(case_id, answer, expected, **extra):
+    return {"id": case_id, "description": f"case {case_id}", "prefix": "", "pinyin": "zhongguo",
+            "expected_contains": expected, "answer": answer, **extra}
+
+
+def test_round_trip(tmp_path):
+    runner = make_runner(tmp_path)
+    cases = [case(1, "中国", "中国"), case(2, "中间", "中国"), case(3, 'say "引号" \\ 反斜杠', "引号")]
+    results = list(run_batch(runner, cases))
+    assert [result["id"] for result in results] == [1, 2, 3]
+    assert [result["status"] for result in results] == ["passed", "failed", "passed"]
+    assert all(result["duration"] == 0.25 for result in results)
+    # Events come back as the jsonl output evaluate() parsed
+    assert json.loads(results[2]["output"])["sentence"] == 'say "引号" \\ 反斜杠'
+
+
+def test_cases_after_a_crash_are_reported(tmp_path):
+    runner = make_runner(tmp_path)
+    cases = [case(1, "中国", "中国"), case(2, "中国", "中国", crash=True), case(3, "中国", "中国")]
+    results = list(run_batch(runner, cases))
+    assert [result["id"] for result in results] == [1, 2, 3]
+    assert results[0]["status"] == "passed"
+    for result in results[1:]:
+        assert result["status"] == "failed"
+        assert "exited with 3 before this case" in result["output"]
+        assert "partial output" in result["error"]
+
+
+def test_batch_file_is_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    runner = make_runner(tmp_path)
+    list(run_batch(runner, [case(1, "中国", "中国")]))
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("batch_")]
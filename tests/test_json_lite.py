@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""json_lite.h string parsing, through a small driver compiled with g++"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Prints the parsed string's bytes, or the parse error on stderr
+DRIVER = r"""
+#include <iostream>
+#include <iterator>
+#include "json_lite.h"
+
+int main()
+{
+    const std::string input((std::istreambuf_iterator<char>(std::cin)), std::istreambuf_iterator<char>());
+    try {
+        std::cout << json_lite::parse(input).text;
+    }
+    catch(const std::exception& e){
+        std::cerr << e.what();
+        return 1;
+    }
+    return 0;
+}
+"""
+
+
+@pytest.fixture(scope="module")
+def driver(tmp_path_factory):
+    compiler = shutil.which("g++")
+    if compiler is None:
+        pytest.skip("g++ not found")
+    directory = tmp_path_factory.mktemp("json_lite")
+    source = directory / "driver.cpp"
+    source.write_text(DRIVER)
+    program = str(directory / "driver")
+    subprocess.run([compiler, "-std=c++17", "-I", REPO, str(source), "-o", program], check=True)
+    return program
+
+
+def parse_string(driver, literal):
+    """(ok, decoded text or error message) for a JSON string literal"""
+    completed = subprocess.run([driver], input=literal.encode("utf-8"), capture_output=True)
+    if completed.returncode != 0:
+        return False, completed.stderr.decode("utf-8")
+    return True, completed.stdout.decode("utf-8")
+
+
+def test_simple_escapes(driver):
+    assert parse_string(driver, r'"a\"b\\c\/d\b\f\n\r\t"') == (True, 'a"b\\c/d\b\f\n\r\t')
+
+
+def test_unicode_escapes(driver):
+    assert parse_string(driver, r'"\u0041\u00e9\u4E2D"') == (True, "Aé中")
+
+
+def test_surrogate_pair(driver):
+    assert parse_string(driver, r'"x\ud83d\ude00y"') == (True, "x\U0001F600y")
+
+
+def test_utf8_passes_through(driver):
+    assert parse_string(driver, '"中国人民"') == (True, "中国人民")
+
+
+def test_lone_high_surrogate(driver):
+    ok, message = parse_string(driver, r'"\ud83d"')
+    assert not ok and "unpaired high surrogate" in message
+    ok, message = parse_string(driver, r'"\ud83dx"')
+    assert not ok and "unpaired high surrogate" in message
+
+
+def test_high_surrogate_followed_by_non_low_surrogate(driver):
+    ok, message = parse_string(driver, r'"\ud83d\u0041"')
+    assert not ok and "invalid low surrogate" in message
+    ok, message = parse_string(driver, r'"\ud83d\ud83d"')
+    assert not ok and "invalid low surrogate" in message
+
+
+def test_lone_low_surrogate(driver):
+    ok, message = parse_string(driver, r'"\ude00"')
+    assert not ok and "unpaired low surrogate" in message
+
+
+def test_bad_escapes(driver):
+    assert not parse_string(driver, r'"\x"')[0]
+    assert not parse_string(driver, r'"\u12"')[0]
+    assert not parse_string(driver, r'"\u12g4"')[0]
+    assert not parse_string(driver, '"unterminated')[0]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""parse_output() on text and jsonl transcripts of the same run"""
+
+import json
+
+from protocol import EventOutput, TextOutput, parse_output
+
+TEXT_TRANSCRIPT = """prefix(Chinese):pinyin:0:中国(7)\t1:中(2)\t
+choose:generated_sentence:中国
+0:人民(7)\t
+choose:generated_sentence:中国人民
+Phrase '中国人民很好' too long (6 chars, max 5). Not added to dictionary.
+prefix(Chinese):
+"""
+
+
+def jsonl(*events):
+    return "\n".join(json.dumps(event, ensure_ascii=False, separators=(",", ":")) for event in events) + "\n"
+
+
+JSONL_TRANSCRIPT = jsonl(
+    {"event": "prompt", "prompt": "prefix:"},
+    {"event": "candidates", "start": 0, "total": 2, "candidates": [
+        {"index": 0, "string": "中国", "type": 1, "type_name": "NORMAL_CANDIDATE"},
+        {"index": 1, "string": "中", "type": 1, "type_name": "NORMAL_CANDIDATE"}]},
+    {"event": "selected", "index": 0, "string": "中国", "type": 1, "type_name": "NORMAL_CANDIDATE",
+     "start": 2, "sentence": "中国"},
+    {"event": "candidates", "start": 2, "total": 1, "candidates": [
+        {"index": 0, "string": "人民", "type": 1, "type_name": "NORMAL_CANDIDATE"}]},
+    {"event": "selected", "index": 0, "string": "人民", "type": 1, "type_name": "NORMAL_CANDIDATE",
+     "start": 6, "sentence": "中国人民"},
+    {"event": "phrase_skipped", "phrase": "中国人民很好", "reason": "too_long", "length": 6, "max": 5},
+    {"event": "error", "message": "Invalid candidate index 9 (valid: 0-0)"},
+)
+
+
+def test_protocol_selects_reader():
+    assert isinstance(parse_output("", "text"), TextOutput)
+    assert isinstance(parse_output("", "jsonl"), EventOutput)
+    assert isinstance(parse_output(""), TextOutput)
+
+
+def test_text_transcript():
+    output = parse_output(TEXT_TRANSCRIPT, "text")
+    assert output.sentences == ["中国", "中国人民"]
+    assert output.final_sentence == "中国人民"
+    assert output.too_long
+    assert output.contains("人民")
+    assert not output.contains("你好")
+
+
+def test_jsonl_transcript():
+    output = parse_output(JSONL_TRANSCRIPT, "jsonl")
+    assert output.sentences == ["中国", "中国人民"]
+    assert output.final_sentence == "中国人民"
+    assert output.too_long
+    assert output.errors == ["Invalid candidate index 9 (valid: 0-0)"]
+    assert [len(candidates) for candidates in output.candidates] == [2, 1]
+
+
+def test_jsonl_contains_looks_at_sentences_and_candidates_only():
+    output = parse_output(JSONL_TRANSCRIPT, "jsonl")
+    assert output.contains("国人")
+    assert output.contains("中")
+    # Only in an event's other fields
+    assert not output.contains("NORMAL_CANDIDATE")
+    assert not output.contains("很好")
+
+
+def test_jsonl_skips_noise_and_partial_lines():
+    stdout = "Loading data...\n" + JSONL_TRANSCRIPT + '{"event":"selected","sent'
+    output = parse_output(stdout, "jsonl")
+    assert output.sentences == ["中国", "中国人民"]
+
+
+def test_empty_output():
+    for protocol in ("text", "jsonl"):
+        output = parse_output(None, protocol)
+        assert output.sentences == []
+        assert output.final_sentence is None
+        assert not output.too_long
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Snapshots of the learned user state in data/
+Only the user files (see data_files.py) change at run time, and they are
+small next to the system dictionaries, so a snapshot holds just those:
+in memory by default, or on disk next to data/ where they are reflinked
+(FICLONE) if the filesystem supports it and copied otherwise. Hardlinks are
+not an option because libpinyin updates user_bigram.db in place, which would
+write straight through into the snapshot.
+
+Restoring skips files that are still exactly what the snapshot last wrote
+(same inode, size and mtime), so putting back the state after a case that
+saved nothing costs a few stat() calls.
+"""
+
+import os
+import shutil
+import tempfile
+
+import data_files
+
+ISOLATE_MODES = ("none", "case", "suite")
+SNAPSHOT_STORES = ("memory", "disk")
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class UserStateSnapshot:
+    """The user files of one data directory at one moment"""
+
+    def __init__(self, data_dir="data", store="memory"):
+        self.data_dir = os.path.abspath(data_dir)
+        self.store = store
+        # name -> bytes (memory) or path of the snapshot copy (disk)
+        self._files = {}
+        # name -> _signature() of data_dir's file right after it last matched the snapshot
+        self._written = {}
+        self._directory = None
+        self.capture()
+
+    def capture(self):
+        """(Re)take the snapshot from data_dir"""
+        self.discard()
+        if self.store == "disk":
+            # Same filesystem as data/, so reflinks work
+            self._directory = tempfile.mkdtemp(prefix=".user_state_", dir=os.path.dirname(self.data_dir))
+        for name in data_files.list_files(self.data_dir):
+            path = os.path.join(self.data_dir, name)
+            if self._directory is not None:
+                stored = os.path.join(self._directory, name)
+                data_files.clone_file(path, stored)
+                self._files[name] = stored
+            else:
+                with open(path, 'rb') as f:
+                    self._files[name] = f.read()
+            self._written[name] = _signature(path)
+
+    def restore(self):
+        """Put data_dir's user files back into the snapshotted state"""
+        for name in data_files.list_files(self.data_dir):
+            if name not in self._files:
+                os.remove(os.path.join(self.data_dir, name))
+        for name, stored in self._files.items():
+            path = os.path.join(self.data_dir, name)
+            if _signature(path) == self._written.get(name):
+                continue
+            if self._directory is not None:
+                data_files.clone_file(stored, path)
+            else:
+                with open(path, 'wb') as f:
+                    f.write(stored)
+            self._written[name] = _signature(path)
+
+    def discard(self):
+        """Drop the snapshot (and its on-disk copy)"""
+        self._files = {}
+        self._written = {}
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+
+class CaseIsolation:
+    """
+    Give every case the user state the run started with
+    The baseline is taken just before the first case a process runs (so each
+    --jobs worker snapshots its own fresh copy) and put back after every case.
+    Between cases data/ therefore always holds the baseline, which also keeps
+    checkpoints and result-cache keys independent of case order.
+    """
+
+    def __init__(self, store="memory"):
+        self.store = store
+        self._snapshot = None
+
+    def close(self):
+        if self._snapshot is not None:
+            self._snapshot.discard()
+            self._snapshot = None
+
+    def before_case(self, runner):
+        if self._snapshot is None:
+            self._snapshot = UserStateSnapshot(os.path.join(runner.cwd or ".", "data"), self.store)
+
+    def after_case(self, runner):
+        # A live session would write its learned state over the restored files on exit
+        if getattr(runner, "session", None) is not None:
+            runner.session.close()
+            runner.session = None
+        self._snapshot.restore()
+
+
+def isolate(runner, mode, store="memory"):
+    """
+    Set up --isolate for runner before its run
+    Returns a function to call once the run is over: it drops the case
+    snapshot and, for "suite", puts data/ back the way the suite found it.
+    """
+    suite_state = None
+    if mode == "case":
+        runner.isolation = CaseIsolation(store)
+    elif mode == "suite":
+        suite_state = UserStateSnapshot(os.path.join(runner.cwd or ".", "data"), store)
+
+    def finish():
+        if runner.isolation is not None:
+            runner.isolation.close()
+        if suite_state is not None:
+            suite_state.restore()
+            suite_state.discard()
+    return finish